@@ -0,0 +1,77 @@
+"""bag_of_words.py.
+
+Builds `bag_of_words` dicts of token counts from lists of tokens.
+
+Stray punctuation is stripped from the whole token stream in a single pass:
+the tokens are joined with a null character, one compiled regular expression
+is applied to the joined string, and the result is split on the null
+character again. The pattern never matches the separator, so each token is
+cleaned exactly as it would be on its own. If a token contains the separator,
+the tokens are cleaned one at a time instead. The tokens are counted with
+`Counter`.
+
+Bags are not sorted when they are built. Call `sort_bag()` to sort a bag
+naturally (with `natsort`) just before it is saved.
+
+Sample Usage:
+
+```python
+bag = bag_of_words(tokens)
+doc['bag_of_words'] = sort_bag(bag)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import re
+from collections import Counter
+
+# Constants
+SEPARATOR = '\x00'
+# An attempt to strip predictably meaningless stray punctuation from a single token
+PUNCT_RE = re.compile(r'\.\W|\W\.|^[\!\?\(\),;:\[\]\{\}]|[\!\?\(\),;:\[\]\{\}]$')
+# The same pattern applied to tokens joined with SEPARATOR: `\W` excludes the separator,
+# and `^` and `$` match at the start and end of each token
+STREAM_PUNCT_RE = re.compile(r'\.[^\w\x00]|[^\w\x00]\.|(?:\A|(?<=\x00))[\!\?\(\),;:\[\]\{\}]'
+                             r'|[\!\?\(\),;:\[\]\{\}](?=\n?(?:\x00|\Z))')
+NONWORD_RE = re.compile(r'\W+')
+STREAM_NONWORD_RE = re.compile(r'[^\w\x00]+')
+
+def joinable(tokens):
+    """Return True if a list of tokens can be cleaned as a single string."""
+    return all(isinstance(token, str) for token in tokens) and SEPARATOR not in ''.join(tokens)
+
+def strip_punct(tokens):
+    """Return a list of tokens with stray leading, trailing and attached punctuation removed."""
+    tokens = list(tokens)
+    if len(tokens) == 0:
+        return tokens
+    if not joinable(tokens):
+        return [PUNCT_RE.sub('', token) for token in tokens]
+    return STREAM_PUNCT_RE.sub('', SEPARATOR.join(tokens)).split(SEPARATOR)
+
+def word_tokens(content):
+    """Split a string on white space and remove all non-word characters from each token.
+
+    Tokens which only contain non-word characters are kept as empty strings.
+    """
+    tokens = content.split()
+    if len(tokens) == 0 or SEPARATOR in content:
+        return [NONWORD_RE.sub('', token) for token in tokens]
+    return STREAM_NONWORD_RE.sub('', SEPARATOR.join(tokens)).split(SEPARATOR)
+
+def bag_of_words(tokens, trim_punct=True):
+    """Convert a list of tokens to an unsorted dict of token frequencies.
+
+    Parameters:
+    - trim_punct (Bool): If True, strips attached punctuation that may have survived tokenisation.
+    """
+    if trim_punct:
+        tokens = strip_punct(tokens)
+    return dict(Counter(tokens))
+
+def sort_bag(bag):
+    """Return a bag of words sorted naturally by token."""
+    from natsort import natsorted
+    return dict(natsorted(bag.items()))
@@ -27,6 +27,8 @@ import numpy as np
 import qgrid
 from IPython.display import display, HTML
 
+from compact_features import read_features
+
 grid_options = {
     # SlickGrid options
     'fullWidthRows': True,
@@ -183,7 +185,7 @@ def docs_by_search_term(json_dir, content_field, required_phrase, set_stopwords,
                     # lower case the content field
                     lower_text = json_content.lower()
                 if content_field == 'features':
-                    features = [feature[0] for feature in json_decoded['features']]
+                    features = [feature[0] for feature in read_features(json_decoded['features'])]
                     json_content = ' '
                     json_content = json_content.join(features)
                     lower_text = json_content.lower()
@@ -357,7 +359,7 @@ def frequency_single_file(fpath, content_field, set_stopwords, punctuations, set
             return finder_freq, freq
     if content_field == 'features':
         try:
-            features = [feature[0] for feature in json_decoded['features']]
+            features = [feature[0] for feature in read_features(json_decoded['features'])]
             json_content = ' '
             json_content = json_content.join(features)
         except KeyError:
@@ -427,7 +429,7 @@ def frequency_dir(json_dir, content_field, set_stopwords, punctuations, set_leng
                     continue
                 try:
                     if content_field == 'features':
-                        features = [feature[0] for feature in json_decoded['features']]
+                        features = [feature[0] for feature in read_features(json_decoded['features'])]
                         json_content = ' '
                         json_content = json_content.join(features)
                 except KeyError:
@@ -547,7 +549,7 @@ def tfidf_dir(json_dir, content_field, set_stopwords, punctuations, set_length,
                 if content_field == 'content':
                     json_content = json_decoded['content']
                 if content_field == 'features':
-                    features = [feature[0] for feature in json_decoded['features']]
+                    features = [feature[0] for feature in read_features(json_decoded['features'])]
                     json_content = ' '
                     json_content = json_content.join(features)
                 if content_field == 'bag_of_words':
@@ -21,6 +21,8 @@ import shutil
 from IPython.display import display, HTML
 from zipfile import ZipFile
 
+from compact_features import feature_values
+
 def year_from_fpath(file):
     """Return the publication year of a document.
 
@@ -128,7 +130,7 @@ def dfrb_metadata(metadata_dir, metadata_csv_file, browser_meta_file_temp,
                         j['length'] = len(j['bag_of_words'])
                     except KeyError:
                         try:
-                            tokens = [feature[0] for feature in j['features'][1:]]
+                            tokens = feature_values(j['features'], 'token')
                             j['length'] = len(tokens)
                         except KeyError:
                             j['length'] = len(j['content'].split())
@@ -13,6 +13,8 @@ from pathlib import Path
 from zipfile import ZipFile
 import pandas as pd
 
+from compact_features import CompactFeatures, is_compact
+
 def clear_txt(txt_dir, ext='txt', metafile=None, zipfile=None):
     """Remove txt files from dir (and optionally, metafile and zipfile)
     Metafile and zipfile are deleted if path is given, ignored in bad path or None.
@@ -63,12 +65,37 @@ def debag(bag_of_words, join_token=' '):
     result = join_token.join(words)
     return result
 
-def export_features_tables(save_path, json_dir):
+def filter_features_table(features, include_pos=None, include_tags=None, exclude_entity_types=None):
+    """Return a features table with a header row, keeping only tokens which pass the filters.
+
+    Compact features tables are filtered on their integer columns before the rows are decoded.
+
+    Parameters:
+        features (list or dict): A features table as a list of lists or in the compact format.
+        include_pos (list): Parts of speech to keep. If None, all are kept.
+        include_tags (list): Tags to keep. If None, all are kept.
+        exclude_entity_types (list): Entity types to remove.
+    """
+    if is_compact(features):
+        compact = CompactFeatures(features)
+        return compact.table(compact.filter(include_pos, include_tags, exclude_entity_types))
+    if exclude_entity_types is None:
+        exclude_entity_types = []
+    rows = [row for row in features[1:]
+            if (include_pos is None or row[3] in include_pos)
+            and (include_tags is None or row[4] in include_tags)
+            and row[6][1] not in exclude_entity_types]
+    return [features[0]] + rows
+
+def export_features_tables(save_path, json_dir, include_pos=None, include_tags=None, exclude_entity_types=None):
     """Export features tables to a CSV file.
     
     Parameters:
-        features (list): A list of lists.
-        filepath (str): A path where the CSV file will be saved.
+        save_path (str): A directory where the CSV files will be saved.
+        json_dir (str): Path string of source JSON files.
+        include_pos (list): Parts of speech to export. If None, all are exported.
+        include_tags (list): Tags to export. If None, all are exported.
+        exclude_entity_types (list): Entity types to leave out.
     """
     errors = []
     if os.path.isdir(save_path) == False:
@@ -83,7 +110,8 @@ def export_features_tables(save_path, json_dir):
             try:
                 with open(os.path.join(json_dir, file), 'r') as f:
                     doc = json.loads(f.read())
-                df = pd.DataFrame.from_records(doc['features'][1:], columns=doc['features'][0])
+                features = filter_features_table(doc['features'], include_pos, include_tags, exclude_entity_types)
+                df = pd.DataFrame.from_records(features[1:], columns=features[0])
                 df.to_csv(savepath, index=False)
             except IOError:
                 errors.append(file)
@@ -92,7 +120,7 @@ def export_features_tables(save_path, json_dir):
             for error in errors:
                 f.write(error)
         msg = '<p style="color: red;">' + str(len(errors)) + ' file(s) could not be saved. '
-        msg += 'Your features table(s) may be in the wrong format, which should be a list of lists. '
+        msg += 'Your features table(s) may be in the wrong format, which should be a list of lists or a compact features table. '
         msg += 'Please consule the <code>error_log.txt</code> file for names of files that could not be saved.</p>'
         display(HTML(msg))
 
@@ -0,0 +1,124 @@
+"""bulk_writer.py.
+
+Writes manifests to a MongoDB collection in batches on a background thread,
+so that reading and normalising source files overlaps with database writes.
+
+Documents are accumulated into batches of `batch_size` and each batch is
+sent with an unordered `insert_many()` call, so a failed document does not
+prevent the rest of its batch from being inserted. The filename (or other
+`key`) of each document that could not be inserted is appended to an error
+list, which is normally the importer's `errors['database_error']` list. If
+`insert_many()` raises any other exception, such as `InvalidDocument` for a
+value that cannot be encoded, the whole batch is recorded as failed and the
+exception is kept in `exceptions`, so the writer thread keeps consuming the
+queue and `write()` and `close()` never block on it.
+
+The writer only uses the `insert_many()` method of the collection, so it can
+be used with a `mongomock` collection or any object that behaves like one.
+
+Sample Usage:
+
+```python
+with BulkWriter(collection, batch_size=1000, errors=errors['database_error']) as writer:
+    for doc in docs:
+        writer.write(doc)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import queue
+import threading
+from pymongo.errors import BulkWriteError
+
+class BulkWriter():
+    """Insert documents into a MongoDB collection in batches on a background thread."""
+
+    def __init__(self, collection, batch_size=1000, errors=None, key='filename', max_queued_batches=4):
+        """Initialise the writer.
+
+        Parameters:
+        - collection (Collection): The collection to insert documents into.
+        - batch_size (int): The number of documents in each `insert_many()` call.
+        - errors (list): A list to which the keys of failed documents are appended.
+        - key (str): The document field used to identify failed documents.
+        - max_queued_batches (int): The number of batches that can wait for the writer thread before `write()` blocks.
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.errors = errors if errors is not None else []
+        self.key = key
+        self.batch = []
+        self.inserted_count = 0
+        self.exceptions = []
+        self.queue = queue.Queue(maxsize=max_queued_batches)
+        self.thread = None
+
+    def __enter__(self):
+        """Start the writer thread."""
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flush the remaining documents and stop the writer thread."""
+        self.close()
+
+    def open(self):
+        """Start the writer thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def write(self, doc):
+        """Add a document to the current batch, queueing the batch when it is full."""
+        if self.thread is None:
+            self.open()
+        self.batch.append(doc)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Queue the current batch for insertion."""
+        if len(self.batch) > 0:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def close(self):
+        """Insert any remaining documents and wait for the writer thread to finish."""
+        if self.thread is not None:
+            self.flush()
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """Insert queued batches until the writer is closed."""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            self.insert(batch)
+
+    def insert(self, batch):
+        """Insert a batch and record the documents that could not be inserted."""
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            self.inserted_count += len(result.inserted_ids)
+        except BulkWriteError as e:
+            failed = [error['index'] for error in e.details.get('writeErrors', [])]
+            self.inserted_count += e.details.get('nInserted', len(batch) - len(failed))
+            for i in failed:
+                self.errors.append(self.doc_key(batch[i]))
+        except Exception as e:
+            # Record the whole batch, so that an unexpected error does not stop the writer thread
+            self.exceptions.append(e)
+            for doc in batch:
+                self.errors.append(self.doc_key(doc))
+
+    def doc_key(self, doc):
+        """Return the key of a document as a string for the error list."""
+        try:
+            return str(doc.get(self.key))
+        except AttributeError:
+            return str(doc)
@@ -0,0 +1,140 @@
+"""date_normalizer.py.
+
+Converts publication dates to the WE1S `'%Y-%m-%dT%H:%M:%SZ'` format
+without calling `dateparser` for every document.
+
+Most collections use only a handful of date formats. The `DateNormalizer`
+parses the first `sample_size` distinct values with `dateparser` and records
+which of a list of candidate `strptime` formats give exactly the same result.
+Formats that ever disagree with `dateparser` are discarded. After the sample
+has been seen, values are parsed with the learned formats, in order of
+frequency, and `dateparser` is only used as a fallback. Results are cached,
+so repeated raw date strings are not parsed again. The cache keeps the
+`cache_size` most recently used values, so sources with a unique timestamp
+for every document do not make it grow with the size of the collection.
+
+Sample Usage:
+
+```python
+date_normalizer = DateNormalizer()
+doc['pub_date'] = date_normalizer.normalize(doc['pub_date'])
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import dateparser
+from collections import OrderedDict
+from datetime import datetime
+
+# Constants
+OUTPUT_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Day-first numeric formats are deliberately omitted because they are
+# ambiguous with the month-first formats preferred by dateparser.
+CANDIDATE_FORMATS = [
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%B %d, %Y',
+    '%b %d, %Y',
+    '%d %B %Y',
+    '%d %b %Y',
+    '%A, %B %d, %Y',
+    '%B %d, %Y %A',
+]
+
+class DateNormalizer():
+    """Learn the dominant date formats in a collection and normalise dates."""
+
+    def __init__(self, output_format=OUTPUT_FORMAT, sample_size=100, formats=None, cache_size=10000):
+        """Initialise the object.
+
+        Parameters:
+        - output_format (str): The `strftime` format of normalised dates.
+        - sample_size (int): The number of distinct values to check against `dateparser` before using the fast path.
+        - formats (list): The candidate `strptime` formats. Defaults to `CANDIDATE_FORMATS`.
+        - cache_size (int): The maximum number of raw values whose results are cached. The least recently used values are evicted first.
+        """
+        self.output_format = output_format
+        self.sample_size = sample_size
+        self.candidates = list(formats or CANDIDATE_FORMATS)
+        self.format_counts = {fmt: 0 for fmt in self.candidates}
+        self.formats = [] # Learned formats in order of frequency
+        self.sampled = 0
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # raw string -> normalised string, least recently used first
+        self.fallback_count = 0
+
+    def learn(self, values):
+        """Check a sample of raw date values against `dateparser` and update the learned formats."""
+        for value in values:
+            value = str(value)
+            if value not in self.cache:
+                self.remember(value, self.format(self.sample(value)))
+
+    def normalize(self, value):
+        """Return a raw date value in the output format.
+
+        Raises a ValueError if the date cannot be parsed.
+        """
+        value = str(value)
+        try:
+            result = self.cache[value]
+            self.cache.move_to_end(value)
+            return result
+        except KeyError:
+            pass
+        if self.sampled < self.sample_size:
+            pub_date = self.sample(value)
+        else:
+            pub_date = self.parse(value)
+        result = self.format(pub_date)
+        self.remember(value, result)
+        return result
+
+    def format(self, pub_date):
+        """Format a datetime, raising a ValueError if it is None."""
+        if pub_date is None:
+            raise ValueError('Could not parse the date.')
+        return pub_date.strftime(self.output_format)
+
+    def parse(self, value):
+        """Parse a value with the learned formats, falling back to `dateparser`."""
+        for fmt in self.formats:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        self.fallback_count += 1
+        return dateparser.parse(value)
+
+    def remember(self, value, result):
+        """Cache the result for a raw value, evicting the least recently used value if the cache is full."""
+        self.cache[value] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def sample(self, value):
+        """Parse a value with `dateparser` and record which candidate formats agree with it."""
+        pub_date = dateparser.parse(value)
+        self.sampled += 1
+        for fmt in list(self.candidates):
+            try:
+                candidate = datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+            if pub_date is not None and candidate == pub_date:
+                self.format_counts[fmt] += 1
+            else:
+                # Never use a format which disagrees with dateparser
+                self.candidates.remove(fmt)
+                del self.format_counts[fmt]
+        self.formats = sorted((fmt for fmt, count in self.format_counts.items() if count > 0),
+                              key=lambda fmt: -self.format_counts[fmt])
+        return pub_date
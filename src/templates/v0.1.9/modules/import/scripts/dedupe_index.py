@@ -0,0 +1,182 @@
+"""dedupe_index.py.
+
+Maintains a side-car hash index for a project's json directory so that
+duplicate manifests can be detected as they are written, rather than by
+re-hashing and comparing the whole directory after every import.
+
+The index is saved as a tab-separated `_dedupe_index.tsv` file inside the
+json directory. Each row contains a filename, its size in bytes, its
+modification time in nanoseconds, the hash of its content, and a flag
+(1 or 0) indicating whether the content is empty. Manifests themselves
+are never modified. When the index is synchronised with the directory,
+only files which are new or whose size or modification time has changed
+are read.
+
+Sample Usage:
+
+```python
+index = DedupeIndex(json_dir)
+index.sync(n_process=4)
+index.add('doc1.json', doc['content'])
+...
+index.save()
+print(index.duplicate_pairs())
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import csv
+import hashlib
+import json
+import os
+import re
+from multiprocessing import Pool
+
+# Constants
+INDEX_FILENAME = '_dedupe_index.tsv'
+ALNUM_REGEX = re.compile(r'[^\W_]+')
+
+def content_hash(content):
+    """Hash the lower-cased alphanumeric bag of words in a content string.
+
+    Returns None if the content is empty.
+    """
+    if content is None or content == '':
+        return None
+    tokens = sorted(ALNUM_REGEX.findall(content.lower()))
+    return hashlib.md5(' '.join(tokens).encode('utf-8')).hexdigest()
+
+def hash_json_file(filepath):
+    """Return a (filename, size, mtime, hash) tuple for a json file.
+
+    The hash is None if the file has no content and the tuple is None
+    if the file cannot be read.
+    """
+    try:
+        stat = os.stat(filepath)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = json.load(f).get('content')
+    except (IOError, ValueError, AttributeError):
+        return None
+    return os.path.basename(filepath), stat.st_size, stat.st_mtime_ns, content_hash(content)
+
+class DedupeIndex():
+    """Track content hashes for the json files in a directory."""
+
+    def __init__(self, json_dir):
+        """Initialise the index and load any existing index file."""
+        self.json_dir = json_dir
+        self.index_file = os.path.join(json_dir, INDEX_FILENAME)
+        self.files = {} # filename -> (size, mtime, hash)
+        self.hashes = {} # hash -> first filename with that hash
+        self.errors = [] # Files which could not be read
+        self.load()
+
+    def add(self, filename, content):
+        """Hash a manifest's content and add it to the index.
+
+        Returns True if the manifest duplicates a file already in the index.
+        """
+        return self.add_hash(filename, content_hash(content))
+
+    def add_hash(self, filename, hash, size=None, mtime=None):
+        """Add a precomputed content hash to the index.
+
+        A hash of None marks the manifest as having empty content. If the size and
+        modification time are not supplied, they are read from the file. Returns True
+        if the manifest duplicates a file already in the index.
+        """
+        if size is None or mtime is None:
+            stat = os.stat(os.path.join(self.json_dir, filename))
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        self.remove(filename)
+        self.files[filename] = (size, mtime, hash)
+        if hash is None:
+            return False
+        if hash in self.hashes:
+            return True
+        self.hashes[hash] = filename
+        return False
+
+    def duplicate_pairs(self):
+        """Return a list of [original filepath, duplicate filepath] pairs.
+
+        The original is the first filename, in sorted order, with a given hash.
+        """
+        groups = {}
+        for filename, (_, _, hash) in sorted(self.files.items()):
+            if hash is not None:
+                groups.setdefault(hash, []).append(filename)
+        pairs = []
+        for filenames in groups.values():
+            original = os.path.join(self.json_dir, filenames[0])
+            for filename in filenames[1:]:
+                pairs.append([original, os.path.join(self.json_dir, filename)])
+        return pairs
+
+    def empty_files(self):
+        """Return a sorted list of filenames with empty content."""
+        return sorted(filename for filename, (_, _, hash) in self.files.items() if hash is None)
+
+    def load(self):
+        """Load the index file, dropping entries for files that no longer exist."""
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for row in csv.reader(f, dialect='excel-tab'):
+                    if len(row) != 5 or not os.path.exists(os.path.join(self.json_dir, row[0])):
+                        continue
+                    hash = row[3] if row[4] == '0' else None
+                    self.files[row[0]] = (int(row[1]), int(row[2]), hash)
+                    if hash is not None:
+                        self.hashes.setdefault(hash, row[0])
+
+    def sync(self, n_process=1):
+        """Bring the index up to date with the json files in the directory.
+
+        Entries for deleted files are removed, and only new files or files whose size
+        or modification time has changed are read and hashed, optionally across a pool
+        of `n_process` worker processes.
+        """
+        current = {}
+        for entry in os.scandir(self.json_dir):
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        for filename in [filename for filename in self.files if filename not in current]:
+            self.remove(filename)
+        changed = sorted(os.path.join(self.json_dir, filename) for filename, (size, mtime) in current.items()
+                         if filename not in self.files or self.files[filename][0:2] != (size, mtime))
+        if n_process is not None and n_process > 1 and len(changed) > 1:
+            with Pool(n_process) as pool:
+                results = pool.map(hash_json_file, changed, chunksize=max(1, len(changed) // (n_process * 4)))
+        else:
+            results = [hash_json_file(filepath) for filepath in changed]
+        for filepath, result in zip(changed, results):
+            if result is None:
+                self.errors.append(filepath)
+            else:
+                filename, size, mtime, hash = result
+                self.add_hash(filename, hash, size, mtime)
+
+    def remove(self, filename):
+        """Remove a filename from the index."""
+        entry = self.files.pop(filename, None)
+        if entry is not None and self.hashes.get(entry[2]) == filename:
+            del self.hashes[entry[2]]
+            # Promote another file with the same hash, if there is one
+            for other, (_, _, other_hash) in self.files.items():
+                if other_hash == entry[2]:
+                    self.hashes[entry[2]] = other
+                    break
+
+    def save(self):
+        """Write the index to the side-car file."""
+        with open(self.index_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect='excel-tab')
+            for filename, (size, mtime, hash) in sorted(self.files.items()):
+                if hash is None:
+                    writer.writerow([filename, size, mtime, '', 1])
+                else:
+                    writer.writerow([filename, size, mtime, hash, 0])
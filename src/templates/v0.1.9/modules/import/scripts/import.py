@@ -4,29 +4,33 @@ Imports a collection of plain text files to a project directory or database.
 
 For use with `import-2.0.0.ipynb` or the command line.
 When using in a jupyter notebook, initialise with `environment='jupyter'`.
+Progress is reported with a progress bar in Jupyter and as a percentage on the
+console. Pass `reporter='silent'` (or a `Reporter` object) to change this, for
+instance when running the import from a scheduled job.
 
 Last update: 2021-02-15
 """
 
 # Python imports
 import csv
-import dateparser
+import hashlib
 import json
 import os
 import random
 import shutil
-import ipywidgets
 import pandas as pd
 import pymongo
 import re
 import sys
+import time
 import zipfile
 from chardet import detect
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datapackage import DataPackageException, Package
 from datetime import datetime
 from ftfy import fix_text
 from IPython.display import clear_output, display, HTML
-from ipywidgets import HBox, IntProgress, Label
+from multiprocessing import Pool
 from pathlib import Path
 from pymongo import errors, MongoClient
 
@@ -35,78 +39,125 @@ from bson import Binary, json_util
 from bson.objectid import ObjectId
 JSON_UTIL = json_util.default
 
+from bulk_writer import BulkWriter
+from date_normalizer import DateNormalizer
+from dedupe_index import DedupeIndex, content_hash
+from import_journal import ImportJournal
+from minhash import near_duplicate_pairs
+from phrase_filter import PhraseFilter
+from progress import get_reporter
 from timer import Timer
 
 # Constants
+DETECT_SAMPLE_BYTES = 65536 # Number of bytes used to detect a file's encoding
 LINEBREAK_REGEX = re.compile(r'((\r\n)|[\n\v])+')
 NONBREAKING_SPACE_REGEX = re.compile(r'(?!\n)\s+')
-IntProgress(
-    description='Importing...'
-)
 
 # Import deduping libraries
 sys.path.insert(0, '/home/jovyan/utils/preprocessing')
-from libs.fuzzyhasher.fuzzyhasher import FuzzyHasher
 from libs.deduper.deduper import LinkFilter
 
-# Create FuzzyHasher and LinkFilter objects
-fhr =  FuzzyHasher(source_field='content', prefilter='baggify, lower_alnum')
+# Create LinkFilter object
 lf = LinkFilter()
 
+# Create the date normaliser shared by the import functions in this process
+date_normalizer = DateNormalizer()
+
 # Setup message
-def display_setup_message():
+def display_setup_message(reporter=None):
     """Display a message when the setup is complete."""
-    display(HTML('<p>Setup complete.</p>'))
-    msg = '<p>Use the <strong>Configuration</strong> cell below to configure your job, then skip to either <strong>Prepare Workspace for File Import</strong> or <strong>Import from MongoDB</strong> section as appropriate for your data source.</p>'
-    display(HTML(msg))
+    reporter = get_reporter(reporter)
+    reporter.message('Setup complete.')
+    reporter.message('Use the Configuration cell below to configure your job, then skip to either the Prepare Workspace for File Import or the Import from MongoDB section as appropriate for your data source.')
 
 # Deduping Functions
-def deduplicate(json_dir):
+def deduplicate(json_dir, n_process=1, near_duplicate_threshold=None, reporter=None):
     """Remove duplicates data files from the workflow.
-    
-    `add_new` and `update_old` can be disabled if data consists of prehashed json files
-    in order to create a more efficient process. This is documented in the module
-    README file, but there is not setting in the notebook in order to reduce the
-    complexity of notebook configurations.
+
+    Content hashes are kept in a side-car index file in the json directory
+    (see `dedupe_index.py`), so only new or changed files are read. The
+    manifests themselves are not modified. Set `n_process` to hash new files
+    across several worker processes.
+
+    If `near_duplicate_threshold` is set (e.g. 0.8), documents whose estimated
+    similarity is at least the threshold are also treated as duplicates
+    (see `minhash.py`). Messages are shown with `reporter` ('jupyter',
+    'console', 'silent' or a `Reporter` object).
     """
-    # Configurations for hashing function
-    add_new = True
-    update_old = True
-    # Rename files with empty content fields
-    rename_contentless_files(json_dir)
-    # Deduplicate
+    reporter = get_reporter(reporter)
     try:
-        hash_jsons(json_dir, add_new, update_old)
-        results = fhr.compare_files_in_dir(json_dir)
-        result_list = [[str(item) for item in row] for row in results]
-        if result_list:
-            display(HTML('<p style="color: red;">Duplicate pair matches found: ' + str(len(result_list)) + '</p>'))
-            with open(os.path.join(json_dir,'_duplicates.txt'), 'w') as dupefile:
-                writer = csv.writer(dupefile, dialect='excel-tab')
-                for result in result_list:
-                    writer.writerow(result)
-            # Create delete list
-            lf.links = result_list
-            deletes_list = lf.filter_nodes(source='components', filter='remove')
-            # Update deletes file
-            with open(os.path.join(json_dir, '_deletes.txt'), 'w') as delfile:
-                for item in deletes_list:
-                    delfile.write('%s\n' % item)
-            # Remove deletes by renaming
-            with open(os.path.join(json_dir, '_deletes.txt'), 'r') as delfile:
-                for dfname in delfile:
-                    newfname = dfname.rstrip().replace('.json', '.dupe')
-                    os.rename(dfname.rstrip(), newfname)
-        else:
-            display(HTML('<p style="color: green;">No duplicates found.</p>'))
-    except (json.decoder.JSONDecodeError, KeyError, PermissionError, ValueError) as err:
-        display(HTML('<p style="color: red;">Error: ' + str(err) + '.</p>'))
+        index = hash_jsons(json_dir, n_process, reporter)
+        remove_indexed_duplicates(index, near_duplicate_threshold, n_process, reporter)
+    except (KeyError, PermissionError, ValueError) as err:
+        reporter.message('Error: ' + str(err) + '.', 'red')
 
-def hash_jsons(json_dir, add_new, update_old):
-    """Hash the jsons for deduping."""
-    for file in os.listdir(json_dir):
-        if file.endswith('.json'):
-            fhr.add_hash_to_json_file(os.path.join(json_dir, file), add_new=add_new, update_old=update_old)
+def hash_jsons(json_dir, n_process=1, reporter=None):
+    """Hash the jsons for deduping and return the updated DedupeIndex."""
+    reporter = get_reporter(reporter)
+    index = DedupeIndex(json_dir)
+    index.sync(n_process=n_process)
+    for filepath in index.errors:
+        reporter.message('Error: Could not read ' + os.path.basename(filepath) + '.', 'red')
+    return index
+
+def remove_duplicates(json_dir, result_list, reporter=None):
+    """Write the duplicates and deletes files and rename deleted files to `.dupe`.
+
+    Returns the list of deleted filepaths.
+    """
+    reporter = get_reporter(reporter)
+    deletes_list = []
+    if result_list:
+        reporter.message('Duplicate pair matches found: ' + str(len(result_list)), 'red')
+        with open(os.path.join(json_dir,'_duplicates.txt'), 'w') as dupefile:
+            writer = csv.writer(dupefile, dialect='excel-tab')
+            for result in result_list:
+                writer.writerow(result)
+        # Create delete list
+        lf.links = result_list
+        deletes_list = lf.filter_nodes(source='components', filter='remove')
+        # Update deletes file
+        with open(os.path.join(json_dir, '_deletes.txt'), 'w') as delfile:
+            for item in deletes_list:
+                delfile.write('%s\n' % item)
+        # Remove deletes by renaming
+        with open(os.path.join(json_dir, '_deletes.txt'), 'r') as delfile:
+            for dfname in delfile:
+                newfname = dfname.rstrip().replace('.json', '.dupe')
+                os.rename(dfname.rstrip(), newfname)
+    else:
+        reporter.message('No duplicates found.', 'green')
+    return deletes_list
+
+def remove_indexed_duplicates(index, near_duplicate_threshold=None, n_process=1, reporter=None):
+    """Remove the empty and duplicate files recorded in a DedupeIndex.
+
+    Files with empty content fields are renamed to `.empty` and duplicates are
+    written to `_duplicates.txt` and `_deletes.txt` and renamed to `.dupe`.
+    If `near_duplicate_threshold` is set, near-duplicates of the remaining
+    files are detected with MinHash signatures and removed in the same pass.
+    """
+    reporter = get_reporter(reporter)
+    json_dir = index.json_dir
+    # Rename files with empty content fields
+    for filename in index.empty_files():
+        filepath = os.path.join(json_dir, filename)
+        os.rename(filepath, filepath.replace('.json', '.empty'))
+        index.remove(filename)
+    try:
+        pairs = index.duplicate_pairs()
+        if near_duplicate_threshold is not None:
+            # Only the first file with each exact hash needs to be compared
+            exact_duplicates = set(pair[1] for pair in pairs)
+            filepaths = [os.path.join(json_dir, filename) for filename in sorted(index.files)]
+            filepaths = [filepath for filepath in filepaths if filepath not in exact_duplicates]
+            pairs += near_duplicate_pairs(filepaths, threshold=near_duplicate_threshold, n_process=n_process)
+        deletes_list = remove_duplicates(json_dir, pairs, reporter)
+        for item in deletes_list:
+            index.remove(os.path.basename(str(item).rstrip()))
+    except (PermissionError, ValueError) as err:
+        reporter.message('Error: ' + str(err) + '.', 'red')
+    index.save()
 
 def rename_contentless_files(json_dir):
     """Rename files with empty content fields to '.empty'."""
@@ -137,6 +188,176 @@ def normalize(text, unicode_normalization='NFC'):
     return fix_text(NONBREAKING_SPACE_REGEX.sub(' ', LINEBREAK_REGEX.sub(r'\n', text)).strip(),
                     normalization=unicode_normalization)
 
+def decode_text(rawdata, encoding=None):
+    """Decode the bytes of a text file and return a (text, encoding) tuple.
+
+    UTF-8 is tried first, then the `encoding` detected for a previous file in the same batch.
+    Otherwise the encoding is detected from the first `DETECT_SAMPLE_BYTES` bytes, or from the
+    whole file if the sample gives the wrong answer.
+    """
+    try:
+        text = rawdata.decode('utf-8')
+        # Translate newlines as when reading in text mode
+        return text.replace('\r\n', '\n').replace('\r', '\n'), encoding
+    except UnicodeDecodeError:
+        pass
+    if encoding is not None:
+        try:
+            return rawdata.decode(encoding), encoding
+        except UnicodeDecodeError:
+            pass
+    for sample in [rawdata[:DETECT_SAMPLE_BYTES], rawdata]:
+        encoding = detect(sample)['encoding']
+        if encoding == 'Windows-1252':
+            encoding = 'cp1252'
+        try:
+            return rawdata.decode(encoding), encoding
+        except (LookupError, TypeError, UnicodeDecodeError):
+            if len(sample) == len(rawdata):
+                raise
+
+# Manifest Functions
+def normalize_json_manifest(doc, filename, title_field=None, author_field=None,
+                            content_field=None, pub_date_field=None, default_pub=None):
+    """Map a json document from a zip archive onto the WE1S manifest fields.
+
+    If `default_pub` is set, it is used as the `pub` of documents without one.
+    """
+    if not 'name' in doc:
+        doc['name'] = filename.replace('.json', '')
+    if not 'namespace' in doc:
+        doc['namespace'] = 'we1sv2.0'
+    if not 'metapath' in doc:
+        doc['metapath'] = 'Corpus,RawData'
+    if title_field is not None:
+        doc['title'] = doc[title_field]
+        doc.pop(title_field, None)
+    if author_field is not None:
+        doc['author'] = doc[author_field]
+        doc.pop(author_field, None)
+    if content_field is not None:
+        doc['content'] = doc[content_field]
+        doc.pop(content_field, None)
+    if default_pub is not None and 'pub' not in doc:
+        doc['pub'] = default_pub
+    if pub_date_field is not None:
+        doc['pub_date'] = doc.pop(pub_date_field, '')
+    if 'pub_date' not in doc or doc['pub_date'] == '' or doc['pub_date'] == 'unknown':
+        doc['pub_date'] = 'unknown'
+    else:
+        doc['pub_date'] = date_normalizer.normalize(doc['pub_date'])
+    if 'pub_year' not in doc:
+        if doc['pub_date'] != 'unknown':
+            doc['pub_year'] = doc['pub_date'][0:5]
+        else:
+            doc['pub_year'] = 'unknown'
+    return doc
+
+def write_mongodb_manifest(doc, project_dir):
+    """Write a manifest from MongoDB to the project's json directory.
+
+    Returns None on success or the manifest filename if it could not be written.
+    """
+    filename = doc['name'] + '.json'
+    try:
+        filepath = os.path.join(project_dir, 'project_data/json', filename)
+        with open(filepath, 'w') as f:
+            f.write(json.dumps(doc, sort_keys=False, default=JSON_UTIL))
+    except IOError:
+        return filename
+    return None
+
+def write_manifest(doc, filepath):
+    """Write a manifest and return its (size, MD5 hash) for the import journal."""
+    data = json.dumps(doc).encode('utf-8')
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    return len(data), hashlib.md5(data).hexdigest()
+
+# Parallel Import Functions
+# Each worker process opens its own handle to the zip archive when it starts.
+worker_zip = None
+worker_settings = None
+worker_text_dir = None
+
+def init_text_worker(text_dir):
+    """Store the text directory in a worker process."""
+    global worker_text_dir
+    worker_text_dir = text_dir
+
+def read_text_files(shard):
+    """Read and normalise a shard of (doc_id, filename) text files from the worker's text directory.
+
+    Returns a list of (doc_id, content) tuples, where the content is None if the file could not
+    be read. Files in a shard usually come from the same source, so an encoding detected for one
+    file is tried first for the rest of the shard.
+    """
+    results = []
+    encoding = None
+    for i, filename in shard:
+        try:
+            with open(os.path.join(worker_text_dir, filename), 'rb') as f:
+                rawdata = f.read()
+        except IOError:
+            results.append((i, None))
+            continue
+        text, encoding = decode_text(rawdata, encoding)
+        results.append((i, normalize(text)))
+    return results
+
+def init_zip_worker(zip_file, settings):
+    """Open the zip archive and store the import settings in a worker process."""
+    global worker_zip, worker_settings
+    worker_zip = zipfile.ZipFile(zip_file)
+    worker_settings = settings
+
+def import_zip_members(members):
+    """Normalise and save a shard of json members from the worker's zip archive.
+
+    Returns a dict with the number of members processed, the filenames saved with their
+    content hashes, sizes and modification times, the
+    number of documents without the required phrase, and any errors. The `journal` and
+    `skipped` lists record the completed members for the import journal.
+    """
+    result = {'count': 0, 'saved': [], 'delete_count': 0, 'invalid_manifest_file': [], 'bad_json': [],
+              'journal': [], 'skipped': []}
+    fields = worker_settings['fields']
+    phrase_filter = worker_settings['phrase_filter']
+    for filepath in members:
+        result['count'] += 1
+        filename = os.path.basename(filepath)
+        # Skip directories
+        if not filename:
+            continue
+        try:
+            source = worker_zip.read(filepath)
+            # Skip documents which cannot contain the required phrases without parsing them
+            if phrase_filter is not None and not phrase_filter.prefilter(source):
+                result['delete_count'] += 1
+                result['skipped'].append(filepath)
+                continue
+            doc = json.loads(source.decode())
+            doc = normalize_json_manifest(doc, filename, **fields)
+        except (KeyError, ValueError):
+            result['bad_json'].append(filename)
+            continue
+        for field in ['pub_date', 'title', 'author']:
+            if field not in doc:
+                doc[field] = ''
+        if phrase_filter is not None and not phrase_filter.match(doc.get('content', '')):
+            result['delete_count'] += 1
+            result['skipped'].append(filepath)
+            continue
+        try:
+            manifest_file = os.path.join(worker_settings['json_dir'], filename)
+            size, md5 = write_manifest(doc, manifest_file)
+            stat = os.stat(manifest_file)
+            result['saved'].append((filename, content_hash(doc.get('content')), stat.st_size, stat.st_mtime_ns))
+            result['journal'].append((filepath, filename, size, md5))
+        except IOError:
+            result['invalid_manifest_file'].append(filename)
+    return result
+
 # Classes
 class Import():
     """Import a collection of plain text files from zip archive and accompanying metadata CSV file."""
@@ -148,7 +369,10 @@ class Import():
                  title_field=None, author_field=None, pub_date_field=None, content_field=None,
                  dedupe=False, random_sample=None,
                  random_seed=1, required_phrase=None, save_mode='project',
-                 logfile='import_log.txt', environment=''):
+                 logfile='import_log.txt', environment='', n_process=1, shard_size=200,
+                 progress_interval=0.5, near_duplicate_threshold=None, db_batch_size=1000,
+                 required_phrase_mode='any', resume=False, checkpoint_interval=5, verify='size',
+                 reporter=None):
         """Initialise the Import object."""
         self.zip_file = zip_file # Path to the zipfile
         self.metadata_file = metadata # Path to the metadata csv file
@@ -165,13 +389,23 @@ class Import():
         self.pub_date_field = pub_date_field
         self.content_field = content_field
         self.dedupe = dedupe
+        self.near_duplicate_threshold = near_duplicate_threshold # Minimum similarity for near-duplicates
         self.random_sample = random_sample
         self.random_seed = random_seed
-        self.required_phrase = required_phrase
+        self.required_phrase = required_phrase # A phrase or list of phrases
+        self.phrase_filter = None
+        if required_phrase is not None:
+            self.phrase_filter = PhraseFilter(required_phrase, required_phrase_mode)
         self.delete_count = 0
         self.delete_imports_dir = delete_imports_dir
         self.delete_text_dir = delete_text_dir
         self.save_mode = 'project'
+        self.db_batch_size = db_batch_size # Number of documents in each database insert
+        self.db_writer = None
+        self.resume = resume # Resume an interrupted import from its journal
+        self.checkpoint_interval = checkpoint_interval # Seconds between journal writes
+        self.verify = verify # How to check manifests from an interrupted import: 'size' or 'hash'
+        self.journal = None
         self.logfile = logfile
         self.environment = environment
         self.metadata = 'Metadata has not been loaded.'
@@ -179,10 +413,33 @@ class Import():
         self.this_iter = 0
         self.total_docs = 0
         self.errors = {'file_not_found': [], 'invalid_manifest_file': [], 'database_error': [], 'bad_json': []}
-        self.pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        self.percent = ipywidgets.HTML(value='0%')
+        self.n_process = n_process # Number of worker processes for zipped json files
+        self.shard_size = shard_size # Number of zip members sent to a worker at a time
+        self.progress_interval = progress_interval # Minimum number of seconds between progress updates
+        self.reporter = get_reporter(reporter, environment, progress_interval) # 'jupyter', 'console' or 'silent'
 
 
+    def close_db_writer(self):
+        """Insert any remaining documents in database mode and stop the writer thread."""
+        if self.db_writer is not None:
+            self.db_writer.close()
+            self.db_writer = None
+
+    def compile_data_dirs(self, root_folder=None):
+        """Return a compiled pattern matching paths in the selected data directories, or None.
+
+        If the archive has a root folder, it is prepended to each directory.
+        """
+        if self.data_dirs is None:
+            return None
+        if isinstance(self.data_dirs, str):
+            self.data_dirs = [self.data_dirs]
+        if root_folder is not None:
+            dir_list = [root_folder + '/' + x for x in self.data_dirs]
+        else:
+            dir_list = self.data_dirs
+        return re.compile('^' + '|^'.join(dir_list)) # ^root_folder/dir1|^root_folder/dir2|^root_folder/dir3
+
     def configure_db(self):
         """Configure the database."""
         self.client = MongoClient(self.client)
@@ -198,7 +455,11 @@ class Import():
         return is_new
 
     def create_manifests(self):
-        """Create a manifest for each document."""
+        """Create a manifest for each document.
+
+        The text files are read and normalised in shards of `shard_size` files, across a pool of
+        `n_process` worker processes if it is greater than 1. Manifests are saved in `doc_id` order.
+        """
         # Iterate through the dataframe and create name properties
         doc_ids = []
         names = []
@@ -210,8 +471,7 @@ class Import():
         self.metadata.insert(1, 'name', names)
         self.docs = self.metadata.to_dict(orient='records')
         self.total_iters = len(self.docs)
-        for i, doc in enumerate(self.docs):
-            filename = doc['filename']
+        for doc in self.docs:
             if 'namespace' not in doc:
                 doc['namespace'] = 'we1sv2.0'
             if 'metapath' not in doc:
@@ -223,39 +483,28 @@ class Import():
             if 'pub_date' not in doc or doc['pub_date'] == '' or doc['pub_date'] == 'unknown':
                 doc['pub_date'] = 'unknown'
             else:
-                pub_date = dateparser.parse(str(doc['pub_date']))
-                doc['pub_date'] = pub_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+                doc['pub_date'] = date_normalizer.normalize(doc['pub_date'])
             if 'pub_year' not in doc:
                 if doc['pub_date'] != 'unknown':
                     doc['pub_year'] = doc['pub_date'][0:5]
                 else:
                     doc['pub_year'] = 'unknown'
-            # Read the source file and copy the content to the manifest
-            try:
-                try:
-                    with open(os.path.join(self.text_dir, filename), 'r') as f:
-                        doc['content'] = normalize(f.read())
-                except UnicodeDecodeError:
-                    with open(os.path.join(self.text_dir, filename), 'rb') as f:
-                        rawdata = f.read()
-                    encoding = detect(rawdata)['encoding']
-                    if encoding == 'Windows-1252':
-                        encoding = 'cp1252'
-                    doc['content'] = normalize(rawdata.decode(encoding).encode('utf-8').decode('utf-8'))
-                doc['length'] = str(len(doc['content']))
-                # Save the document
-                if self.required_phrase is None:
-                    self.save(doc, i)
-                elif self.required_phrase is not None and self.required_phrase in doc['content']:
-                    self.save(doc, i)
-                else:
-                    self.this_iter += 1
-                    progress = int(100. * self.this_iter/self.total_iters)
-                    self.pbar.value = progress
-                    self.percent.value = '{0}%'.format(progress)
-                    self.delete_count += 1    
-            except IOError:
-                self.errors['file_not_found'].append(filename)
+        # Read the source files and copy the content to the manifests
+        filenames = [(i, doc['filename']) for i, doc in enumerate(self.docs)]
+        if self.save_mode != 'db':
+            remaining = set(self.filter_completed([filename for _, filename in filenames]))
+            filenames = [(i, filename) for i, filename in filenames if filename in remaining]
+        shards = [filenames[i:i + self.shard_size] for i in range(0, len(filenames), self.shard_size)]
+        if self.n_process is not None and self.n_process > 1 and len(shards) > 1:
+            with Pool(self.n_process, initializer=init_text_worker, initargs=(self.text_dir,)) as pool:
+                for results in pool.imap(read_text_files, shards):
+                    self.save_text_manifests(results)
+        else:
+            init_text_worker(self.text_dir)
+            for shard in shards:
+                self.save_text_manifests(read_text_files(shard))
+        self.close_db_writer()
+        self.reporter.finish()
 
     def create_text_dir(self):
         """Create the text directory if it does not exist.
@@ -308,6 +557,32 @@ class Import():
                 f.write('\n')
                 f.write(str(self.delete_count) + ' files without the required phrase were deleted.')
 
+    def filter_completed(self, items):
+        """Remove items completed by an interrupted import from a list, if resuming.
+
+        Items skipped for lacking the required phrase are added to `delete_count`.
+        """
+        if self.journal is None or len(self.journal.items) == 0:
+            return items
+        resumed_count = self.journal.resumed_count
+        skipped_count = self.journal.skipped_count
+        items = [item for item in items if not self.journal.is_done(item)]
+        self.delete_count += self.journal.skipped_count - skipped_count
+        resumed_count = self.journal.resumed_count - resumed_count
+        if resumed_count > 0:
+            self.show_message('Resuming the import: ' + str(resumed_count) + ' manifests have already been imported.', 'green')
+        return items
+
+    def get_manifest_fields(self, default_pub=None):
+        """Return the field mappings passed to `normalize_json_manifest()`."""
+        return {
+            'title_field': self.title_field,
+            'author_field': self.author_field,
+            'content_field': self.content_field,
+            'pub_date_field': self.pub_date_field,
+            'default_pub': default_pub
+        }
+
     def import_plain_text(self):
         """Import plain text."""
         timer = Timer()
@@ -328,11 +603,11 @@ class Import():
         else:
             self.create_manifests()
         if self.dedupe:
-            deduplicate(self.json_dir)
+            deduplicate(self.json_dir, self.n_process, self.near_duplicate_threshold, self.reporter)
         self.delete_dirs('text_dir')
         # Generate log
-        if len(self.errors['file_not_found']) or len(self.errors['invalid_manifest_file']) or len(self.errors['database_error']) > 0:
-            num_errors = str(len([v for _, v in self.errors.items() if len(v)> 0]))
+        if any(len(errors) > 0 for errors in self.errors.values()):
+            num_errors = str(sum(len(errors) for errors in self.errors.values()))
             self.show_message(num_errors + ' files could not be imported. See the import log for more information.', 'red')
             self.generate_log()
         self.total_docs = len([file for file in os.listdir(self.json_dir) if file.endswith('.json')])
@@ -357,6 +632,17 @@ class Import():
         else:
             return True
 
+    def journal_skipped(self, item):
+        """Record an item without the required phrase in the import journal."""
+        if self.journal is not None:
+            self.journal.record_skipped(item)
+
+    def load_dedupe_index(self):
+        """Return a DedupeIndex synchronised with the json directory if deduping is enabled."""
+        if not self.dedupe:
+            return None
+        return hash_jsons(self.json_dir, self.n_process, self.reporter)
+
     def load_metadata(self):
         """Load the metadata file."""
         try:
@@ -364,7 +650,7 @@ class Import():
             if self.random_sample is not None:
                 df = df.sample(n=self.random_sample, random_state=self.random_seed)
         except IOError:
-            display(HTML('<p style="color: red;">Error! Could not read the metadata file.</p>'))
+            self.show_message('Error! Could not read the metadata file.', 'red')
             raise
         # Validate the metadata
         try:
@@ -378,20 +664,42 @@ class Import():
         """Save a doc to a database or a project."""
         self.this_iter = i + 1
         if self.save_mode == 'db':
-            try:
-                result = self.collection.insert_one(doc)
-            except ValueError:
-                self.errors['database_error'].append(doc['filename'])
+            # Documents are inserted in batches by a background thread
+            if self.db_writer is None:
+                self.db_writer = BulkWriter(self.collection, self.db_batch_size,
+                                            errors=self.errors['database_error'])
+            self.db_writer.write(doc)
         else:
             try:
                 manifest_file = os.path.join(self.json_dir, doc['name'] + '.json')
-                with open(manifest_file, 'w') as f:
-                    f.write(json.dumps(doc))
+                size, md5 = write_manifest(doc, manifest_file)
+                if self.journal is not None:
+                    self.journal.record(doc['filename'], doc['name'] + '.json', size, md5)
             except IOError:
                 self.errors['invalid_manifest_file'].append(manifest_file)
-        progress = int(100. * self.this_iter/self.total_iters)
-        self.pbar.value = progress
-        self.percent.value = '{0}%'.format(progress)
+        self.update_progress(self.this_iter, self.total_iters)
+
+    def update_progress(self, done, total, force=False):
+        """Report the progress no more often than every `progress_interval` seconds."""
+        self.reporter.update(done, total, force)
+
+    def save_text_manifests(self, results):
+        """Add the content of a shard of text files to their manifests and save them."""
+        for i, content in results:
+            doc = self.docs[i]
+            if content is None:
+                self.errors['file_not_found'].append(doc['filename'])
+                continue
+            doc['content'] = content
+            doc['length'] = str(len(doc['content']))
+            # Save the document
+            if self.phrase_filter is None or self.phrase_filter.match(doc['content']):
+                self.save(doc, i)
+            else:
+                self.journal_skipped(doc['filename'])
+                self.this_iter += 1
+                self.update_progress(self.this_iter, self.total_iters)
+                self.delete_count += 1
 
     def set_save_mode(self):
         """Set the save_mode."""
@@ -432,127 +740,77 @@ class Import():
         self.show_message(msg, 'green', 5)
 
     def show_message(self, msg, color='', size=None):
-        """Show HTML or plain text output by mode."""
-        if self.environment == 'jupyter':
-            if size is None:
-                start_tag = '<p style="color: ' + color + ';">'
-                end_tag = '</p>'
-            else:
-                start_tag = '<h' + str(size) + ' style="color: ' + color + ';">'
-                end_tag = '</h' + str(size) + '>'
-            display(HTML(start_tag + msg + end_tag))
-        else:
-            print(msg)
+        """Show HTML or plain text output with the reporter."""
+        self.reporter.message(msg, color, size)
+
+    def start_import(self, remove_existing_json=False, reporter=None):
+        """Start the import pipeline.
 
-    def start_import(self, remove_existing_json=False):
-        """Start the import pipeline."""
-        display(HBox([Label('Importing...'), self.pbar, self.percent]))
+        Parameters:
+        - remove_existing_json (bool): Delete the json directory before importing.
+        - reporter (str or Reporter): Overrides the reporter for this import: 'jupyter', 'console' or 'silent'.
+        """
+        if reporter is not None:
+            self.reporter = get_reporter(reporter, self.environment, self.progress_interval)
+        self.reporter.start('Importing...')
         if remove_existing_json == True and os.path.exists(self.json_dir):
             shutil.rmtree(self.json_dir)
         if not os.path.exists(self.json_dir):
             os.makedirs(self.json_dir)
         package = None
         self.zip_file = os.path.join(self.imports_dir, self.zip_file)
+        self.journal = ImportJournal(self.json_dir, self.zip_file, self.resume, self.checkpoint_interval, self.verify)
         try:
             package = Package(self.zip_file)
         except DataPackageException:
             pass
-        if package is not None:
-            self.unpack_datapackage(package)
-        elif len([x for x in zipfile.ZipFile(self.zip_file).namelist() if x.endswith('.json')]) > 0:
-            self.unpack_json_zipfile()
-        else:
-            self.import_plain_text()
+        try:
+            if package is not None:
+                self.unpack_datapackage(package)
+            elif len([x for x in zipfile.ZipFile(self.zip_file).namelist() if x.endswith('.json')]) > 0:
+                self.unpack_json_zipfile()
+            else:
+                self.import_plain_text()
+        except BaseException:
+            # Save the journal so that the import can be resumed
+            self.journal.close()
+            raise
+        self.journal.close(complete=True)
 
     def unpack_datapackage(self, package):
-        """Unzip and data package and copy json files in selected folders to the json directory."""
+        """Unzip and data package and copy json files in selected folders to the json directory.
+
+        The archive is opened once and the resource list is filtered before any member is read.
+        The matching members are then imported in the same way as a zip archive of json files,
+        across a pool of `n_process` worker processes if it is greater than 1.
+        """
         timer = Timer()
         try:
-            data_dirs = re.compile('.')
-            if self.data_dirs is not None:
-                if isinstance(self.data_dirs, str):
-                    self.data_dirs = [self.data_dirs]
-                data_dirs = re.compile('^' + '|^'.join(self.data_dirs)) # ^dir1|^dir2|^dir3
             if self.random_sample is not None:
                 random.seed(self.random_seed)
                 resources = random.sample(package.resources, self.random_sample)
             else:
                 resources = package.resources
+            with zipfile.ZipFile(self.zip_file) as zip_file:
+                namelist = zip_file.namelist()
             # Detect root directory in zipfile
-            root_folder = self.detect_zip_structure(zipfile.ZipFile(self.zip_file).namelist())  
-            # Iterate through the resources
-            for i, resource in enumerate(resources):
-                self.this_iter = i
-                resource_filepath = resource.descriptor['path']
+            root_folder = self.detect_zip_structure(namelist)
+            data_dirs = self.compile_data_dirs(root_folder)
+            # Filter the resources before reading any of them
+            json_files = []
+            for resource in resources:
+                filepath = resource.descriptor['path']
                 if root_folder is not None:
-                    filepath = os.path.join(root_folder, resource_filepath)
-                else:
-                    filepath = resource_filepath
-                filename = filepath.split('/')[-1]
-                # Add the root folder path, if present, to the data_dirs
-                if root_folder is not None and self.data_dirs:
-                    dir_list = [root_folder + x for x in self.data_dirs]
-                    data_dirs = re.compile('^' + '|^'.join(dir_list)) # ^root_folder/dir1|^root_folder/dir2|^root_folder/dir3
-                # Ensure that the resource is in the data_dirs
-                if re.search(data_dirs, filepath) and filepath.endswith('.json'):           
-                    file = zipfile.ZipFile(self.zip_file, 'r')
-                    file_str = file.read(filepath)
-                    doc = json.loads(file_str)
-                    if not 'name' in doc:
-                        doc['name'] = resource.split('/')[-1] + '.json'
-                    if not 'namespace' in doc:
-                        doc['namespace'] = 'we1sv2.0'
-                    if not 'metapath' in doc:
-                        doc['metapath'] = 'Corpus,RawData'
-                    if self.title_field is not None:
-                        doc['title'] = doc[self.title_field]
-                        doc.pop(self.title_field, None)
-                    if self.author_field is not None:
-                        doc['author'] = [self.author_field]
-                        doc.pop(self.author_field, None)
-                    if 'pub' not in doc:
-                        doc['pub'] = 'unknown'
-                    if self.pub_date_field is not None:
-                        pub_date = dateparser.parse(str(doc[self.pub_date_field]))
-                        doc.pop(self.pub_date_field, None)
-                    if 'pub_date' not in doc or doc['pub_date'] == '' or doc['pub_date'] == 'unknown':
-                        doc['pub_date'] = 'unknown'
-                    else:
-                        pub_date = dateparser.parse(str(doc['pub_date']))
-                        doc['pub_date'] = pub_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-                    if 'pub_year' not in doc:
-                        if doc['pub_date'] != 'unknown':
-                            doc['pub_year'] = pub_date[0:5]
-                        else:
-                            doc['pub_year'] = 'unknown'
-                    if self.content_field is not None:
-                        doc['content'] = self.content_field
-                        doc.pop(self.content_field, None)
-                    if self.is_valid_json(doc, filepath):
-                        if self.required_phrase is None:
-                            with open(os.path.join(self.json_dir, filename), 'w') as f:
-                                f.write(json.dumps(doc))
-                        elif self.required_phrase is not None and self.required_phrase in doc['content']:
-                            with open(os.path.join(self.json_dir, filename), 'w') as f:
-                                f.write(json.dumps(doc))
-                        else:
-                            self.this_iter += 1
-                            progress = int(100. * self.this_iter/self.total_iters)
-                            self.pbar.value = progress
-                            self.percent.value = '{0}%'.format(progress)
-                            self.delete_count += 1
-                    else:
-                        self.errors['invalid_manifest_file'].append(filename)
-                progress = int(100. * self.this_iter/len(resources))
-                self.pbar.value = progress
-                self.percent.value = '{0}%'.format(progress)
-                self.this_iter += 1
-            if self.dedupe:
-                self.this_iter += 1
-                deduplicate(self.json_dir)
-            progress = int(100. * self.this_iter/len(resources))
-            self.pbar.value = progress
-            self.percent.value = '{0}%'.format(progress)
+                    filepath = os.path.join(root_folder, filepath)
+                if filepath.endswith('.json') and (data_dirs is None or data_dirs.search(filepath)):
+                    json_files.append(filepath)
+            self.this_iter = 0
+            self.total_iters = len(json_files)
+            fields = self.get_manifest_fields(default_pub='unknown')
+            if self.n_process is not None and self.n_process > 1:
+                self.unpack_json_members_parallel(json_files, fields)
+            else:
+                self.unpack_json_members(json_files, fields)
         except IOError:
             self.show_message('Error! Could not unpack zipfile.', 'red')
         # Generate log
@@ -574,88 +832,23 @@ class Import():
             if root_folder is not None:
                 print('root folder is ' + root_folder)
             else:
-                print('No root folder')           
-            # Set the data_dirs pattern
-            if self.data_dirs is not None:
-                if isinstance(self.data_dirs, str):
-                    self.data_dirs = [self.data_dirs]
-                data_dirs = re.compile('^' + '|^'.join(self.data_dirs)) # ^dir1|^dir2|^dir3
-            # Add the root folder path, if present, to the data_dirs
-            data_dirs = None
-            if root_folder is not None and self.data_dirs is not None:
-                dir_list = [root_folder + '/' + x for x in self.data_dirs]
-                data_dirs = re.compile('^' + '|^'.join(dir_list)) # ^root_folder/dir1|^root_folder/dir2|^root_folder/dir3
+                print('No root folder')
+            # Set the data_dirs pattern, adding the root folder path if present
+            data_dirs = self.compile_data_dirs(root_folder)
             self.this_iter = 0
             with zipfile.ZipFile(self.zip_file) as zip_file:
                 if data_dirs is not None:
-                    json_files = [file for file in zip_file.namelist() if file.endswith('.json') and re.search(data_dirs, file)]
+                    json_files = [file for file in zip_file.namelist() if file.endswith('.json') and data_dirs.search(file)]
                 else:
                     json_files = [file for file in zip_file.namelist() if file.endswith('.json')]
                 if self.random_sample is not None:
                     random.seed(self.random_seed)
                     json_files = random.sample(json_files, self.random_sample)
-                for filepath in json_files:
-                    filename = os.path.basename(filepath)
-                    # Skip directories
-                    if not filename:
-                        continue
-                    else:
-                        # Copy file (taken from zipfile's extract)
-                        source = zip_file.open(filepath).read()
-                        doc = json.loads(source.decode())
-                        if not 'name' in doc:
-                            doc['name'] = filename.replace('.json', '')
-                        if not 'namespace' in doc:
-                            doc['namespace'] = 'we1sv2.0'
-                        if not 'metapath' in doc:
-                            doc['metapath'] = 'Corpus,RawData'
-                        if self.title_field is not None:
-                            doc['title'] = doc[self.title_field]
-                            doc.pop(self.title_field, None)
-                        if self.author_field is not None:
-                            doc['author'] = doc[self.author_field]
-                            doc.pop(self.author_field, None)
-                        if self.content_field is not None:
-                            doc['content'] = doc[self.content_field]
-                            doc.pop(self.content_field, None)
-                        if self.pub_date_field is not None:
-                            pub_date = dateparser.parse(str(doc[self.pub_date_field]))
-                            doc.pop(self.pub_date_field, None)
-                        if 'pub_date' not in doc or doc['pub_date'] == '' or doc['pub_date'] == 'unknown':
-                            doc['pub_date'] = 'unknown'
-                        else:
-                            pub_date = dateparser.parse(str(doc['pub_date']))
-                            doc['pub_date'] = pub_date.strftime('%Y-%m-%dT%H:%M:%SZ')
-                        if 'pub_year' not in doc:
-                            if doc['pub_date'] != 'unknown':
-                                doc['pub_year'] = pub_date[0:5]
-                            else:
-                                doc['pub_year'] = 'unknown'
-                        if self.is_valid_json(doc, filename):
-                            if self.required_phrase is None:
-                                with open(os.path.join(self.json_dir, filename), 'w') as f:
-                                    f.write(json.dumps(doc))
-                            elif self.required_phrase is not None and self.required_phrase in doc['content']:
-                                with open(os.path.join(self.json_dir, filename), 'w') as f:
-                                    f.write(json.dumps(doc))
-                            else:
-                                self.this_iter += 1
-                                progress = int(100. * self.this_iter/self.total_iters)
-                                self.pbar.value = progress
-                                self.percent.value = '{0}%'.format(progress)
-                                self.delete_count += 1
-                        else:
-                            self.errors['invalid_manifest_file'].append(filename)
-                    progress = int(100. * self.this_iter/len(json_files))
-                    self.pbar.value = progress
-                    self.percent.value = '{0}%'.format(progress)
-                    self.this_iter += 1
-                    if self.dedupe:
-                        self.this_iter += 1
-                        deduplicate(self.json_dir)
-                    progress = int(100. * self.this_iter/len(json_files))
-                    self.pbar.value = progress
-                    self.percent.value = '{0}%'.format(progress)
+                self.total_iters = len(json_files)
+            if self.n_process is not None and self.n_process > 1:
+                self.unpack_json_members_parallel(json_files)
+            else:
+                self.unpack_json_members(json_files)
         except IOError:
             self.show_message('Error! Could not unpack zipfile.', 'red')
         # Generate log
@@ -668,6 +861,96 @@ class Import():
             self.show_message(str(self.delete_count) + ' records were not imported because they did not have the required phrase.', 'green', 4)
         self.show_message('Time elapsed: %s' % timer.get_time_elapsed())
 
+    def unpack_json_members(self, json_files, fields=None):
+        """Normalise and save a list of json members from the zip archive in a single process.
+
+        `fields` is a dict of keyword arguments for `normalize_json_manifest()`.
+        """
+        if fields is None:
+            fields = self.get_manifest_fields()
+        json_files = self.filter_completed(json_files)
+        index = self.load_dedupe_index()
+        with zipfile.ZipFile(self.zip_file) as zip_file:
+            for filepath in json_files:
+                filename = os.path.basename(filepath)
+                # Skip directories
+                if not filename:
+                    continue
+                else:
+                    try:
+                        # Copy file (taken from zipfile's extract)
+                        source = zip_file.open(filepath).read()
+                        # Skip documents which cannot contain the required phrases without parsing them
+                        if self.phrase_filter is not None and not self.phrase_filter.prefilter(source):
+                            self.journal_skipped(filepath)
+                            self.delete_count += 1
+                            self.this_iter += 1
+                            continue
+                        doc = json.loads(source.decode())
+                        doc = normalize_json_manifest(doc, filename, **fields)
+                    except (KeyError, ValueError):
+                        # Record the member as the parallel workers do, and continue with the next one
+                        self.errors['bad_json'].append(filename)
+                        self.this_iter += 1
+                        self.update_progress(self.this_iter, len(json_files))
+                        continue
+                    if self.is_valid_json(doc, filename):
+                        if self.phrase_filter is None or self.phrase_filter.match(doc['content']):
+                            size, md5 = write_manifest(doc, os.path.join(self.json_dir, filename))
+                            if self.journal is not None:
+                                self.journal.record(filepath, filename, size, md5)
+                            # Check the new manifest against the hash index
+                            if index is not None:
+                                index.add(filename, doc.get('content'))
+                        else:
+                            self.journal_skipped(filepath)
+                            self.delete_count += 1
+                    else:
+                        self.errors['invalid_manifest_file'].append(filename)
+                self.this_iter += 1
+                self.update_progress(self.this_iter, len(json_files))
+        self.reporter.finish()
+        if index is not None:
+            remove_indexed_duplicates(index, self.near_duplicate_threshold, self.n_process, self.reporter)
+
+    def unpack_json_members_parallel(self, json_files, fields=None):
+        """Normalise and save a list of json members from the zip archive using a pool of worker processes.
+
+        The member list is divided into shards of `shard_size` members. Each worker opens its
+        own handle to the zip archive and writes its manifests directly to the json directory.
+        Progress is aggregated as shards are completed and reported every `progress_interval` seconds.
+        """
+        if fields is None:
+            fields = self.get_manifest_fields()
+        json_files = self.filter_completed(json_files)
+        settings = {
+            'json_dir': self.json_dir,
+            'phrase_filter': self.phrase_filter,
+            'fields': fields
+        }
+        shards = [json_files[i:i + self.shard_size] for i in range(0, len(json_files), self.shard_size)]
+        done = 0
+        index = self.load_dedupe_index()
+        with Pool(self.n_process, initializer=init_zip_worker, initargs=(self.zip_file, settings)) as pool:
+            for result in pool.imap_unordered(import_zip_members, shards):
+                done += result['count']
+                self.delete_count += result['delete_count']
+                self.errors['invalid_manifest_file'] += result['invalid_manifest_file']
+                self.errors['bad_json'] += result['bad_json']
+                if index is not None:
+                    for filename, hash, size, mtime in result['saved']:
+                        index.add_hash(filename, hash, size, mtime)
+                if self.journal is not None:
+                    for filepath, filename, size, md5 in result['journal']:
+                        self.journal.record(filepath, filename, size, md5)
+                    for filepath in result['skipped']:
+                        self.journal.record_skipped(filepath)
+                self.this_iter = done
+                self.update_progress(done, len(json_files))
+        self.reporter.finish()
+        if index is not None:
+            remove_indexed_duplicates(index, self.near_duplicate_threshold, self.n_process, self.reporter)
+
     def unpack_zipfile(self):
         """Unzip and flatten the archive to the text directory."""
         try:
@@ -697,7 +980,9 @@ class MongoDBImport():
                  title_field=None, author_field=None, pub_date_field=None, content_field=None,
                  random_sample=None, random_seed=1,
                  required_phrase=None, logfile='import_log.txt',
-                 environment=''):
+                 environment='', near_duplicate_threshold=None, batch_size=1000,
+                 projection=None, n_threads=4, required_phrase_mode='any', resume=False,
+                 checkpoint_interval=5, progress_interval=0.5, reporter=None):
         """Initialise the Import object."""
         if isinstance(query, str):
             self.query = json.loads(query)
@@ -713,9 +998,13 @@ class MongoDBImport():
         self.pub_date_field = pub_date_field
         self.content_field = content_field
         self.dedupe = dedupe
+        self.near_duplicate_threshold = near_duplicate_threshold # Minimum similarity for near-duplicates
         self.random_sample = random_sample
         self.random_seed = random_seed
-        self.required_phrase = required_phrase
+        self.required_phrase = required_phrase # A phrase or list of phrases
+        self.phrase_filter = None
+        if required_phrase is not None:
+            self.phrase_filter = PhraseFilter(required_phrase, required_phrase_mode)
         self.delete_count = 0
         self.saved_count = 0
         self.logfile = logfile
@@ -723,12 +1012,31 @@ class MongoDBImport():
         self.valid_headers = ['filename', 'pub_date', 'title', 'author']
         self.result = None
         self.result_count = 0
-        self.errors = {'database_error': []}
+        self.batch_size = batch_size # Number of documents fetched from the cursor at a time
+        self.projection = projection # Fields returned by the query
+        self.n_threads = n_threads # Number of threads writing manifests
+        self.executor = None
+        self.pending = set()
+        self.resume = resume # Resume an interrupted import from its last checkpoint
+        self.checkpoint_interval = checkpoint_interval # Seconds between checkpoints
+        self.journal = None
+        self.last_id = None # The _id of the last document read from the cursor
+        self.errors = {'database_error': [], 'invalid_manifest_file': []}
         self.this_iter = 0
-        self.pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        self.percent = ipywidgets.HTML(value='0%')
+        self.progress_interval = progress_interval # Minimum number of seconds between progress updates
+        self.reporter = get_reporter(reporter, environment, progress_interval) # 'jupyter', 'console' or 'silent'
         self.setup()
 
+    def collect_writes(self, futures):
+        """Record the results of completed manifest writes."""
+        for future in futures:
+            error = future.result()
+            if error is None:
+                self.saved_count += 1
+            else:
+                self.errors['invalid_manifest_file'].append(error)
+        self.pending -= set(futures)
+
     def generate_log(self):
         """Generate a log file if there are errors."""
         with open(self.logfile, 'a') as f:
@@ -736,53 +1044,107 @@ class MongoDBImport():
                 f.write('\n')
                 for file in self.errors['database_error']:
                     f.write(file + '\n')
+            if len(self.errors['invalid_manifest_file']) > 0:
+                f.write('\nThe following manifests could not be saved:\n')
+                for file in self.errors['invalid_manifest_file']:
+                    f.write(file + '\n')
             if self.required_phrase is not None:
                 f.write('\n')
                 f.write(str(self.delete_count) + ' files without the required phrase were deleted.')
 
+    def find_by_ids(self, ids):
+        """Yield the documents with the given ids, fetching them `batch_size` at a time."""
+        for i in range(0, len(ids), self.batch_size):
+            chunk = ids[i:i + self.batch_size]
+            try:
+                docs = {doc['_id']: doc for doc in self.collection.find({'_id': {'$in': chunk}}, self.projection)}
+            except pymongo.errors.OperationFailure as e:
+                self.errors['database_error'].append(str(e.code) + ':' + str(e.details))
+                continue
+            # Preserve the order of the sample
+            for id in chunk:
+                if id in docs:
+                    yield docs[id]
+
     def get_random_sample(self):
-        """Use either MongoDB or Python (as needed) to return a random sample of the query data."""
+        """Use either MongoDB or Python (as needed) to return a random sample of the query data.
+
+        With a `random_seed`, the sample is reproducible: the ids of the matching documents are
+        streamed in `_id` order and sampled with a seeded reservoir, so only the sampled ids are
+        held in memory. The sampled documents are then fetched in batches.
+        """
         if self.random_seed is None:
-            return self.sample_database()
+            result = self.sample_database()
+            self.result_count = len(result) if result is not None else 0
+            return result
         else:
-            random.seed(self.random_seed)
-            return random.sample(list(self.query_database()), self.random_sample)
-        
-    def start_import(self, remove_existing_json=False):
-        """Start the import pipeline."""
+            ids = self.sample_ids()
+            self.result_count = len(ids)
+            # Continue after the last document read by an interrupted import
+            if self.last_id is not None and self.last_id in ids:
+                ids = ids[ids.index(self.last_id) + 1:]
+            return self.find_by_ids(ids)
+
+    def start_import(self, remove_existing_json=False, reporter=None):
+        """Start the import pipeline.
+
+        Parameters:
+        - remove_existing_json (bool): Delete the json directory before importing.
+        - reporter (str or Reporter): Overrides the reporter for this import: 'jupyter', 'console' or 'silent'.
+        """
         timer = Timer()
-        display(HBox([Label('Importing...'), self.pbar, self.percent]))
+        if reporter is not None:
+            self.reporter = get_reporter(reporter, self.environment, self.progress_interval)
+        self.reporter.start('Importing...')
         if remove_existing_json == True:
             shutil.rmtree(self.json_dir)
         if not os.path.exists(self.json_dir):
             os.makedirs(self.json_dir)
-        if isinstance(self.query, dict) and self.random_sample is None:
-            result = self.query_database()
-        elif isinstance(self.query, dict) and isinstance(self.random_sample, int):
-            result = self.get_random_sample()
-        elif self.query is None and isinstance(self.random_sample, int):
+        if not isinstance(self.query, dict):
+            self.query = {}
+        source = json_util.dumps({'query': self.query, 'random_sample': self.random_sample,
+                                  'random_seed': self.random_seed}, sort_keys=True)
+        self.journal = ImportJournal(self.json_dir, source, self.resume, self.checkpoint_interval)
+        # Unseeded samples cannot be resumed
+        checkpoint = self.journal.checkpoint
+        if checkpoint is not None and (self.random_sample is None or self.random_seed is not None):
+            self.last_id = json_util.loads(checkpoint['last_id'])
+        else:
+            checkpoint = None
+        if isinstance(self.random_sample, int):
             result = self.get_random_sample()
         else:
-            self.query = {}
             result = self.query_database()
-        if self.random_sample and isinstance(result, list):
-            result_count = len(result)
-        elif self.random_sample and not isinstance(result, list):
-            result_count = len(list(result))
-        else:
-            result_count = result.count()
-        self.result_count = result_count
+        if checkpoint is not None:
+            self.saved_count = checkpoint['saved_count']
+            self.delete_count = checkpoint['delete_count']
+            self.this_iter = checkpoint['this_iter']
+            self.show_message('Resuming the import: ' + str(self.saved_count) + ' records have already been imported.', 'green')
         if result is not None:
-            for doc in result:
-                self.save(doc)
+            try:
+                # Manifests are written by a pool of threads while the cursor is consumed
+                with ThreadPoolExecutor(self.n_threads) as executor:
+                    self.executor = executor
+                    for doc in result:
+                        self.save(doc)
+                        self.last_id = doc.get('_id')
+                        if self.journal.write_due():
+                            self.save_checkpoint()
+                    self.collect_writes(self.pending)
+                self.executor = None
+            except BaseException:
+                # Save the journal so that the import can be resumed
+                self.journal.close()
+                raise
+        self.journal.close(complete=True)
         if self.dedupe:
-            deduplicate(self.json_dir)
+            deduplicate(self.json_dir, near_duplicate_threshold=self.near_duplicate_threshold,
+                        reporter=self.reporter)
             self.this_iter += 1
-        progress = int(100. * self.this_iter/self.result_count)
-        self.pbar.value = progress
-        self.percent.value = '{0}%'.format(progress)
+        self.reporter.update(self.this_iter, self.result_count, force=True)
+        self.reporter.finish()
         # Generate log
-        if len(self.errors['database_error']) > 0:
+        if len(self.errors['database_error']) > 0 or len(self.errors['invalid_manifest_file']) > 0:
             self.show_message('One or more errors were encountered during the import process. See the import log for more information.', 'red')
             self.generate_log()
         self.show_message(str(self.saved_count) + ' records have been imported to the project workspace.', 'green', 4)
@@ -793,13 +1155,28 @@ class MongoDBImport():
     def query_database(self):
         """Query the database.
 
+        Returns a cursor which fetches `batch_size` documents at a time.
         Needs to handle multiple collections.
         """
         try:
-            result = self.collection.find(self.query)
+            self.result_count = self.collection.count_documents(self.query)
+            query = self.query
+            if self.phrase_filter is not None:
+                # Select the documents containing the required phrases on the server
+                query = self.phrase_filter.regex_query(self.content_field or 'content')
+                if len(self.query) > 0:
+                    query = {'$and': [self.query, query]}
+                skipped = self.result_count - self.collection.count_documents(query)
+                self.delete_count += skipped
+                self.this_iter += skipped
+            # Continue after the last document read by an interrupted import
+            if self.last_id is not None:
+                query = {'$and': [query, {'_id': {'$gt': self.last_id}}]}
+            # Sort by _id so that the position of the cursor can be checkpointed
+            result = self.collection.find(query, self.projection).sort('_id', 1).batch_size(self.batch_size)
         except pymongo.errors.OperationFailure as e:
             print('error')
-            self.errors['database'].append(e.code + ':' + e.details)
+            self.errors['database_error'].append(str(e.code) + ':' + str(e.details))
             result = None
         return result
 
@@ -809,61 +1186,87 @@ class MongoDBImport():
         Ignores self.query, uses sample aggregation.
         """
         try:
-            result = self.collection.aggregate([{ '$sample': { 'size': self.random_sample } }])
+            pipeline = [{ '$sample': { 'size': self.random_sample } }]
+            if self.projection is not None:
+                pipeline.append({ '$project': self.projection })
+            result = self.collection.aggregate(pipeline)
             return list(result)
         except pymongo.errors.OperationFailure as e:
             self.errors['database_error'].append(str(e.code) + ':' + str(e.details))
             return None
 
+    def sample_ids(self):
+        """Return a seeded random sample of the ids of the documents matching the query."""
+        generator = random.Random(self.random_seed)
+        sample = []
+        try:
+            cursor = self.collection.find(self.query, {'_id': 1}).sort('_id', 1).batch_size(self.batch_size)
+            for i, doc in enumerate(cursor):
+                if i < self.random_sample:
+                    sample.append(doc['_id'])
+                else:
+                    j = generator.randint(0, i)
+                    if j < self.random_sample:
+                        sample[j] = doc['_id']
+        except pymongo.errors.OperationFailure as e:
+            self.errors['database_error'].append(str(e.code) + ':' + str(e.details))
+        return sample
+
+
     def save(self, doc):
         """Save a doc to a project."""
         # Ensure that the doc is valid before saving
         doc = self.validate(doc)
-        if self.required_phrase is not None and self.required_phrase not in doc['content']:
+        if self.phrase_filter is not None and not self.phrase_filter.match(doc['content']):
             self.delete_count += 1
+        elif self.executor is not None:
+            # Bound the number of manifests waiting to be written
+            if len(self.pending) >= self.n_threads * 4:
+                done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+                self.collect_writes(done)
+            self.pending.add(self.executor.submit(write_mongodb_manifest, doc, self.project_dir))
         else:
-            try:
-                savepath = os.path.join(self.project_dir, 'project_data/json')
-                filepath = os.path.join(savepath, doc['name'] + '.json')
-                with open(filepath, 'w') as f:
-                    f.write(json.dumps(doc, sort_keys=False, default=JSON_UTIL))
+            error = write_mongodb_manifest(doc, self.project_dir)
+            if error is None:
                 self.saved_count += 1
-            except IOError:
-                self.errors['invalid_manifest_file'].append(doc['name'] + '.json')
+            else:
+                self.errors['invalid_manifest_file'].append(error)
         self.this_iter += 1
-        progress = int(100. * self.this_iter/self.result_count)
-        self.pbar.value = progress
-        self.percent.value = '{0}%'.format(progress)
+        self.reporter.update(self.this_iter, self.result_count)
+
+    def save_checkpoint(self):
+        """Wait for pending writes and record the cursor position and counters in the journal."""
+        self.collect_writes(list(self.pending))
+        self.journal.record_checkpoint({
+            'last_id': json_util.dumps(self.last_id),
+            'saved_count': self.saved_count,
+            'delete_count': self.delete_count,
+            'this_iter': self.this_iter
+        })
 
     def setup(self):
         """Set up the task object."""
+        # Keep the json directory of an interrupted import that will be resumed
+        if self.resume and os.path.exists(os.path.join(self.project_dir, 'project_data/json')):
+            return
         # Make a fresh json directory
         if os.path.exists(os.path.join(self.project_dir, 'project_data/json')):
             shutil.rmtree(os.path.join(self.project_dir, 'project_data/json'))
         os.makedirs(os.path.join(self.project_dir, 'project_data/json'))
-        display(HTML('<p>Project <code>json</code> directory created.</p>'))
+        self.show_message('Project <code>json</code> directory created.')
 
     def show_message(self, msg, color='', size=None):
-        """Show HTML or plain text output by mode."""
-        if self.environment == 'jupyter':
-            if size is None:
-                start_tag = '<p style="color: ' + color + ';">'
-                end_tag = '</p>'
-            else:
-                start_tag = '<h' + str(size) + ' style="color: ' + color + ';">'
-                end_tag = '</h' + str(size) + '>'
-            display(HTML(start_tag + msg + end_tag))
-        else:
-            print(msg)
+        """Show HTML or plain text output with the reporter."""
+        self.reporter.message(msg, color, size)
 
     def validate(self, doc):
         """Validate a manifest before saving."""
-        if self.title_field is not None:
-            doc['title'] = self.title_field
-        if self.author_field is not None:
-            doc['author'] = self.author_field
+        if self.title_field is not None and self.title_field in doc:
+            doc['title'] = doc.pop(self.title_field)
+        if self.author_field is not None and self.author_field in doc:
+            doc['author'] = doc.pop(self.author_field)
         if self.content_field is not None:
-            doc['content'] = self.content_field            
+            doc['content'] = doc.pop(self.content_field, '')
         if 'namespace' not in doc:
             doc['namespace'] = 'we1sv2.0'
         if 'metapath' not in doc:
@@ -875,15 +1278,14 @@ class MongoDBImport():
         if 'pub' not in doc:
             doc['pub'] = 'unknown'
         if self.pub_date_field is not None:
-            pub_date = dateparser.parse(str(doc[self.pub_date_field]))
+            doc['pub_date'] = doc.pop(self.pub_date_field, '')
         if 'pub_date' not in doc or doc['pub_date'] == '':
             doc['pub_date'] = 'unknown'
         else:
-            pub_date = dateparser.parse(str(doc['pub_date']))
-            doc['pub_date'] = pub_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+            doc['pub_date'] = date_normalizer.normalize(doc['pub_date'])
         if 'pub_year' not in doc:
             if doc['pub_date'] != 'unknown':
-                doc['pub_year'] = pub_date[0:5]
+                doc['pub_year'] = doc['pub_date'][0:5]
             else:
                 doc['pub_year'] = 'unknown'
         return doc
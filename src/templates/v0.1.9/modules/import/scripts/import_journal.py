@@ -0,0 +1,181 @@
+"""import_journal.py.
+
+Records the progress of an import so that an interrupted import can be
+resumed instead of started again.
+
+The journal is saved as `_import_journal.jsonl` in the json directory. The
+first line identifies the import source (for instance, the path to the zip
+archive or the MongoDB query). Each following line records a completed
+source item: the zip member or document id, the manifest filename with the
+size and MD5 hash of the manifest that was written, or a flag showing that
+the item was skipped because it lacked the required phrase. Lines beginning
+with a `checkpoint` key store the position of a database cursor and the
+import counters. Records are buffered and appended to the journal every
+`checkpoint_interval` seconds, so at most a few seconds of work is lost if
+the import is interrupted.
+
+When an import is resumed, items are only skipped if their manifests still
+exist with the recorded size (and, with `verify='hash'`, the recorded hash).
+The journal is deleted when the import is complete.
+
+Sample Usage:
+
+```python
+journal = ImportJournal(json_dir, source=zip_file, resume=True)
+for member in members:
+    if journal.is_done(member):
+        continue
+    ...
+    journal.record(member, filename, len(data), hashlib.md5(data).hexdigest())
+journal.close(complete=True)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import hashlib
+import json
+import os
+import time
+
+# Constants
+JOURNAL_FILENAME = '_import_journal.jsonl'
+
+def md5_file(filepath):
+    """Return the MD5 hash of a file."""
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+class ImportJournal():
+    """Record completed import items and checkpoints in a journal file."""
+
+    def __init__(self, json_dir, source, resume=False, checkpoint_interval=5, verify='size'):
+        """Open the journal.
+
+        Parameters:
+        - json_dir (str): The directory where manifests are written and the journal is saved.
+        - source (str): A description of the import source. A journal for a different source is not resumed.
+        - resume (bool): Load the existing journal. If False, any existing journal is discarded.
+        - checkpoint_interval (float): The number of seconds between writes to the journal file.
+        - verify (str): 'size' to check the size of existing manifests or 'hash' to also check their MD5 hash.
+        """
+        self.json_dir = json_dir
+        self.journal_file = os.path.join(json_dir, JOURNAL_FILENAME)
+        self.source = str(source)
+        self.checkpoint_interval = checkpoint_interval
+        self.verify = verify
+        self.items = {} # item -> {'filename', 'size', 'md5'} or {'skipped': True}
+        self.checkpoint = None
+        self.buffer = []
+        self.last_write = time.time()
+        self.resumed_count = 0
+        self.skipped_count = 0
+        if resume:
+            self.load()
+        else:
+            self.remove()
+        if not os.path.exists(self.journal_file):
+            self.buffer.append({'source': self.source})
+            self.write()
+
+    def close(self, complete=False):
+        """Write any buffered records, deleting the journal if the import is complete."""
+        if complete:
+            self.remove()
+        else:
+            self.write()
+
+    def is_done(self, item):
+        """Check whether an item was completed in a previous run.
+
+        Saved items are only treated as done if the manifest still exists and matches the
+        recorded size (and hash, if `verify='hash'`). The numbers of resumed and skipped items
+        are counted in `resumed_count` and `skipped_count`.
+        """
+        record = self.items.get(str(item))
+        if record is None:
+            return False
+        if record.get('skipped'):
+            self.skipped_count += 1
+            return True
+        filepath = os.path.join(self.json_dir, record['filename'])
+        try:
+            if os.path.getsize(filepath) != record['size']:
+                return False
+            if self.verify == 'hash' and md5_file(filepath) != record['md5']:
+                return False
+        except OSError:
+            return False
+        self.resumed_count += 1
+        return True
+
+    def load(self):
+        """Load the records of an existing journal for the same source."""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = {}
+        if header.get('source') != self.source:
+            self.remove()
+            return
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be incomplete if the import was interrupted
+                continue
+            if 'checkpoint' in record:
+                self.checkpoint = record['checkpoint']
+            else:
+                self.items[record.pop('item')] = record
+
+    def record(self, item, filename, size, md5):
+        """Record the filename, size and MD5 hash of a manifest written for an item."""
+        record = {'filename': filename, 'size': size, 'md5': md5}
+        self.items[str(item)] = record
+        self.buffer.append(dict(record, item=str(item)))
+        self.write_if_due()
+
+    def record_checkpoint(self, checkpoint):
+        """Record a checkpoint, such as a cursor position and counters, and write the journal."""
+        self.checkpoint = checkpoint
+        self.buffer.append({'checkpoint': checkpoint})
+        self.write()
+
+    def record_skipped(self, item):
+        """Record an item which was skipped because it lacked the required phrase."""
+        self.items[str(item)] = {'skipped': True}
+        self.buffer.append({'item': str(item), 'skipped': True})
+        self.write_if_due()
+
+    def remove(self):
+        """Delete the journal file and discard buffered records."""
+        self.buffer = []
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+    def write(self):
+        """Append the buffered records to the journal file."""
+        if len(self.buffer) > 0:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                for record in self.buffer:
+                    f.write(json.dumps(record) + '\n')
+            self.buffer = []
+        self.last_write = time.time()
+
+    def write_due(self):
+        """Check whether `checkpoint_interval` seconds have passed since the last write."""
+        return time.time() - self.last_write >= self.checkpoint_interval
+
+    def write_if_due(self):
+        """Write the journal if `checkpoint_interval` seconds have passed since the last write."""
+        if self.write_due():
+            self.write()
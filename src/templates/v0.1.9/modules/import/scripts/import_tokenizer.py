@@ -11,6 +11,20 @@ tokenizer = ImportTokenizer(json_dir, language_model='en_core_web_sm',
 tokenizer.start(bagify_features=False, mode=None)
 ```
 
+With `method='we1s'`, the spaCy pipeline is loaded once and documents are
+streamed through `nlp.pipe` in batches of `batch_size`. Set `n_process` to
+a number greater than 1 to parse documents in several worker processes.
+
+If a `cache_file` is given, the features extracted by spaCy are saved in a
+`TokenCache` keyed by the hash of each document's content, and documents
+whose content has already been parsed with the same language model are not
+parsed again. The same cache file can be shared with the counting, topic
+modeling and metadata modules.
+
+With `start(save_features_table=True, features_format='compact')`, the
+`features` table is saved in the compact columnar format described in
+`compact_features.py` instead of as a list of lists.
+
 The tokenizer class follows the algorithm below:
 
 1. Skip tokenization if a `bag_of_words` field exists.
@@ -30,20 +44,17 @@ import json
 import os
 import re
 import sys
-import ipywidgets
 import spacy
 from spacy.tokenizer import Tokenizer
-from collections import Counter
 from IPython.display import clear_output, display, HTML
 from itertools import islice
-from natsort import natsorted
-from ipywidgets import HBox, IntProgress, Label
 
+from bag_of_words import bag_of_words, sort_bag, word_tokens
+from compact_features import encode_features, feature_values
+from progress import get_reporter
 from timer import Timer
-
-IntProgress(
-    description='Tokenizing...'
-)
+from token_cache import TokenCache, features_table
+from tokenizer_state import GENERATED_FIELDS, TokenizerState
 
 ## CONSTANTS
 LINEBREAK_REGEX = re.compile(r'((\r\n)|[\n\v])+')
@@ -58,30 +69,39 @@ class ImportTokenizer:
     """Configure an ImportTokenizer object."""
 
     def __init__(self, json_dir, language_model='en_core_web_sm',
-                log_file='tokenizer_log.txt'):
-        """Initialize the class."""
+                log_file='tokenizer_log.txt', batch_size=100, n_process=1,
+                cache_file=None, max_cache_bytes=1024 * 1024 * 1024, state_file=None):
+        """Initialize the class.
+
+        Parameters:
+        - cache_file (str): The path to a token cache database. If None, spaCy features are not cached.
+        - max_cache_bytes (int): The maximum size of the token cache.
+        - state_file (str): The path to the state file used by `start(incremental=True)`. Defaults to `_tokenizer_state.jsonl` in `json_dir`.
+        """
         self.json_dir = json_dir
         self.language_model = language_model
         self.log_file = log_file
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.nlp = None
+        self.cache = None
+        if cache_file is not None:
+            self.cache = TokenCache(cache_file, language_model, self.cache_options(), max_cache_bytes)
+        self.state_file = state_file
         self.tokenizer_errors = 0
         self.read_errors = 0
 
     def bagify(self, tokens, trim_punct=True):
-        """Convert a list of values to a dict of value frequencies.
+        """Convert a list of values to an unsorted dict of value frequencies.
 
         Parameters:
         - trim_punct (Bool): If True, strips attached punctuation that may have survived tokenisation.
         """
+        return bag_of_words(tokens, trim_punct=trim_punct)
 
-        # An attempt to strip predictably meaningless stray punctuation
-        punct = re.compile(r'\.\W|\W\.|^[\!\?\(\),;:\[\]\{\}]|[\!\?\(\),;:\[\]\{\}]$')
-        # Make sure we are working with a list of values
-        if trim_punct == True:
-            tokens = [re.sub(punct, '', token) for token in tokens]
-        else:
-            tokens = [token for token in tokens]
-        bag = dict(Counter(tokens))
-        return dict(natsorted(bag.items()))
+    def cache_options(self):
+        """Return the pipeline settings which identify this tokenizer's entries in the token cache."""
+        return {'pipeline': 'we1s', 'spacy': spacy.__version__}
 
     def custom_tokenizer(self):
         """Add custom tokenizer settings."""
@@ -94,6 +114,59 @@ class ImportTokenizer:
         """Return a list of tokens. from a spaCy doc."""
         return [token.text for token in spacy_doc]
 
+    def load_pipeline(self):
+        """Load the language model with custom tokenizer and entity merger.
+
+        The pipeline is only loaded the first time it is requested and is
+        then reused for every document.
+        """
+        if self.nlp is None:
+            self.nlp = spacy.load(self.language_model)
+            self.nlp.tokenizer = self.custom_tokenizer()
+            self.nlp.add_pipe(self.skip_ents, after='ner')
+        return self.nlp
+
+    def needs_parse(self, doc):
+        """Return True if the doc must be parsed by spaCy with the 'we1s' method."""
+        if not isinstance(doc, dict) or 'bag_of_words' in doc or 'features' in doc:
+            return False
+        return isinstance(doc.get('content'), str)
+
+    def pipe_manifests(self, manifests, batch_size=100, n_process=1):
+        """Stream manifests through the spaCy pipeline in batches.
+
+        Parameters:
+        - manifests (iterable): An iterable of (filename, doc) tuples.
+        - batch_size (int): The number of texts to buffer in each batch.
+        - n_process (int): The number of processes spaCy should use.
+
+        Yields (filename, doc, spacy_doc) tuples in the original order. Documents
+        which do not need to be parsed are passed through with an empty text and
+        a spacy_doc of None. If the token cache is used, the feature columns of
+        each document are yielded in place of the spacy_doc.
+        """
+        nlp = self.load_pipeline()
+        if self.cache is not None:
+            items = ((doc['content'] if self.needs_parse(doc) else None, (filename, doc))
+                     for filename, doc in manifests)
+            for columns, (filename, doc) in self.cache.pipe(items, nlp, batch_size=batch_size, n_process=n_process):
+                yield filename, doc, columns
+            return
+        kwargs = {'as_tuples': True, 'batch_size': batch_size}
+        if n_process is not None and n_process > 1:
+            kwargs['n_process'] = n_process
+        def texts():
+            for filename, doc in manifests:
+                if self.needs_parse(doc):
+                    yield doc['content'], (filename, doc, True)
+                else:
+                    yield '', (filename, doc, False)
+        for spacy_doc, (filename, doc, parsed) in nlp.pipe(texts(), **kwargs):
+            if parsed:
+                yield filename, doc, spacy_doc
+            else:
+                yield filename, doc, None
+
     def read_manifest(self, filepath):
         """Read the manifest file."""
         try:
@@ -104,6 +177,23 @@ class ImportTokenizer:
             with open(self.log_file, 'a') as f:
                 f.write('Read error: ' + os.path.basename(filepath) + '\n')
 
+    def read_manifests(self, files):
+        """Yield (filename, doc) tuples for a list of filenames in the json directory."""
+        for file in files:
+            yield file, self.read_manifest(self.json_dir + '/' + file)
+
+    def read_changed_manifests(self, files, state, fields):
+        """Yield (filename, doc) tuples for the manifests whose content or tokenizer settings have changed.
+
+        Stale fields generated in a previous run are removed from the yielded manifests. Manifests
+        which only had their modification time changed are recorded in the state and not yielded.
+        """
+        for file, doc in self.read_manifests(files):
+            if doc is None or state.prepare(file, doc, fields):
+                yield file, doc
+            else:
+                state.record(file, doc)
+
     # Custom entity merging filter
     def skip_ents(self, doc, skip=['CARDINAL', 'DATE', 'QUANTITY', 'TIME']):
         """Duplicate spaCy's ner pipe, but with additional filters.
@@ -129,43 +219,106 @@ class ImportTokenizer:
                     retokenizer.merge(ent, attrs=attrs)
         return doc
 
-    def start(self, bagify_features=False, save_features_table=False, method=None):
-        """Tokenize the files in the json directory."""
+    def start(self, bagify_features=False, save_features_table=False, method=None,
+              batch_size=None, n_process=None, reporter='jupyter', features_format='list', sort_bags=True,
+              incremental=False):
+        """Tokenize the files in the json directory.
+
+        With `incremental=True`, manifests which have not changed since they were last tokenized
+        with the same settings are not read or written, and manifests whose content has changed
+        are tokenized again. See `tokenizer_state.py`.
+
+        Parameters:
+        - features_format (str): Save `features` tables as a list of lists ('list') or in the compact format ('compact').
+        - batch_size (int): The number of documents per spaCy batch. Defaults to the object's `batch_size`.
+        - n_process (int): The number of spaCy processes. Defaults to the object's `n_process`.
+        - reporter (str or Reporter): Report progress as a progress bar ('jupyter'), on the console ('console') or not at all ('silent').
+        - sort_bags (bool): Sort each `bag_of_words` naturally by token before it is saved.
+        - incremental (bool): Only tokenize manifests which are new or have changed since the last incremental run.
+        """
         clear_output()
         timer = Timer()
         num_iters = 0
-        pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        percent = ipywidgets.HTML(value='0%')
-        display(HBox([Label('Tokenizing...'), pbar, percent]))
+        state = None
+        reporter = get_reporter(reporter)
+        reporter.start('Tokenizing...')
         if not os.path.exists(self.json_dir):
             raise ('Error: A json folder does not exist.')
         else:
             if save_features_table and method != 'we1s':
-                msg = 'Warning! Features tables can only be saved using the "we1s" method.'
-                display(HTML('<p style="color: red;">' + msg + '</p>'))
+                reporter.message('Warning! Features tables can only be saved using the "we1s" method.', 'red')
+            if batch_size is None:
+                batch_size = self.batch_size
+            if n_process is None:
+                n_process = self.n_process
             files = sorted(file for file in os.listdir(self.json_dir) if file.endswith('.json'))
-            for i, file in enumerate(files):
+            if incremental:
+                settings = self.tokenizer_settings(bagify_features, save_features_table, method,
+                                                   features_format, sort_bags)
+                fields = self.generated_fields(bagify_features, save_features_table, method)
+                state = TokenizerState(self.json_dir, settings, state_file=self.state_file)
+                # Skip unchanged manifests without reading them
+                files = [file for file in files if not state.is_current(file)]
+                manifests = self.read_changed_manifests(files, state, fields)
+            else:
+                manifests = self.read_manifests(files)
+            # Stream the manifests, parsing them in batches if spaCy is required
+            if method == 'we1s':
+                manifests = self.pipe_manifests(manifests, batch_size=batch_size, n_process=n_process)
+            else:
+                manifests = ((file, doc, None) for file, doc in manifests)
+            for i, (file, doc, parsed) in enumerate(manifests):
                 filepath = self.json_dir + '/' + file
-                doc = self.read_manifest(filepath)
-                doc = self.tokenize_doc(doc, file, i, bagify_features=bagify_features,
-                                        save_features_table=save_features_table,
-                                        method=method)
-                with open(filepath, 'w') as f:
-                    f.write(json.dumps(doc))
+                before = set(doc) if isinstance(doc, dict) else set()
+                if self.cache is not None:
+                    doc = self.tokenize_doc(doc, file, i, bagify_features=bagify_features,
+                                            save_features_table=save_features_table,
+                                            method=method, columns=parsed, features_format=features_format)
+                else:
+                    doc = self.tokenize_doc(doc, file, i, bagify_features=bagify_features,
+                                            save_features_table=save_features_table,
+                                            method=method, spacy_doc=parsed, features_format=features_format)
+                if doc is not None:
+                    added = [field for field in GENERATED_FIELDS if field in doc and field not in before]
+                    if sort_bags and 'bag_of_words' in doc and (state is None or 'bag_of_words' in added):
+                        doc['bag_of_words'] = sort_bag(doc['bag_of_words'])
+                    # In incremental mode, only manifests which have changed are saved
+                    if state is None or len(added) > 0 or len(state.dropped.get(file, [])) > 0:
+                        with open(filepath, 'w') as f:
+                            f.write(json.dumps(doc))
+                    if state is not None:
+                        state.record(file, doc, added)
                 this_iter = i + 1
-                progress = int(100. * this_iter/len(files))
-                pbar.value = progress
-                percent.value = '{0}%'.format(progress)
-        display(HTML('<h4>Done!</h4>'))
+                reporter.update(this_iter, len(files))
+            reporter.update(len(files), len(files), force=True)
+            reporter.finish()
+            if self.cache is not None:
+                self.cache.commit()
+            if state is not None:
+                state.close()
+        reporter.message('Done!', size=4)
+        if state is not None:
+            reporter.message(str(state.current_count) + ' unchanged document(s) were skipped without being read.')
+            if state.unchanged_count > 0:
+                reporter.message(str(state.unchanged_count) + ' modified document(s) had unchanged content and were not tokenized again.')
+            reporter.message(str(state.new_count) + ' new document(s) and ' + str(state.changed_count)
+                             + ' changed document(s) were tokenized.')
         if self.read_errors > 0 or self.tokenizer_errors > 0:
-            msg = ''
             if self.read_errors > 0:
-                msg += '<p style="color: red;">' + str(self.read_errors) + ' document(s) could not be read.</p>'
+                reporter.message(str(self.read_errors) + ' document(s) could not be read.', 'red')
             if self.tokenizer_errors > 0:
-                msg += '<p style="color: red;">' + str(self.tokenizer_errors) + ' document(s) could not be tokenized.</p>'
-            msg + '<p style="color: red;">Consult the log file for a list of filenames.</p>'
-            display(HTML(msg))
-        print('Time elapsed: %s' % timer.get_time_elapsed())
+                reporter.message(str(self.tokenizer_errors) + ' document(s) could not be tokenized.', 'red')
+            reporter.message('Consult the log file for a list of filenames.', 'red')
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+
+    def generated_fields(self, bagify_features, save_features_table, method):
+        """Return the fields that the tokenizer generates with the given settings."""
+        fields = []
+        if bagify_features:
+            fields.append('bag_of_words')
+        if save_features_table and method == 'we1s':
+            fields.append('features')
+        return fields
 
     def get_features_table(self):
         """Return a feature table as a list of lists."""
@@ -177,8 +330,22 @@ class ImportTokenizer:
             feature_list.append(token_features)
         return feature_list
         
-    def tokenize_doc(self, doc, filename, index, bagify_features=False, save_features_table=False, method=None):
-        """Tokenize a single file."""
+    def tokenizer_settings(self, bagify_features, save_features_table, method, features_format, sort_bags):
+        """Return the settings which determine the fields that the tokenizer generates."""
+        settings = {'bagify_features': bagify_features, 'save_features_table': save_features_table,
+                    'method': method, 'features_format': features_format, 'sort_bags': sort_bags}
+        if method == 'we1s':
+            settings['language_model'] = self.language_model
+            settings.update(self.cache_options())
+        return settings
+
+    def tokenize_doc(self, doc, filename, index, bagify_features=False, save_features_table=False, method=None,
+                     spacy_doc=None, columns=None, features_format='list'):
+        """Tokenize a single file.
+
+        If `spacy_doc` or cached feature `columns` are supplied, they are used instead of parsing the content again.
+        A new `features` table is saved in the compact format if `features_format` is 'compact'.
+        """
         try:
             # Look for bag_of_words, then features; otherwise, tokenise with spaCy
             if 'bag_of_words' in doc:
@@ -186,22 +353,32 @@ class ImportTokenizer:
             elif 'features' in doc and bagify_features == False:
                 pass
             elif 'features' in doc and bagify_features == True:
-                tokens = [feature[0] for feature in doc['features'][1:]]
+                tokens = feature_values(doc['features'], 'token')
                 doc['bag_of_words'] = self.bagify(tokens)
+            elif method == 'we1s' and self.cache is not None:
+                # Read the features from the token cache, parsing the content only if it is not cached
+                if columns is None:
+                    columns = self.cache.parse(doc['content'], self.load_pipeline())
+                if save_features_table:
+                    doc['features'] = features_table(columns)
+                    if features_format == 'compact':
+                        doc['features'] = encode_features(doc['features'])
+                if bagify_features:
+                    doc['bag_of_words'] = self.bagify(columns['text'])
             elif method == 'we1s':
-                # Load the language model with custom tokenizer and entity merger
-                self.nlp = spacy.load(self.language_model)
-                self.nlp.tokenizer = self.custom_tokenizer()
-                self.nlp.add_pipe(self.skip_ents, after='ner')
-                # Create a spaCy document, extract tokens, then bagify
-                self.spacy_doc = self.nlp(doc['content'])
+                # Create a spaCy document with the pipeline loaded once, extract tokens, then bagify
+                if spacy_doc is None:
+                    spacy_doc = self.load_pipeline()(doc['content'])
+                self.spacy_doc = spacy_doc
                 if save_features_table:
                     doc['features'] = self.get_features_table()
+                    if features_format == 'compact':
+                        doc['features'] = encode_features(doc['features'])
                 if bagify_features:
                     tokens = self.get_tokens(self.spacy_doc)
                     doc['bag_of_words'] = self.bagify(tokens)
             elif 'content' in doc:
-                tokens = [re.sub(r'\W+', '', token) for token in doc['content'].split()]
+                tokens = word_tokens(doc['content'])
                 if bagify_features:
                     doc['bag_of_words'] = self.bagify(tokens)
             else:
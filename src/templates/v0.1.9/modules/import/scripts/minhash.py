@@ -0,0 +1,153 @@
+"""minhash.py.
+
+Detects near-duplicate json manifests, such as wire-service stories
+reprinted with small edits, using MinHash signatures of shingled `content`
+fields and locality-sensitive hashing (LSH).
+
+Each document's content is lower-cased, split into alphanumeric tokens and
+converted to a set of overlapping word shingles. A MinHash signature of
+`num_perm` values estimates the Jaccard similarity between two shingle sets.
+Signatures are divided into `bands`, and only documents that share at least
+one identical band are compared, so the run time grows roughly linearly with
+the number of documents rather than quadratically. Candidate pairs are kept
+if their estimated similarity is at least `threshold`.
+
+Documents with identical signatures are linked to the first of them and
+only that representative is bucketed. Within a bucket, each document is
+compared with the bucket's representatives rather than with every other
+member, and pairs already joined through earlier matches are skipped, so
+large clusters of reprints do not produce every pairwise combination.
+
+Sample Usage:
+
+```python
+pairs = near_duplicate_pairs(filepaths, threshold=0.8, n_process=4)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import json
+import re
+import zlib
+import numpy as np
+from multiprocessing import Pool
+
+# Constants
+ALNUM_REGEX = re.compile(r'[^\W_]+')
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Worker settings
+worker_permutations = None
+worker_shingle_size = None
+
+def get_permutations(num_perm, seed=1):
+    """Return the (a, b) coefficients of `num_perm` random hash permutations."""
+    generator = np.random.RandomState(seed)
+    a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def shingle(content, shingle_size=5):
+    """Return an array of 32-bit hashes of the word shingles in a content string."""
+    tokens = ALNUM_REGEX.findall(content.lower())
+    if len(tokens) < shingle_size:
+        shingles = {' '.join(tokens)}
+    else:
+        shingles = {' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+    return np.array([zlib.crc32(item.encode('utf-8')) for item in shingles], dtype=np.uint64)
+
+def minhash(content, permutations, shingle_size=5):
+    """Return the MinHash signature of a content string as an array of 32-bit values."""
+    a, b = permutations
+    hashes = shingle(content, shingle_size)
+    values = (np.outer(a, hashes) + b[:, np.newaxis]) % MERSENNE_PRIME & MAX_HASH
+    return values.min(axis=1).astype(np.uint32)
+
+def init_minhash_worker(permutations, shingle_size):
+    """Store the hash permutations in a worker process."""
+    global worker_permutations, worker_shingle_size
+    worker_permutations = permutations
+    worker_shingle_size = shingle_size
+
+def minhash_json_file(filepath):
+    """Return the MinHash signature of a json file's content, or None if it has no content."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = json.load(f).get('content')
+    except (IOError, ValueError, AttributeError):
+        return None
+    if not isinstance(content, str) or content == '':
+        return None
+    return minhash(content, worker_permutations, worker_shingle_size)
+
+def near_duplicate_pairs(filepaths, threshold=0.8, num_perm=128, bands=32, shingle_size=5,
+                         n_process=1, seed=1):
+    """Return a list of [original filepath, near-duplicate filepath] pairs.
+
+    The pairs link every group of near-duplicates together, but pairs whose
+    documents are already joined through other matches are not listed.
+
+    Parameters:
+    - filepaths (list): The json files to compare. The first file in a pair is the earlier in this list.
+    - threshold (float): The minimum estimated Jaccard similarity for two documents to be duplicates.
+    - num_perm (int): The number of hash permutations in each signature.
+    - bands (int): The number of LSH bands. `num_perm` must be divisible by `bands`.
+    - shingle_size (int): The number of words in each shingle.
+    - n_process (int): The number of worker processes used to compute signatures.
+    - seed (int): The random seed used to generate the hash permutations.
+    """
+    if num_perm % bands != 0:
+        raise ValueError('num_perm must be divisible by bands.')
+    rows = num_perm // bands
+    permutations = get_permutations(num_perm, seed)
+    if n_process is not None and n_process > 1 and len(filepaths) > 1:
+        with Pool(n_process, initializer=init_minhash_worker, initargs=(permutations, shingle_size)) as pool:
+            signatures = pool.map(minhash_json_file, filepaths, chunksize=max(1, len(filepaths) // (n_process * 4)))
+    else:
+        init_minhash_worker(permutations, shingle_size)
+        signatures = [minhash_json_file(filepath) for filepath in filepaths]
+    # Link documents with identical signatures to the first of them
+    parents = list(range(len(filepaths)))
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+    matches = []
+    representatives = {}
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        key = signature.tobytes()
+        if key in representatives:
+            parents[i] = representatives[key]
+            matches.append((representatives[key], i))
+        else:
+            representatives[key] = i
+    # Bucket the representatives by each band of their signatures
+    buckets = {}
+    for i in representatives.values():
+        signature = signatures[i]
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            buckets.setdefault(key, []).append(i)
+    # Compare each bucket member with the bucket's representatives
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        bucket_representatives = []
+        for j in members:
+            for i in bucket_representatives:
+                root_i, root_j = find(i), find(j)
+                if root_i == root_j:
+                    break
+                if np.mean(signatures[i] == signatures[j]) >= threshold:
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
+                    matches.append((i, j))
+                    break
+            else:
+                bucket_representatives.append(j)
+    return [[filepaths[i], filepaths[j]] for i, j in sorted(matches)]
@@ -0,0 +1,127 @@
+"""phrase_filter.py.
+
+Tests documents for one or more required phrases. A `PhraseFilter` can
+check the raw bytes of a json manifest before it is decoded and parsed, so
+that documents which cannot contain the phrases are skipped cheaply.
+
+The byte-level `prefilter()` searches for every form in which a phrase can
+appear inside a json string: its UTF-8 bytes, its escaped form when
+`json.dumps()` is used with or without `ensure_ascii`, and the same forms
+with escaped forward slashes or upper-case `\\uXXXX` escapes. If the optional
+`pyahocorasick` package is installed, all the patterns are found in a single
+pass with an Aho-Corasick automaton. Otherwise, each pattern is searched for
+with `bytes.find()`. The prefilter may accept a document because a phrase
+occurs in a field other than `content`, so accepted documents should be
+confirmed with `match()` after they are parsed.
+
+Sample Usage:
+
+```python
+phrase_filter = PhraseFilter(['humanities', 'liberal arts'], mode='any')
+if phrase_filter.prefilter(raw_bytes):
+    doc = json.loads(raw_bytes)
+    if phrase_filter.match(doc['content']):
+        ...
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import json
+import re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Constants
+UNICODE_ESCAPE_REGEX = re.compile(r'\\u[0-9a-f]{4}')
+
+def json_string_forms(phrase):
+    """Return the set of byte strings that can represent a phrase inside a json string."""
+    forms = set()
+    for ensure_ascii in [True, False]:
+        escaped = json.dumps(phrase, ensure_ascii=ensure_ascii)[1:-1]
+        forms.add(escaped)
+        forms.add(UNICODE_ESCAPE_REGEX.sub(lambda match: match.group(0).upper().replace('\\U', '\\u'), escaped))
+    forms.update([form.replace('/', '\\/') for form in forms])
+    return set(form.encode('utf-8') for form in forms)
+
+class PhraseFilter():
+    """Test documents for any or all of a list of required phrases."""
+
+    def __init__(self, phrases, mode='any'):
+        """Initialise the filter.
+
+        Parameters:
+        - phrases (str or list): The required phrase or phrases.
+        - mode (str): 'any' to accept documents containing at least one phrase or 'all' to require every phrase.
+        """
+        if isinstance(phrases, str):
+            phrases = [phrases]
+        if mode not in ['any', 'all']:
+            raise ValueError('The required phrase mode must be "any" or "all".')
+        self.phrases = list(phrases)
+        self.mode = mode
+        self.build()
+
+    def __getstate__(self):
+        """Pickle the phrases and mode only, so that the filter can be sent to worker processes."""
+        return {'phrases': self.phrases, 'mode': self.mode}
+
+    def __setstate__(self, state):
+        """Rebuild the patterns in a worker process."""
+        self.phrases = state['phrases']
+        self.mode = state['mode']
+        self.build()
+
+    def build(self):
+        """Build the byte patterns for each phrase and, if available, the Aho-Corasick automaton."""
+        self.patterns = [] # (bytes, phrase index)
+        for i, phrase in enumerate(self.phrases):
+            for form in json_string_forms(phrase):
+                self.patterns.append((form, i))
+        self.automaton = None
+        if ahocorasick is not None:
+            # Bytes are mapped one-to-one onto latin-1 characters for the automaton
+            self.automaton = ahocorasick.Automaton()
+            for form, i in self.patterns:
+                key = form.decode('latin-1')
+                indexes = self.automaton.get(key, set())
+                indexes.add(i)
+                self.automaton.add_word(key, indexes)
+            self.automaton.make_automaton()
+
+    def match(self, content):
+        """Return True if a decoded content string contains any or all of the phrases."""
+        if self.mode == 'any':
+            return any(phrase in content for phrase in self.phrases)
+        return all(phrase in content for phrase in self.phrases)
+
+    def prefilter(self, data):
+        """Return False if the raw bytes of a json document cannot contain the phrases."""
+        required = len(self.phrases) if self.mode == 'all' else 1
+        found = set()
+        if self.automaton is not None:
+            for _, indexes in self.automaton.iter(data.decode('latin-1')):
+                found.update(indexes)
+                if len(found) >= required:
+                    return True
+            return False
+        for form, i in self.patterns:
+            if i not in found and data.find(form) != -1:
+                found.add(i)
+                if len(found) >= required:
+                    return True
+        return False
+
+    def regex_query(self, field='content'):
+        """Return a MongoDB query selecting documents whose `field` contains any or all of the phrases."""
+        conditions = [{field: {'$regex': re.escape(phrase)}} for phrase in self.phrases]
+        if len(conditions) == 1:
+            return conditions[0]
+        if self.mode == 'any':
+            return {'$or': conditions}
+        return {'$and': conditions}
@@ -0,0 +1,196 @@
+"""tokenizer_state.py.
+
+Records which manifests have been tokenized, and with which settings, so that
+the import tokenizer only reads and rewrites manifests which are new or have
+changed since the last run.
+
+The state is saved as `_tokenizer_state.jsonl` in the json directory. Each
+line records a manifest: its filename, modification time and size after the
+tokenizer last saw it, the SHA-1 hash of its `content` field, a hash of the
+tokenizer settings, and the fields (`bag_of_words`, `features`) that the
+tokenizer generates. When a manifest is first recorded, any of these fields
+that it already has, for instance from a run of the tokenizer without a state
+file, are recorded as generated. Later lines replace earlier lines for the same file.
+Records are buffered and appended every `checkpoint_interval` seconds, and
+the file is rewritten with one line per manifest when the state is closed.
+
+A manifest is skipped without being read if its modification time and size
+are unchanged and it was tokenized with the same settings. If it was
+modified, it is read. If its content changed, all of the generated fields
+are dropped, since they describe the old content, and rebuilt. If only the
+settings changed, the recorded fields that the new settings generate are
+dropped and rebuilt.
+
+Sample Usage:
+
+```python
+state = TokenizerState(json_dir, settings)
+for filename in files:
+    if state.is_current(filename):
+        continue
+    doc = read(filename)
+    if state.prepare(filename, doc, ['bag_of_words']):
+        doc['bag_of_words'] = ...
+        save(doc)
+        state.record(filename, doc, added=['bag_of_words'])
+    else:
+        state.record(filename, doc)
+state.close()
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import hashlib
+import json
+import os
+import time
+
+# Constants
+STATE_FILENAME = '_tokenizer_state.jsonl'
+GENERATED_FIELDS = ['bag_of_words', 'features']
+
+def settings_key(settings):
+    """Return a hash of a dict of tokenizer settings."""
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def content_hash(doc):
+    """Return the SHA-1 hash of a manifest's `content` field, or None if it has no content."""
+    if not isinstance(doc, dict) or not isinstance(doc.get('content'), str):
+        return None
+    return hashlib.sha1(doc['content'].encode('utf-8')).hexdigest()
+
+class TokenizerState():
+    """Track the manifests tokenized by the import tokenizer in a state file."""
+
+    def __init__(self, json_dir, settings, state_file=None, checkpoint_interval=5):
+        """Load the state file.
+
+        Parameters:
+        - json_dir (str): The directory containing the manifests.
+        - settings (dict): The tokenizer settings. Manifests tokenized with other settings are tokenized again.
+        - state_file (str): The path to the state file. Defaults to `_tokenizer_state.jsonl` in `json_dir`.
+        - checkpoint_interval (float): The number of seconds between writes to the state file.
+        """
+        self.json_dir = json_dir
+        self.state_file = state_file if state_file is not None else os.path.join(json_dir, STATE_FILENAME)
+        self.settings = settings_key(settings)
+        self.checkpoint_interval = checkpoint_interval
+        self.files = {} # filename -> {'mtime', 'size', 'content', 'settings', 'generated'}
+        self.dropped = {} # filename -> fields deleted by `prepare()`
+        self.buffer = []
+        self.last_write = time.time()
+        self.current_count = 0
+        self.unchanged_count = 0
+        self.changed_count = 0
+        self.new_count = 0
+        self.load()
+
+    def close(self):
+        """Rewrite the state file with a single record for each manifest that still exists."""
+        records = [dict(record, filename=filename) for filename, record in sorted(self.files.items())
+                   if os.path.exists(os.path.join(self.json_dir, filename))]
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(temp_file, self.state_file)
+        self.buffer = []
+        self.last_write = time.time()
+
+    def is_current(self, filename):
+        """Check whether a manifest is unchanged since it was tokenized with the current settings.
+
+        Only the modification time and size of the file are checked, so the file is not read.
+        Skipped manifests are counted in `current_count`.
+        """
+        record = self.files.get(filename)
+        if record is None or record['settings'] != self.settings:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.json_dir, filename))
+        except OSError:
+            return False
+        if stat.st_mtime_ns != record['mtime'] or stat.st_size != record['size']:
+            return False
+        self.current_count += 1
+        return True
+
+    def load(self):
+        """Load the records of an existing state file."""
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if the tokenizer was interrupted
+                    continue
+                self.files[record.pop('filename')] = record
+
+    def prepare(self, filename, doc, fields):
+        """Check whether a modified manifest must be tokenized again, and drop its stale fields.
+
+        If the content has changed, every generated field in `GENERATED_FIELDS` is deleted,
+        including fields which were in the manifest before it was first recorded. If only the settings have changed, the generated fields listed in
+        `fields`, which the current settings will build again, are deleted. New, changed and
+        unchanged manifests are counted in `new_count`, `changed_count` and `unchanged_count`.
+
+        Parameters:
+        - filename (str): The manifest filename.
+        - doc (dict): The manifest.
+        - fields (list): The fields that the tokenizer will generate with the current settings.
+        """
+        record = self.files.get(filename)
+        if record is None:
+            self.new_count += 1
+            return True
+        if record['content'] != content_hash(doc):
+            stale = GENERATED_FIELDS
+        elif record['settings'] != self.settings:
+            stale = [field for field in record['generated'] if field in fields]
+        else:
+            self.unchanged_count += 1
+            return False
+        self.changed_count += 1
+        if isinstance(doc, dict):
+            self.dropped[filename] = [field for field in stale if doc.pop(field, None) is not None]
+        return True
+
+    def record(self, filename, doc, added=None):
+        """Record the current modification time, size and content hash of a manifest.
+
+        Parameters:
+        - filename (str): The manifest filename.
+        - doc (dict): The manifest as it was saved.
+        - added (list): The fields added by the tokenizer in this run.
+        """
+        try:
+            stat = os.stat(os.path.join(self.json_dir, filename))
+        except OSError:
+            return
+        previous = self.files.get(filename)
+        dropped = self.dropped.pop(filename, [])
+        if previous is not None:
+            generated = [field for field in previous['generated'] if field not in dropped]
+        else:
+            # Fields already in the manifest when it is first recorded describe its content too
+            generated = [field for field in GENERATED_FIELDS if isinstance(doc, dict) and field in doc]
+        generated += [field for field in (added or []) if field not in generated]
+        record = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'content': content_hash(doc),
+                  'settings': self.settings, 'generated': generated}
+        self.files[filename] = record
+        self.buffer.append(dict(record, filename=filename))
+        if time.time() - self.last_write >= self.checkpoint_interval:
+            self.write()
+
+    def write(self):
+        """Append the buffered records to the state file."""
+        if len(self.buffer) > 0:
+            with open(self.state_file, 'a', encoding='utf-8') as f:
+                for record in self.buffer:
+                    f.write(json.dumps(record) + '\n')
+            self.buffer = []
+        self.last_write = time.time()
@@ -0,0 +1,305 @@
+"""corpus_store.py.
+
+Generates a `CorpusStore` object which packs a project's json manifests into
+a small number of files, as an alternative to one json file per document.
+
+Manifests are stored one per line in sharded JSON Lines files (`shard-00000.jsonl`,
+`shard-00001.jsonl`, etc.), each holding up to `shard_size` documents. An index
+file (`index.tsv`) records the filename, shard number, byte offset and length of
+each manifest, so that documents can be streamed in order, read individually by
+filename without parsing the rest of the shard, and returned with only selected
+fields.
+
+The store can be filled from, or exported to, a project's `json` folder. Code
+which expects a `json` folder can be used with a store through
+`store.json_dir()`, which writes the selected manifests to a temporary folder
+and deletes it afterwards. When the `with` block ends without an error,
+manifests which were changed or added in the folder are written back to the
+store and deleted manifests are removed from it, so functions which modify the
+folder, such as the import tokenizer, keep their changes. Pass
+`write_back=False` to use the folder read-only.
+
+Sample Usage:
+
+```python
+store = CorpusStore('project_data/corpus_store')
+store.import_json_dir('project_data/json')
+for doc in store.stream(fields=['name', 'pub_date']):
+    print(doc)
+doc = store.get('doc1.json')
+with store.json_dir() as json_dir:
+    docs = Documents(project_dir, json_dir=json_dir)
+```
+
+Last update: 2021-03-08
+"""
+
+# Python imports
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+# Constants
+INDEX_FILENAME = 'index.tsv'
+SHARD_TEMPLATE = 'shard-{0:05d}.jsonl'
+
+class CorpusStore():
+    """Read and write json manifests in sharded JSON Lines files with an offset index."""
+
+    def __init__(self, store_dir, shard_size=10000):
+        """Initialise the store and load its index, if it exists.
+
+        Parameters:
+        - store_dir (str): The directory containing the shards and index.
+        - shard_size (int): The maximum number of manifests written to each shard.
+        """
+        self.store_dir = store_dir
+        self.shard_size = shard_size
+        self.index_file = os.path.join(store_dir, INDEX_FILENAME)
+        self.index = {} # filename -> (shard, offset, length)
+        self.shard_counts = {} # shard -> number of manifests written to it
+        self.handles = {} # shard -> open file handle for reading
+        self.writer = None
+        self.writer_shard = None
+        self.write_back_errors = [] # Files in the last `json_dir()` folder which could not be saved
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.load_index()
+
+    def __contains__(self, filename):
+        """Check whether a manifest is in the store."""
+        return filename in self.index
+
+    def __enter__(self):
+        """Return the store."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Save the index and close any open files."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of manifests in the store."""
+        return len(self.index)
+
+    # Private methods
+    def _open_shard(self, shard):
+        """Return a read handle for a shard, opening it if necessary."""
+        if shard not in self.handles:
+            self.handles[shard] = open(os.path.join(self.store_dir, SHARD_TEMPLATE.format(shard)), 'rb')
+        return self.handles[shard]
+
+    def _project(self, doc, fields):
+        """Return a doc with only the selected fields."""
+        if fields is None:
+            return doc
+        return {field: doc[field] for field in fields if field in doc}
+
+    # Public methods
+    def add(self, doc, filename=None):
+        """Append a manifest to the store.
+
+        The filename defaults to the manifest's `name` with a `.json` extension. If the
+        filename is already in the store, the index is updated to point to the new copy, and
+        the old copy is left unused in its shard.
+        """
+        if filename is None:
+            filename = doc['name'] + '.json'
+        # Start a new shard when the current one is full
+        if self.writer is None or self.shard_counts.get(self.writer_shard, 0) >= self.shard_size:
+            if self.writer is not None:
+                self.writer.close()
+            self.writer_shard = max(self.shard_counts.keys(), default=-1)
+            if self.writer_shard < 0 or self.shard_counts[self.writer_shard] >= self.shard_size:
+                self.writer_shard += 1
+            self.writer = open(os.path.join(self.store_dir, SHARD_TEMPLATE.format(self.writer_shard)), 'ab')
+            # Discard any read handle, which may not see the appended data
+            handle = self.handles.pop(self.writer_shard, None)
+            if handle is not None:
+                handle.close()
+        line = json.dumps(doc).encode('utf-8') + b'\n'
+        offset = self.writer.tell()
+        self.writer.write(line)
+        self.index[filename] = (self.writer_shard, offset, len(line))
+        self.shard_counts[self.writer_shard] = self.shard_counts.get(self.writer_shard, 0) + 1
+
+    def close(self):
+        """Save the index and close any open files."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.save_index()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles = {}
+
+    def export_json_dir(self, json_dir, filenames=None, fields=None):
+        """Write manifests from the store to a directory of json files.
+
+        Parameters:
+        - json_dir (str): The directory to write to. It is created if necessary.
+        - filenames (list): The manifests to export. Defaults to all manifests.
+        - fields (list): The fields to export. Defaults to all fields.
+
+        Returns a dict of the MD5 hash of each file written.
+        """
+        if not os.path.exists(json_dir):
+            os.makedirs(json_dir)
+        hashes = {}
+        for filename, doc in self.items(filenames, fields):
+            data = json.dumps(doc).encode('utf-8')
+            with open(os.path.join(json_dir, filename), 'wb') as f:
+                f.write(data)
+            hashes[filename] = hashlib.md5(data).hexdigest()
+        return hashes
+
+    def filenames(self):
+        """Return the filenames in the store in shard and offset order."""
+        return sorted(self.index, key=lambda filename: self.index[filename][0:2])
+
+    def get(self, filename, fields=None):
+        """Return a manifest by filename, optionally with only the selected fields."""
+        if self.writer is not None:
+            self.writer.flush()
+        shard, offset, length = self.index[filename]
+        handle = self._open_shard(shard)
+        handle.seek(offset)
+        return self._project(json.loads(handle.read(length).decode('utf-8')), fields)
+
+    def get_file_list(self, start=0, end=None):
+        """Get a list of the filenames in the store, in the order they were added."""
+        return self.filenames()[start:end]
+
+    def import_json_dir(self, json_dir, filenames=None):
+        """Add the json files in a directory to the store and save the index.
+
+        Returns a list of the files which could not be read.
+        """
+        errors = []
+        if filenames is None:
+            filenames = sorted(file for file in os.listdir(json_dir) if file.endswith('.json'))
+        for filename in filenames:
+            try:
+                with open(os.path.join(json_dir, filename), 'r') as f:
+                    doc = json.loads(f.read())
+            except (IOError, ValueError):
+                errors.append(filename)
+                continue
+            self.add(doc, filename)
+        self.save_index()
+        return errors
+
+    def items(self, filenames=None, fields=None):
+        """Yield (filename, manifest) tuples, reading each shard sequentially.
+
+        Parameters:
+        - filenames (list): The manifests to return. Defaults to all manifests.
+        - fields (list): The fields to return. Defaults to all fields.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        if filenames is None:
+            filenames = self.filenames()
+        else:
+            filenames = sorted((filename for filename in filenames if filename in self.index),
+                               key=lambda filename: self.index[filename][0:2])
+        for filename in filenames:
+            shard, offset, length = self.index[filename]
+            handle = self._open_shard(shard)
+            # Sequential reads only need a seek when a stale copy is skipped
+            if handle.tell() != offset:
+                handle.seek(offset)
+            yield filename, self._project(json.loads(handle.read(length).decode('utf-8')), fields)
+
+    @contextmanager
+    def json_dir(self, filenames=None, fields=None, write_back=True):
+        """Provide a temporary json directory containing manifests from the store.
+
+        This allows functions which read or modify a project's `json` folder to be used without
+        changes. If the `with` block ends without an error and `write_back` is True, the changes
+        made to the folder are saved to the store with `update_from_json_dir()`. The directory is
+        deleted when the `with` block ends.
+
+        Parameters:
+        - filenames (list): The manifests to export. Defaults to all manifests.
+        - fields (list): The fields to export. Defaults to all fields.
+        - write_back (bool): Save changed, added and deleted manifests to the store. If False, changes to the folder are discarded.
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            hashes = self.export_json_dir(temp_dir, filenames, fields)
+            yield temp_dir
+            if write_back:
+                self.write_back_errors = self.update_from_json_dir(temp_dir, hashes, fields)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def load_index(self):
+        """Load the index file."""
+        self.index = {}
+        self.shard_counts = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for row in csv.reader(f, dialect='excel-tab'):
+                    if len(row) != 4:
+                        continue
+                    shard = int(row[1])
+                    self.index[row[0]] = (shard, int(row[2]), int(row[3]))
+                    self.shard_counts[shard] = self.shard_counts.get(shard, 0) + 1
+
+    def save_index(self):
+        """Write the index file."""
+        if self.writer is not None:
+            self.writer.flush()
+        with open(self.index_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect='excel-tab')
+            for filename in self.filenames():
+                shard, offset, length = self.index[filename]
+                writer.writerow([filename, shard, offset, length])
+
+    def update_from_json_dir(self, json_dir, hashes, fields=None):
+        """Save the changes made to a folder written by `export_json_dir()` and save the index.
+
+        Files whose MD5 hash differs from `hashes` and new files are added to the store. If only
+        some `fields` were exported, the changed manifest is merged with the stored manifest, so
+        the fields which were not exported are kept. Manifests whose files were deleted are
+        removed from the index. Returns a list of the files which could not be read.
+
+        Parameters:
+        - json_dir (str): The folder.
+        - hashes (dict): The MD5 hashes returned by `export_json_dir()`.
+        - fields (list): The fields which were exported. Defaults to all fields.
+        """
+        errors = []
+        current = set(file for file in os.listdir(json_dir) if file.endswith('.json'))
+        for filename in sorted(current):
+            with open(os.path.join(json_dir, filename), 'rb') as f:
+                data = f.read()
+            if hashes.get(filename) == hashlib.md5(data).hexdigest():
+                continue
+            try:
+                doc = json.loads(data.decode('utf-8'))
+            except ValueError:
+                errors.append(filename)
+                continue
+            if fields is not None and filename in self.index:
+                stored = self.get(filename)
+                # Fields which were exported but are no longer in the file have been deleted
+                for field in fields:
+                    stored.pop(field, None)
+                stored.update(doc)
+                doc = stored
+            self.add(doc, filename)
+        for filename in set(hashes) - current:
+            self.index.pop(filename, None)
+        self.save_index()
+        return errors
+
+    def stream(self, filenames=None, fields=None):
+        """Yield manifests in the order they are stored, optionally with only the selected fields."""
+        for _, doc in self.items(filenames, fields):
+            yield doc
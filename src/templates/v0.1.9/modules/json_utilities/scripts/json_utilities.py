@@ -3,6 +3,10 @@
 Generates a `Documents` object with methods for accessing the contents of 
 project's `json` folder.
 
+Progress is reported with a progress bar by default. Pass `reporter='console'`
+or `reporter='silent'` to the object or to a method to report progress on the
+console or not at all.
+
 Last update: 2021-01-29
 """
 
@@ -14,14 +18,14 @@ import operator
 import re
 import shutil
 import tempfile
-import ipywidgets
 import pandas as pd
 import qgrid
 from IPython.display import clear_output, display, HTML
-from ipywidgets import HBox, IntProgress, Label
 from natsort import natsorted
 from time import time
 
+from progress import get_reporter
+
 # Constants
 OPERATORS = {
     "<": operator.lt,
@@ -73,9 +77,10 @@ def regex_match(doc_field, filter_val):
 class Documents():
     """Search class."""
 
-    def __init__(self, project_dir, data_dir='project_data', json_dir='json'):
+    def __init__(self, project_dir, data_dir='project_data', json_dir='json', reporter='jupyter'):
         """Initialise a search."""
         self.project_dir = project_dir
+        self.reporter = reporter # 'jupyter', 'console', 'silent' or a Reporter object
         self.data_dir = os.path.join(self.project_dir, data_dir)
         self.json_dir = os.path.join(self.data_dir, json_dir)
         self.count = self.count_docs()
@@ -120,9 +125,15 @@ class Documents():
                     hits.append(filename)
         return list(set(hits))
 
+    def _get_reporter(self, reporter=None):
+        """Return the reporter for a method call, defaulting to the object's reporter."""
+        if reporter is None:
+            reporter = self.reporter
+        return get_reporter(reporter)
+
     def _show_error(self, msg):
         """Show an error."""
-        display(HTML('<p style="color: red;">' + msg + '</p>'))
+        self._get_reporter().message(msg, 'red')
 
     # Public methods
     def count_docs(self, file_list=None):
@@ -132,15 +143,14 @@ class Documents():
         else:
             return len(file_list)
 
-    def export(self, docs, zip_filepath='export.zip', text_only=False):
+    def export(self, docs, zip_filepath='export.zip', text_only=False, reporter=None):
         """Create a zip archive of a list of documents."""
         clear_output()
         timer = Timer()
         # Set up the progress bar
         step = 0
-        export_pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        export_percent = ipywidgets.HTML(value='0%')
-        display(HBox([Label('Progress:'), export_pbar, export_percent]))
+        reporter = self._get_reporter(reporter)
+        reporter.start('Progress:')
         with tempfile.TemporaryDirectory() as temp_dir:
             for file in docs:
                 if text_only == True:
@@ -151,39 +161,42 @@ class Documents():
                 else:
                     shutil.copy(os.path.join(self.json_dir, file), os.path.join(temp_dir, file))
                 # Keep track of progress
-                export_progress = int(100. * step/len(docs))
-                export_pbar.value = export_progress
-                export_percent.value = '{0}%'.format(export_progress)
+                reporter.update(step, len(docs))
                 step = step + 1
             destination_dir = os.path.split(zip_filepath)[0]
             if destination_dir != '' and not os.path.exists(destination_dir):
                 os.makedirs(destination_dir)
             make_archive(temp_dir, zip_filepath)
-        export_pbar.value = 100
-        export_percent.value = '{0}%'.format(100)
-        display(HTML('<p style="color: green;">Export complete.</p>'))
-        print('Time elapsed: %s' % timer.get_time_elapsed())
+        reporter.update(1, 1, force=True)
+        reporter.finish()
+        reporter.message('Export complete.', 'green')
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
         
-    def find(self, docs, query, lower_case=False):
-        """Iterate through the document list and return query results."""
+    def find(self, docs, query, lower_case=False, reporter=None):
+        """Iterate through the document list and return query results.
+
+        Parameters:
+        - docs (list): The filenames to search.
+        - query (tuple, dict or list): The query or list of queries.
+        - lower_case (bool): Convert string fields to lower case before matching.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'. Defaults to the object's reporter.
+        """
         clear_output()
         hits = []
         if not isinstance(query, list):
             query = [query]
         # Set up the progress bar
         step = 1
-        pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        percent = ipywidgets.HTML(value='0%')
-        display(HBox([Label('Progress:'), pbar, percent]))
+        reporter = self._get_reporter(reporter)
+        reporter.start('Progress:')
         for filename in docs:
             doc = self.read(filename)
             for result in self._perform_queries(doc, filename, query):
                 hits.append(result)
             # Keep track of progress
-            progress = int(100. * step/len(docs))
-            pbar.value = progress
-            percent.value = '{0}%'.format(progress)
+            reporter.update(step, len(docs))
             step = step + 1
+        reporter.finish()
         result = list(set(hits))
         if len(result) == 0:
             self._show_error('Your query returned no results.')
@@ -194,24 +207,22 @@ class Documents():
         """Get a list of files from the json_dir."""
         return [file for file in os.listdir(self.json_dir) if file.endswith('json')][start:end]
     
-    def get_table(self, docs, columns):
+    def get_table(self, docs, columns, reporter=None):
         """Iterate through the document list and return docs in a dataframe."""
         clear_output()
         df = pd.DataFrame(columns=columns)
         # Set up the progress bar
         step = 1
-        pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        percent = ipywidgets.HTML(value='0%')
-        display(HBox([Label('Progress:'), pbar, percent]))
+        reporter = self._get_reporter(reporter)
+        reporter.start('Progress:')
         for filename in docs:
             doc = self.read(filename)
             dict_fields = {k: v for k, v in doc.items() if k in columns}
             df = df.append(dict_fields, ignore_index=True)
             # Keep track of progress
-            progress = int(100. * step/len(docs))
-            pbar.value = progress
-            percent.value = '{0}%'.format(progress)
+            reporter.update(step, len(docs))
             step = step + 1
+        reporter.finish()
         df.fillna('', inplace=True)
         qgrid_widget = qgrid.show_grid(df, grid_options=qgrid_options, show_toolbar=False)
         if df.shape[0] > 0:
@@ -229,14 +240,13 @@ class Documents():
             display(HTML('<p style="color: red;">Could not find the file. Make sure that you have provided a correct filename in the <code>doc = docs.read()</code> line above.</p>'))
             return {'content': 'File not found.'}
 
-    def get_metadata_keys(self, start=0, end=None, file_list=None):
+    def get_metadata_keys(self, start=0, end=None, file_list=None, reporter=None):
         """Get the keys for every doc in a list of files."""
         clear_output()
         # Set up the progress bar
         step = 1
-        pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        percent = ipywidgets.HTML(value='0%')
-        display(HBox([Label('Progress:'), pbar, percent]))
+        reporter = self._get_reporter(reporter)
+        reporter.start('Progress:')
         if file_list is None:
             file_list = self.get_file_list(start, end)
         else:
@@ -248,10 +258,9 @@ class Documents():
             for key in list(doc.keys()):
                 keys.add(key)
             # Keep track of progress
-            progress = int(100. * step/len(file_list))
-            pbar.value = progress
-            percent.value = '{0}%'.format(progress)
+            reporter.update(step, len(file_list))
             step = step + 1
+        reporter.finish()
         return natsorted(list(keys))
 
 class Timer:
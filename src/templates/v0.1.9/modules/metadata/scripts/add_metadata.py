@@ -13,23 +13,27 @@ Last update: 2021-02-17.
 import json
 import os
 import pandas as pd
-import ipywidgets
-from IPython.display import display, HTML
-from ipywidgets import HBox, IntProgress, Label
+
+from progress import get_reporter
 
 class Metadata():
     """Metadata object which can be used to update json files."""
 
-    def __init__(self, filepath, json_dir):
-        """Initialise the object."""
+    def __init__(self, filepath, json_dir, reporter='jupyter'):
+        """Initialise the object.
+
+        Parameters:
+        - filepath (str): The path to the metadata csv or json file.
+        - json_dir (str): The path to the project's json folder.
+        - reporter (str or Reporter): Report progress as a progress bar ('jupyter'), on the console ('console') or not at all ('silent').
+        """
         self.filepath = filepath
         self.json_dir = json_dir
         self.no_filename = []
         self.no_corresponding_file = []
-        self.pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-        self.percent = ipywidgets.HTML(value='0%')
+        self.reporter = get_reporter(reporter)
         self.metadata = self._load_metadata_file()
-        display(HTML('<p style-"green;">Metadata file loaded.</p>'))
+        self.reporter.message('Metadata file loaded.', 'green')
 
     def _get_filename(self, row, filename=None):
         """Get the filename referenced in the row.
@@ -64,12 +68,15 @@ class Metadata():
         with open(os.path.join(self.json_dir, filename), 'w') as f:
             f.write(json.dumps(doc))
 
-    def add(self):
-        """Add the new metadata."""
-        hbox = HBox([Label('Getting records...'), self.pbar, self.percent])
-        display(hbox)
+    def add(self, reporter=None):
+        """Add the new metadata.
+
+        Parameters:
+        - reporter (str or Reporter): Overrides the object's reporter for this call: 'jupyter', 'console' or 'silent'.
+        """
+        reporter = get_reporter(reporter) if reporter is not None else self.reporter
         records = self.metadata.to_dict(orient='records')
-        hbox.children = [Label('Adding records...'), self.pbar, self.percent]
+        reporter.start('Adding records...')
         num_records = len(records)
         num_added = 0
         for i, row in enumerate(records):
@@ -86,22 +93,15 @@ class Metadata():
                     self.no_corresponding_file.append(filename)
             else:
                 self.no_filename.append(row)
-            progress = int(100. * this_iter/num_records)
-            self.pbar.value = progress
-            self.percent.value = '{0}%'.format(progress)
-        display(HTML('<p style="color:green;">' + str(num_added) + ' records have been added.</p>'))
+            reporter.update(this_iter, num_records)
+        reporter.finish()
+        reporter.message(str(num_added) + ' records have been added.', 'green')
         if len(self.no_filename) > 0:
-            display(HTML('<p style="color:red;">A filename could not be found for the following records:</p>'))
-            out = '<ul>'
-            for item in sorted(list(set(self.no_filename))):
-                out+= '<li>' + str(item) + '</li>'
-            out += '</ul>'
-            display(HTML(out))
+            reporter.message('A filename could not be found for the following records:', 'red')
+            for item in sorted(set(str(item) for item in self.no_filename)):
+                reporter.message('- ' + item)
         if len(self.no_corresponding_file) > 0:
-            display(HTML('<p style="color:red;">The following filenames in your metadata did not have a corresponding file in the json folder:</p>'))
-            out = '<ul>'
-            for item in sorted(list(set(self.no_corresponding_file))):
-                out+= '<li>' + str(item) + '</li>'
-            out += '</ul>'
-            display(HTML(out))
+            reporter.message('The following filenames in your metadata did not have a corresponding file in the json folder:', 'red')
+            for item in sorted(set(str(item) for item in self.no_corresponding_file)):
+                reporter.message('- ' + item)
 
@@ -14,6 +14,8 @@ import scattertext as st
 from scattertext.features.FeatsFromSpacyDoc import FeatsFromSpacyDoc
 from IPython.display import display, HTML
 
+from token_cache import TokenCache, spacy_doc_from_columns
+
 # Constants
 SPACY_ENTITY_TYPES = ["PERSON", "NORP", "FAC", "ORG", "GPE", "LOC", "PRODUCT", "EVENT", "WORK_OF_ART", "LAW", "DATE", "TIME", "PERCENT", "MONEY", "QUANTITY", "ORDINAL", "CARDINAL"]
 SPACY_TAG_TYPES = ["$", "``", "''", ",", "-LRB-", "-RRB-", ".", ":", "ADD", "CC", "CD", "DT", "EX", "IN", "LS", "NFP", "NIL", "NNP", "NNPS", "PDT", "POS", "PRP", "PRP$", "RP", "SYM", "TO", "UH", "WDT", "WP", "WP$", "WRB"]
@@ -141,8 +143,13 @@ def display_link(filename, project_dir, WRITE_DIR, PORT):
     display(HTML('<p>Note: This can be a large HTML file. With a 2000 document corpus it may take about fifteen minutes to load.</p>'))
     
 def generate_corpus(module_data_dir, corpus_file, nlp, df, field, stoplist_path=None, use_lemmas=True, entity_types_to_use='all',
-                    tag_types_to_use=None, entity_types_to_censor=set(), tag_types_to_censor=set(), strip_final_period=False):
-    """Generate and save a corpus."""
+                    tag_types_to_use=None, entity_types_to_censor=set(), tag_types_to_censor=set(), strip_final_period=False,
+                    cache_file=None, max_cache_bytes=1024 * 1024 * 1024):
+    """Generate and save a corpus.
+
+    If a `cache_file` is given, the spaCy features of each text are read from a token cache
+    where possible, and only texts which have not been parsed before are passed to `nlp`.
+    """
     # Load stoplist
     if stoplist_path is not None:
         with open(stoplist_path, 'r') as f:
@@ -175,8 +182,20 @@ def generate_corpus(module_data_dir, corpus_file, nlp, df, field, stoplist_path=
                                              entity_types_to_censor=entity_types_to_censor, tag_types_to_censor=tag_types_to_censor,
                                              strip_final_period=strip_final_period)
     # Build the corpus
-    corpus = st.CorpusFromPandas(df, category_col=field, text_col='text', nlp=nlp,
-                                 feats_from_spacy_doc=feats_from_spacy_doc).build().get_stoplisted_unigram_corpus(stoplist=stoplist)
+    if cache_file is not None:
+        # Rebuild the parsed documents from the token cache, parsing only the uncached texts
+        options = {'pipeline': 'scattertext', 'version': nlp.meta.get('version'), 'spacy': spacy.__version__,
+                   'special_cases': lemmatization_cases}
+        language_model = nlp.meta.get('lang', '') + '_' + nlp.meta.get('name', '')
+        with TokenCache(cache_file, language_model, options, max_cache_bytes) as cache:
+            parsed = [spacy_doc_from_columns(nlp.vocab, cache.parse(text, nlp)) for text in df['text']]
+        df = df.assign(parsed=parsed)
+        corpus = st.CorpusFromParsedDocuments(df, category_col=field, parsed_col='parsed',
+                                              feats_from_spacy_doc=feats_from_spacy_doc).build()
+    else:
+        corpus = st.CorpusFromPandas(df, category_col=field, text_col='text', nlp=nlp,
+                                     feats_from_spacy_doc=feats_from_spacy_doc).build()
+    corpus = corpus.get_stoplisted_unigram_corpus(stoplist=stoplist)
     # Remove entities
     corpus = corpus.remove_terms(uc_stoplist, ignore_absences=True)
     # corpus = corpus.remove_entity_tags()
@@ -0,0 +1,279 @@
+"""token_cache.py.
+
+Caches the linguistic features that spaCy extracts from a document's
+`content`, so that the same text is only parsed once by the import, counting,
+topic modeling and metadata modules.
+
+Entries are stored in a SQLite database and keyed by the SHA-1 hash of the
+content and a pipeline key made from the language model name and any options
+that change the parse (for instance, the custom tokenizer or entity merger).
+Each entry holds the token text, whitespace, norm, lemma, part of speech, tag,
+stopword flag, entity IOB code, entity type and sentence start of every
+token. The columns are stored compactly: norms and lemmas are only stored
+where they differ from the token, low-cardinality columns are stored as a
+small vocabulary with an index per token, and the result is compressed with
+zlib.
+
+The cache is bounded by `max_bytes`. When it grows larger, the least recently
+used entries are evicted. Several processes can read and write the same cache
+file, so it can be shared by worker processes.
+
+Sample Usage:
+
+```python
+cache = TokenCache('project_data/token_cache.db', 'en_core_web_sm', options={'pipeline': 'we1s'})
+columns = cache.parse(doc['content'], nlp)
+doc['features'] = features_table(columns)
+cache.close()
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+# Constants
+CODED_COLUMNS = ['whitespace', 'pos', 'tag', 'ent_iob', 'ent_type']
+FLAG_COLUMNS = ['is_stop', 'sent_start']
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024 # 1 GB
+FEATURES_HEADER = ['TOKEN', 'NORM', 'LEMMA', 'POS', 'TAG', 'STOPWORD', 'ENTITIES']
+
+def content_key(content):
+    """Return the SHA-1 hash of a content string."""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def columns_from_spacy_doc(spacy_doc):
+    """Return a dict of feature columns, one value per token, from a spaCy doc."""
+    columns = {'text': [], 'whitespace': [], 'norm': [], 'lemma': [], 'pos': [], 'tag': [],
+               'is_stop': [], 'ent_iob': [], 'ent_type': [], 'sent_start': []}
+    for token in spacy_doc:
+        columns['text'].append(token.text)
+        columns['whitespace'].append(token.whitespace_)
+        columns['norm'].append(token.norm_)
+        columns['lemma'].append(token.lemma_)
+        columns['pos'].append(token.pos_)
+        columns['tag'].append(token.tag_)
+        columns['is_stop'].append(bool(token.is_stop))
+        columns['ent_iob'].append(token.ent_iob_)
+        columns['ent_type'].append(token.ent_type_)
+        columns['sent_start'].append(bool(token.is_sent_start))
+    return columns
+
+def encode_columns(columns):
+    """Compress a dict of feature columns to bytes."""
+    text = columns['text']
+    data = {'text': text}
+    # Norms and lemmas are usually the lower-cased token or the token itself
+    data['norm'] = [None if norm == token.lower() else norm for token, norm in zip(text, columns['norm'])]
+    data['lemma'] = [None if lemma == token else lemma for token, lemma in zip(text, columns['lemma'])]
+    for column in CODED_COLUMNS:
+        vocab = sorted(set(columns[column]))
+        codes = {value: i for i, value in enumerate(vocab)}
+        data[column] = [vocab, [codes[value] for value in columns[column]]]
+    for column in FLAG_COLUMNS:
+        data[column] = ''.join('1' if value else '0' for value in columns[column])
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+def decode_columns(blob):
+    """Decompress bytes created by `encode_columns()` to a dict of feature columns."""
+    data = json.loads(zlib.decompress(blob).decode('utf-8'))
+    text = data['text']
+    columns = {'text': text}
+    columns['norm'] = [token.lower() if norm is None else norm for token, norm in zip(text, data['norm'])]
+    columns['lemma'] = [token if lemma is None else lemma for token, lemma in zip(text, data['lemma'])]
+    for column in CODED_COLUMNS:
+        vocab, codes = data[column]
+        columns[column] = [vocab[code] for code in codes]
+    for column in FLAG_COLUMNS:
+        columns[column] = [flag == '1' for flag in data[column]]
+    return columns
+
+def features_table(columns):
+    """Return feature columns as a WE1S `features` table, with a header row."""
+    table = [list(FEATURES_HEADER)]
+    for i, token in enumerate(columns['text']):
+        table.append([token, columns['norm'][i], columns['lemma'][i], columns['pos'][i], columns['tag'][i],
+                      str(columns['is_stop'][i]), (columns['ent_iob'][i], columns['ent_type'][i])])
+    return table
+
+def spacy_doc_from_columns(vocab, columns):
+    """Rebuild a spaCy doc with tags, lemmas, norms, entities and sentences from feature columns."""
+    from spacy.tokens import Doc, Span
+    spacy_doc = Doc(vocab, words=columns['text'], spaces=[space != '' for space in columns['whitespace']])
+    ents = []
+    for i, token in enumerate(spacy_doc):
+        token.norm_ = columns['norm'][i]
+        token.lemma_ = columns['lemma'][i]
+        token.pos_ = columns['pos'][i]
+        token.tag_ = columns['tag'][i]
+        token.is_sent_start = columns['sent_start'][i]
+        # Collect entity spans from their IOB codes
+        if columns['ent_iob'][i] == 'B' or (columns['ent_iob'][i] == 'I' and len(ents) == 0):
+            ents.append([i, i + 1, columns['ent_type'][i]])
+        elif columns['ent_iob'][i] == 'I':
+            ents[-1][1] = i + 1
+    spacy_doc.ents = [Span(spacy_doc, start, end, label=label) for start, end, label in ents]
+    return spacy_doc
+
+class TokenCache():
+    """Store spaCy feature columns in a size-bounded SQLite cache keyed by content hash and pipeline."""
+
+    def __init__(self, cache_file, language_model, options=None, max_bytes=DEFAULT_MAX_BYTES, commit_interval=100):
+        """Initialise the cache. The database is opened, and created if necessary, when it is first used.
+
+        Parameters:
+        - cache_file (str): The path to the SQLite database.
+        - language_model (str): The name of the spaCy language model.
+        - options (dict): Any settings that change how the pipeline parses a text.
+        - max_bytes (int): The maximum size of the stored entries. The least recently used entries are evicted above this size.
+        - commit_interval (int): The number of new entries written before they are committed.
+        """
+        self.cache_file = cache_file
+        self.language_model = language_model
+        self.options = options if options is not None else {}
+        self.pipeline = language_model + ':' + json.dumps(self.options, sort_keys=True)
+        self.max_bytes = max_bytes
+        self.commit_interval = commit_interval
+        self.connection = None
+        self.uncommitted = 0
+        self.touched = [] # (last_used, key) updates waiting to be written
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        """Return the cache."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit any new entries and close the database."""
+        self.close()
+
+    def __getstate__(self):
+        """Exclude the database connection when the cache is copied to a worker process."""
+        state = self.__dict__.copy()
+        state['connection'] = None
+        state['uncommitted'] = 0
+        state['touched'] = []
+        return state
+
+    def close(self):
+        """Commit any new entries, evict old entries if necessary, and close the database."""
+        if self.connection is not None:
+            self.commit()
+            self.connection.close()
+            self.connection = None
+
+    def commit(self):
+        """Write recorded accesses, commit new entries and evict entries above `max_bytes`."""
+        if self.connection is None:
+            return
+        if len(self.touched) > 0:
+            self.connection.executemany('UPDATE tokens SET last_used = ? WHERE pipeline = ? AND key = ?',
+                                        [(last_used, self.pipeline, key) for last_used, key in self.touched])
+            self.touched = []
+        self.connection.commit()
+        self.uncommitted = 0
+        self.evict()
+
+    def connect(self):
+        """Return the database connection, opening it if necessary."""
+        if self.connection is None:
+            directory = os.path.dirname(self.cache_file)
+            if directory != '' and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(self.cache_file, timeout=60)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS tokens (
+                pipeline TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (pipeline, key))''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)')
+            self.connection.commit()
+        return self.connection
+
+    def evict(self):
+        """Delete the least recently used entries until the cache is no larger than `max_bytes`."""
+        connection = self.connect()
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM tokens').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% of the limit so that eviction does not run after every commit
+        excess = total - int(self.max_bytes * 0.9)
+        rowids = []
+        for rowid, size in connection.execute('SELECT rowid, size FROM tokens ORDER BY last_used'):
+            rowids.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM tokens WHERE rowid = ?', rowids)
+        connection.commit()
+
+    def get(self, content):
+        """Return the cached feature columns for a content string, or None if it has not been cached."""
+        key = content_key(content)
+        row = self.connect().execute('SELECT data FROM tokens WHERE pipeline = ? AND key = ?',
+                                     (self.pipeline, key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched.append((time.time(), key))
+        return decode_columns(row[0])
+
+    def get_features_table(self, content):
+        """Return the cached `features` table for a content string, or None if it has not been cached."""
+        columns = self.get(content)
+        if columns is None:
+            return None
+        return features_table(columns)
+
+    def parse(self, content, nlp):
+        """Return the feature columns for a content string, parsing it with `nlp` only if it is not cached."""
+        columns = self.get(content)
+        if columns is None:
+            columns = columns_from_spacy_doc(nlp(content))
+            self.put(content, columns)
+        return columns
+
+    def pipe(self, items, nlp, batch_size=100, n_process=1):
+        """Yield (columns, context) tuples for an iterable of (content, context) tuples.
+
+        Cached texts are read from the cache, and the rest are parsed with `nlp.pipe()` and
+        added to the cache. Items with a content of None are not parsed and are returned with
+        columns of None. Results are returned in the original order.
+        """
+        def texts():
+            for content, context in items:
+                columns = self.get(content) if content is not None else None
+                if content is None or columns is not None:
+                    # Cached texts are passed through the pipeline without being parsed
+                    yield '', (None, context, columns)
+                else:
+                    yield content, (content, context, None)
+        kwargs = {'as_tuples': True, 'batch_size': batch_size}
+        if n_process is not None and n_process > 1:
+            kwargs['n_process'] = n_process
+        for spacy_doc, (content, context, columns) in nlp.pipe(texts(), **kwargs):
+            if content is not None:
+                columns = columns_from_spacy_doc(spacy_doc)
+                self.put(content, columns)
+            yield columns, context
+
+    def put(self, content, columns):
+        """Add the feature columns for a content string to the cache."""
+        data = encode_columns(columns)
+        self.connect().execute('INSERT OR REPLACE INTO tokens (pipeline, key, data, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                               (self.pipeline, content_key(content), data, len(data), time.time()))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.commit()
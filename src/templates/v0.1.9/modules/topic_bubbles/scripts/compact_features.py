@@ -0,0 +1,173 @@
+"""compact_features.py.
+
+Encodes a WE1S `features` table in a compact columnar format and reads it
+back.
+
+A standard `features` table is a list of lists with a header row and one row
+per token: `[TOKEN, NORM, LEMMA, POS, TAG, STOPWORD, [IOB, ENT_TYPE]]`. Stored
+as JSON, it is many times larger than the text it describes. In the compact
+format, every distinct string in the document is stored once in a string
+table, and each column is an array of integer indexes into the table, packed
+as little-endian unsigned integers and encoded in base64. The compact table
+is a dict saved in the manifest's `features` field in place of the list of
+lists:
+
+```python
+{
+    'format': 'we1s-compact-1',
+    'length': 1024,           # Number of tokens
+    'typecode': 'H',          # 'B' (1-byte), 'H' (2-byte) or 'I' (4-byte) indexes
+    'strings': ['', 'the', 'DT', ...],
+    'columns': {'token': 'AQACAAMA...', 'norm': ..., 'lemma': ..., 'pos': ...,
+                'tag': ..., 'stopword': ..., 'ent_iob': ..., 'ent_type': ...}
+}
+```
+
+`read_features()` returns the original list of lists for either format, and
+`feature_values()` returns a single column. `CompactFeatures` filters tokens
+by part of speech, tag, or entity type by comparing integer codes, without
+building the rows.
+
+Sample Usage:
+
+```python
+doc['features'] = encode_features(features_table)
+table = read_features(doc['features'])
+compact = CompactFeatures(doc['features'])
+rows = compact.filter(include_pos=['NOUN', 'VERB'], exclude_entity_types=['PERSON'])
+lemmas = compact.values('lemma', rows)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import base64
+import sys
+from array import array
+
+# Constants
+COMPACT_FORMAT = 'we1s-compact-1'
+FEATURES_HEADER = ['TOKEN', 'NORM', 'LEMMA', 'POS', 'TAG', 'STOPWORD', 'ENTITIES']
+COLUMNS = ['token', 'norm', 'lemma', 'pos', 'tag', 'stopword', 'ent_iob', 'ent_type']
+
+def pack_codes(codes, typecode):
+    """Pack a list of integers as little-endian unsigned integers encoded in base64."""
+    packed = array(typecode, codes)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+def unpack_codes(data, typecode):
+    """Unpack a base64 string created by `pack_codes()` to an array of integers."""
+    packed = array(typecode)
+    packed.frombytes(base64.b64decode(data))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed
+
+def is_compact(features):
+    """Return True if a `features` field is in the compact format."""
+    return isinstance(features, dict) and features.get('format') == COMPACT_FORMAT
+
+def encode_features(table):
+    """Convert a features table (a list of lists with a header row) to the compact format."""
+    strings = []
+    codes = {}
+    columns = {column: [] for column in COLUMNS}
+    for row in table[1:]:
+        entity = row[6] if isinstance(row[6], (list, tuple)) else ('', '')
+        values = list(row[0:5]) + [str(row[5]), entity[0], entity[1]]
+        for column, value in zip(COLUMNS, values):
+            if value not in codes:
+                codes[value] = len(strings)
+                strings.append(value)
+            columns[column].append(codes[value])
+    if len(strings) <= 256:
+        typecode = 'B'
+    elif len(strings) <= 65536:
+        typecode = 'H'
+    else:
+        typecode = 'I'
+    return {
+        'format': COMPACT_FORMAT,
+        'length': len(table) - 1,
+        'typecode': typecode,
+        'strings': strings,
+        'columns': {column: pack_codes(values, typecode) for column, values in columns.items()}
+    }
+
+def read_features(features):
+    """Return a features table as a list of lists with a header row, whatever its format."""
+    if is_compact(features):
+        return CompactFeatures(features).table()
+    return features
+
+def feature_values(features, column='token'):
+    """Return a single column of a features table in either format, without the header."""
+    if is_compact(features):
+        return CompactFeatures(features).values(column)
+    return [row[COLUMNS.index(column)] for row in features[1:]]
+
+class CompactFeatures():
+    """Read and filter a features table in the compact format."""
+
+    def __init__(self, features):
+        """Unpack the integer columns of a compact features table."""
+        self.strings = features['strings']
+        self.length = features['length']
+        self.codes = {string: i for i, string in enumerate(self.strings)}
+        self.columns = {column: unpack_codes(data, features['typecode'])
+                        for column, data in features['columns'].items()}
+
+    def __len__(self):
+        """Return the number of tokens."""
+        return self.length
+
+    def code_set(self, values):
+        """Return the set of integer codes for a list of strings. Strings not in the document are ignored."""
+        return set(self.codes[value] for value in values if value in self.codes)
+
+    def filter(self, include_pos=None, include_tags=None, exclude_entity_types=None):
+        """Return the indexes of the tokens which pass the POS, tag, and entity type filters.
+
+        Parameters:
+        - include_pos (list): Parts of speech to keep. If None, all parts of speech are kept.
+        - include_tags (list): Tags to keep. If None, all tags are kept.
+        - exclude_entity_types (list): Entity types to remove.
+        """
+        rows = range(self.length)
+        if include_pos is not None:
+            pos_codes = self.code_set(include_pos)
+            pos = self.columns['pos']
+            rows = [i for i in rows if pos[i] in pos_codes]
+        if include_tags is not None:
+            tag_codes = self.code_set(include_tags)
+            tag = self.columns['tag']
+            rows = [i for i in rows if tag[i] in tag_codes]
+        if exclude_entity_types:
+            entity_codes = self.code_set(exclude_entity_types)
+            ent_type = self.columns['ent_type']
+            rows = [i for i in rows if ent_type[i] not in entity_codes]
+        return list(rows)
+
+    def row(self, i):
+        """Return a single token's row in the list of lists format."""
+        strings = self.strings
+        columns = self.columns
+        return [strings[columns['token'][i]], strings[columns['norm'][i]], strings[columns['lemma'][i]],
+                strings[columns['pos'][i]], strings[columns['tag'][i]], strings[columns['stopword'][i]],
+                [strings[columns['ent_iob'][i]], strings[columns['ent_type'][i]]]]
+
+    def table(self, rows=None):
+        """Return the features table as a list of lists with a header row, optionally for selected rows only."""
+        if rows is None:
+            rows = range(self.length)
+        return [list(FEATURES_HEADER)] + [self.row(i) for i in rows]
+
+    def values(self, column='token', rows=None):
+        """Return the strings in a column, optionally for selected rows only."""
+        codes = self.columns[column]
+        if rows is None:
+            return [self.strings[code] for code in codes]
+        return [self.strings[codes[i]] for i in rows]
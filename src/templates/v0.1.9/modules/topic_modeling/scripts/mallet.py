@@ -3,29 +3,87 @@
 Generates a Mallet object with WE1S settings for MALLET topic modelling.
 MALLET settings can be adjusted with commands like`Mallet.num_iterations = 500`.
 `Mallet.import_models()` imports data to MALLET and `Mallet.train_models()`
-trains the models.
+trains the models. `Mallet.infer_models()` adds the topics of new documents
+to trained models without training them again, and `Mallet.get_composition()`
+reads them together with the training documents.
+
+The import file is only imported once for all the models. The MALLET
+instance file is cached in the model directory as `_import_<hash>.mallet`,
+where the hash is made from the import file and the import arguments, and
+it is linked into each model's subdirectory. Running the import again with the same
+data and settings reuses the cached file.
 
 For use with 02_model_topics.ipynb v 2.0.
 
 Last update: 2020-07-06
 """
 
+import hashlib
 import json
 import os
+import queue
 import re
 import shlex
 import shutil
 import signal
-import ipywidgets
 from IPython.display import display, HTML
-from ipywidgets import HBox, IntProgress, Label
 from subprocess import check_output, CalledProcessError, PIPE, Popen, STDOUT
 
+from progress import get_reporter
 from timer import Timer
+from training_telemetry import TrainingMonitor, read_telemetry
+
+# Commands used to stream compressed import files to MALLET
+DECOMPRESS_COMMANDS = {'.gz': 'gzip -dc ', '.zst': 'zstd -dc '}
+# Prefix of the imported instance files cached in the model directory. They are saved as files,
+# not in a subdirectory, because other modules treat every subdirectory as a model.
+IMPORT_CACHE_PREFIX = '_import_'
+
+def hash_import_source(path):
+    """Return the SHA-1 hash of an import file, or of the names and contents of the files in an import directory."""
+    sha1 = hashlib.sha1()
+    if os.path.isdir(path):
+        filepaths = sorted(os.path.join(root, file) for root, dirs, files in os.walk(path) for file in files)
+    else:
+        filepaths = [path]
+    for filepath in filepaths:
+        sha1.update(os.path.relpath(filepath, path).encode('utf-8') + b'\0')
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(block)
+    return sha1.hexdigest()
+
+def read_import_file(path):
+    """Yield the rows of an import file, decompressing it if it ends in `.gz` or `.zst`."""
+    decompress = DECOMPRESS_COMMANDS.get(os.path.splitext(path)[1])
+    if decompress is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+        return
+    command = shlex.split(decompress) + [path]
+    process = Popen(command, stdout=PIPE, stderr=PIPE, universal_newlines=True, encoding='utf-8')
+    yield from process.stdout
+    error = process.stderr.read()
+    if process.wait() != 0:
+        raise CalledProcessError(process.returncode, command, output=error)
+
+def read_composition(composition_file):
+    """Return the rows of a MALLET composition file as lists of tab-separated fields, skipping the header."""
+    rows = []
+    with open(composition_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('#') and line.strip() != '':
+                rows.append(line.rstrip('\n').split('\t'))
+    return rows
 
-IntProgress(
-    description='Processing:',
-)
+def link_file(source, destination):
+    """Hard-link a file to a new path, replacing any existing file, or copy it if it cannot be linked."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
 
 class Mallet:
     """Create a MALLET class object."""
@@ -33,8 +91,15 @@ class Mallet:
     def __init__(self, num_topics, model_dir, import_file_path, import_source='file', num_iterations=1000,
                  optimize_interval=10, use_random_seed=True, random_seed=10, keep_sequence=True,
                  preserve_case=False, token_regex='"\S+"', remove_stopwords=False, extra_stopwords=None,
-                 stoplist_file=None, generate_diagnostics=True):
-        """Initialise the object."""
+                 stoplist_file=None, generate_diagnostics=True, mallet_path='mallet', save_inferencer=True,
+                 reporter=None):
+        """Initialise the object.
+
+        Parameters:
+        - mallet_path (str): The MALLET executable. Defaults to `mallet` on the system path.
+        - save_inferencer (bool): Save a topic inferencer with each model, so that topics can be inferred for new documents with `infer_models()`.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'. Used for the setup message.
+        """
         self.num_topics = num_topics # List of integers
         self.model_dir = model_dir
         self.import_file_path = import_file_path
@@ -50,14 +115,18 @@ class Mallet:
         self.extra_stopwords = extra_stopwords
         self.stoplist_file = stoplist_file
         self.generate_diagnostics = generate_diagnostics
+        self.mallet_path = mallet_path
+        self.save_inferencer = save_inferencer
         self.model_vars = {}
         self.import_command = ''
         self.train_command = ''
+        self.infer_command = ''
+        reporter = get_reporter(reporter)
         try:
             self.build_subdirs()
-            display(HTML('<h4>Setup complete.</h4>'))
+            reporter.message('Setup complete.', size=4)
         except RuntimeError:
-            display(HTML('<h4 style="color:red;">There was an error setting up your model directories.</h4>'))
+            reporter.message('There was an error setting up your model directories.', 'red', 4)
         
     def build_subdirs(self, delete_existing=False):
         """Create subdirectories for each model and a dict to store variables for use with each model.
@@ -82,21 +151,35 @@ class Mallet:
                 'model_composition': 'composition' + model_num_topics + '.txt',
                 'model_counts': 'topic_counts' + model_num_topics + '.txt',
                 'diagnostics_file': 'diagnostics' + model_num_topics + '.xml',
-                'model_topic_docs':'topic-docs' + model_num_topics + '.txt'
+                'model_topic_docs':'topic-docs' + model_num_topics + '.txt',
+                'telemetry_file': 'telemetry' + model_num_topics + '.tsv',
+                'inferencer_file': 'inferencer' + model_num_topics + '.mallet',
+                'inferred_composition': 'inferred' + model_num_topics + '.txt'
             }
 
-    def import_data(self, num_topics):
-        """Import doc-terms data to MALLET for a single model.
-        
-        Parameters:
-        - num_topics (str): The number of topics in the model. 
+    def cached_import_path(self):
+        """Return the path to the cached MALLET instance file for the current import file and settings.
+
+        The file name is a hash of the contents of the import file (or every file in an import
+        directory), the import source, the import arguments and the contents of any stop word files.
         """
-        timer = Timer()
-        # Define model variables
-        model_vars = self.model_vars[num_topics]
-        subdir = self.model_dir + '/topics' + num_topics
-        output_path = subdir + '/' + model_vars['model_file']        
-        # Add arguments
+        key = hashlib.sha1()
+        key.update(hash_import_source(self.import_file_path).encode('utf-8'))
+        key.update(('\0' + self.import_source + '\0' + self.import_args()).encode('utf-8'))
+        for stopwords_file in [self.stoplist_file, self.extra_stopwords]:
+            if stopwords_file is not None and os.path.isfile(stopwords_file):
+                key.update(('\0' + hash_import_source(stopwords_file)).encode('utf-8'))
+        return self.model_dir + '/' + IMPORT_CACHE_PREFIX + key.hexdigest() + '.mallet'
+
+    def clear_import_cache(self):
+        """Delete the cached MALLET instance files. Files linked into model subdirectories are kept."""
+        if os.path.exists(self.model_dir):
+            for file in os.listdir(self.model_dir):
+                if file.startswith(IMPORT_CACHE_PREFIX) and file.endswith('.mallet'):
+                    os.remove(self.model_dir + '/' + file)
+
+    def import_args(self):
+        """Return the MALLET import arguments, other than the input and output, as a string."""
         args = []
         if self.keep_sequence == True:
             args.append('--keep-sequence')
@@ -104,65 +187,393 @@ class Mallet:
             args.append('--preserve-case')
         if self.remove_stopwords == True:
             args.append('--remove-stopwords')
-        if self.extra_stopwords == True:
-            args.append('--exta-stopwords')
+        if self.extra_stopwords is not None:
+            args.append('--extra-stopwords ' + self.extra_stopwords)
         if self.token_regex is not None:
             args.append('--token-regex ' + self.token_regex)
         if self.stoplist_file is not None:
-            args.append('--stoplist-file ' + self.stoplist-file)
-        args = ' '.join(args)
-        mallet_import_args = '--input ' + self.import_file_path + ' --output ' + output_path + ' ' + args
-        self.import_command = 'mallet import-' + self.import_source + ' ' + mallet_import_args
+            args.append('--stoplist-file ' + self.stoplist_file)
+        return ' '.join(args)
+
+    def import_cached(self, reporter=None):
+        """Import doc-terms data to MALLET once and save the instance file in the import cache.
+
+        If an instance file has already been created from the same import file with the same
+        arguments, MALLET is not run again. Returns the path to the cached instance file, or
+        None if the import failed.
+
+        Parameters:
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
+        """
+        reporter = get_reporter(reporter)
+        if not os.path.exists(self.import_file_path):
+            reporter.message('Error! The import file ' + self.import_file_path + ' does not exist.', 'red')
+            return None
+        try:
+            cache_path = self.cached_import_path()
+        except OSError as e:
+            reporter.message('Error! The import file could not be read: ' + str(e), 'red')
+            return None
+        if os.path.exists(cache_path):
+            return cache_path
+        timer = Timer()
+        # Write to a temporary file so that an interrupted import is never cached
+        output_path = cache_path + '.tmp'
         # Perform the import
         try:
+            self.run_import(self.import_file_path, output_path, self.import_args())
+            os.replace(output_path, cache_path)
+            reporter.message('Import complete!', size=4)
+            reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+            return cache_path
+        except (CalledProcessError, OSError) as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            reporter.message(e.output if isinstance(e, CalledProcessError) else str(e), 'red')
+            reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+            return None
+
+    def get_import_commands(self, input_path, output_path, args, import_source=None):
+        """Return the decompression command and the MALLET import command for an import.
+
+        The decompression command is a list of arguments, or None if the input is not a
+        compressed file. Its output is streamed to the MALLET command, which is a string
+        for the shell.
+
+        Parameters:
+        - input_path (str): The import file or directory. Files ending in `.gz` or `.zst` are decompressed and streamed to MALLET.
+        - output_path (str): The instance file to create.
+        - args (str): The other import arguments.
+        - import_source (str): 'file' or 'dir'. Defaults to the object's `import_source`.
+        """
+        if import_source is None:
+            import_source = self.import_source
+        decompress = DECOMPRESS_COMMANDS.get(os.path.splitext(input_path)[1])
+        if import_source == 'file' and decompress is not None:
+            # Decompress the import file and read it from stdin
+            mallet_import_args = '--input - --output ' + output_path + ' ' + args
+            return shlex.split(decompress) + [input_path], self.mallet_path + ' import-file ' + mallet_import_args
+        mallet_import_args = '--input ' + input_path + ' --output ' + output_path + ' ' + args
+        return None, self.mallet_path + ' import-' + import_source + ' ' + mallet_import_args
+
+    def get_import_command(self, input_path, output_path, args, import_source=None):
+        """Return a MALLET import command, including any decompression, as a string for the shell.
+
+        Takes the same parameters as `get_import_commands()`.
+        """
+        decompress_command, mallet_command = self.get_import_commands(input_path, output_path, args, import_source)
+        if decompress_command is None:
+            return mallet_command
+        return ' '.join(shlex.quote(arg) for arg in decompress_command) + ' | ' + mallet_command
+
+    def run_import(self, input_path, output_path, args, import_source=None):
+        """Run a MALLET import and return its output.
+
+        A compressed import file is decompressed in a separate process which feeds MALLET's
+        standard input, so that a damaged or truncated file fails the import even though
+        MALLET reads the data it was given without an error. Raises `CalledProcessError` if
+        either process fails. Takes the same parameters as `get_import_commands()`.
+        """
+        decompress_command, mallet_command = self.get_import_commands(input_path, output_path, args, import_source)
+        self.import_command = self.get_import_command(input_path, output_path, args, import_source)
+        if decompress_command is None:
             # shell=True required to handle backslashes in token-regex
-            output = check_output(self.import_command, stderr=STDOUT, shell=True, universal_newlines=True)
-            display(HTML('<h4>Import for topics' + num_topics + ' complete!</h4>'))
-            print('Time elapsed: %s' % timer.get_time_elapsed())
-            return True
-        except CalledProcessError as e:
-            output = e.output.decode()
-            display(HTML('<p style="color: red;">' + output + '</p>'))
-            print('Time elapsed: %s' % timer.get_time_elapsed())
+            return check_output(mallet_command, stderr=STDOUT, shell=True, universal_newlines=True)
+        decompressor = Popen(decompress_command, stdout=PIPE, stderr=PIPE)
+        try:
+            mallet = Popen(mallet_command, stdin=decompressor.stdout, stdout=PIPE, stderr=STDOUT, shell=True,
+                           universal_newlines=True)
+        except OSError:
+            decompressor.kill()
+            decompressor.wait()
+            raise
+        # Close the parent's copy of the pipe so that the decompressor stops if MALLET exits
+        decompressor.stdout.close()
+        output = mallet.communicate()[0]
+        error = decompressor.stderr.read().decode('utf-8', 'replace')
+        decompressor.stderr.close()
+        decompressor.wait()
+        if mallet.returncode != 0:
+            raise CalledProcessError(mallet.returncode, mallet_command, output=output)
+        if decompressor.returncode != 0:
+            raise CalledProcessError(decompressor.returncode, decompress_command, output=error)
+        return output
+
+    def import_data(self, num_topics, cache_path=None, reporter=None):
+        """Import doc-terms data to MALLET for a single model.
+
+        The data is imported once into the import cache, and the cached instance file is
+        hard-linked (or copied, if a link cannot be made) into the model's subdirectory.
+
+        Parameters:
+        - num_topics (str): The number of topics in the model.
+        - cache_path (str): The path to an instance file returned by `import_cached()`. If None, the import cache is checked.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
+        """
+        reporter = get_reporter(reporter)
+        if cache_path is None:
+            cache_path = self.import_cached(reporter)
+        if cache_path is None:
             return False
+        model_vars = self.model_vars[num_topics]
+        output_path = self.model_dir + '/topics' + num_topics + '/' + model_vars['model_file']
+        link_file(cache_path, output_path)
+        reporter.message('Import for topics' + num_topics + ' complete!', size=4)
+        return True
 
-    def import_models(self, models=None):
+    def import_models(self, models=None, reporter=None):
         """Import doc_terms data to MALLET from multiple models.
-        
+
+        MALLET is only run once, and the same instance file is shared by every model.
+
         Parameters:
         - models (list): A list of model numbers to be imported. By default this is the number given when the object was initialised. 
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
         """
+        reporter = get_reporter(reporter)
         if models is None:
             models = self.num_topics
+        try:
+            cache_path = self.import_cached(reporter)
+        except (RuntimeError, OSError):
+            cache_path = None
+        if cache_path is None:
+            reporter.message('Import failed. Training will be skipped for all models.', 'red')
+            return
         for topic_num in models:
             try:
-                result = self.import_data(str(topic_num))
-            except RuntimeError:
-                display(HTML('<p style="color: red;">Import failed for topics' + str(topic_num) + '. Training will be skipped for this model.</p>'))
+                result = self.import_data(str(topic_num), cache_path=cache_path, reporter=reporter)
+            except (RuntimeError, OSError):
+                reporter.message('Import failed for topics' + str(topic_num) + '. Training will be skipped for this model.', 'red')
+
+    def composition_names(self, num_topics):
+        """Return a list of the document names in a model's composition file followed by its inferred composition file."""
+        model_vars = self.model_vars[num_topics]
+        subdir = self.model_dir + '/topics' + num_topics
+        names = []
+        for filename in [model_vars['model_composition'], model_vars['inferred_composition']]:
+            if os.path.exists(subdir + '/' + filename):
+                names.extend(fields[1] for fields in read_composition(subdir + '/' + filename))
+        return names
+
+    def get_composition(self, num_topics, include_inferred=True):
+        """Return the topic proportions of a model's documents as a list of dicts, or None if the model has not been trained.
+
+        Each dict has the document's index (`doc`), `name`, topic proportions (`topics`) and
+        whether its topics were `inferred` after training. The documents in `compositionN.txt`
+        are followed by those in `inferredN.txt`, whose indexes continue from them.
+
+        Parameters:
+        - num_topics (str or int): The number of topics in the model.
+        - include_inferred (bool): Include the documents added with `infer_models()`.
+        """
+        num_topics = str(num_topics)
+        model_vars = self.model_vars[num_topics]
+        subdir = self.model_dir + '/topics' + num_topics
+        if not os.path.exists(subdir + '/' + model_vars['model_composition']):
+            return None
+        filenames = [model_vars['model_composition']]
+        if include_inferred == True:
+            filenames.append(model_vars['inferred_composition'])
+        composition = []
+        for filename in filenames:
+            if not os.path.exists(subdir + '/' + filename):
+                continue
+            for fields in read_composition(subdir + '/' + filename):
+                composition.append({
+                    'doc': int(fields[0]),
+                    'name': fields[1],
+                    'topics': [float(value) for value in fields[2:]],
+                    'inferred': filename == model_vars['inferred_composition']
+                })
+        return composition
+
+    def append_inferred(self, num_topics, inferred_file, names):
+        """Append inferred document topics to a model's inferred composition file and return the number of documents added.
+
+        MALLET rewrites `compositionN.txt` whenever the model is trained, so inferred documents are
+        kept in `inferredN.txt`. The document indexes are numbered to follow the documents in both
+        files, and documents whose names are already in either file are skipped.
 
-    def train(self, num_topics, display_output=False, capture_output=False, progress_bar=True, log_file=None):
-        """Train a single topic model.
-        
         Parameters:
         - num_topics (str): The number of topics in the model.
-        
-        Progress monitor borrowed from TETHNE: https://diging.github.io/tethne/_modules/tethne/model/corpus/mallet.html
+        - inferred_file (str): The `--output-doc-topics` file written by `mallet infer-topics`.
+        - names (list): The names returned by `composition_names()`. New names are added to it.
+        """
+        model_vars = self.model_vars[num_topics]
+        inferred_composition = self.model_dir + '/topics' + num_topics + '/' + model_vars['inferred_composition']
+        known = set(names)
+        rows = []
+        with open(inferred_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    # Keep MALLET's header line at the top of a new file
+                    if not os.path.exists(inferred_composition) and len(rows) == 0:
+                        rows.append(line)
+                    continue
+                if line.strip() == '':
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if fields[1] in known:
+                    continue
+                fields[0] = str(len(names))
+                names.append(fields[1])
+                known.add(fields[1])
+                rows.append('\t'.join(fields) + '\n')
+        with open(inferred_composition, 'a', encoding='utf-8') as f:
+            f.write(''.join(rows))
+        return len([row for row in rows if not row.startswith('#')])
+
+    def retire_inferred(self, num_topics, reporter=None):
+        """Move a model's inferred composition file to a `previousN` folder before the model is trained again.
+
+        The inferred topics belong to the model that was used to infer them, so they are not
+        kept with a newly trained model. Returns the folder, or None if there was no file.
+        """
+        model_vars = self.model_vars[num_topics]
+        subdir = self.model_dir + '/topics' + num_topics
+        if not os.path.exists(subdir + '/' + model_vars['inferred_composition']):
+            return None
+        previous_dir = self.rotate_outputs(num_topics, keys=['inferred_composition'])
+        get_reporter(reporter).message('The inferred documents for topics' + num_topics + ' were moved to '
+                                       + os.path.basename(previous_dir) + '. Run `infer_models()` again to add them to the new model.', 'red')
+        return previous_dir
+
+    def infer(self, num_topics, new_import_file_path, num_iterations=100, reporter=None):
+        """Infer the topics of new documents for a single model. See `infer_models()`.
+
+        Parameters:
+        - num_topics (str or int): The number of topics in the model.
+        - new_import_file_path (str): An import file containing the new documents.
+        - num_iterations (int): The number of sampling iterations for each document.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
+        """
+        return self.infer_models(new_import_file_path, models=[num_topics], num_iterations=num_iterations,
+                                 reporter=reporter)
+
+    def infer_models(self, new_import_file_path, models=None, num_iterations=100, reporter=None):
+        """Infer the topics of new documents with the saved inferencers and save them in `inferredN.txt`.
+
+        Rows of the import file whose document names are already in a model's composition file
+        or inferred composition file are skipped, so the file may contain only the new documents
+        or an updated copy of the whole import file. The new rows are imported with
+        `--use-pipe-from` set to the model's instance file, so they are tokenised and mapped to
+        the same vocabulary as the training data. Models which share an instance file share the
+        import. `mallet infer-topics` is then run with each model's inferencer, and the results
+        are appended to `inferredN.txt` in the model's subdirectory, in the same format as
+        `compositionN.txt`. The models themselves are not changed. When a model is trained
+        again, or its training is continued, its inferred composition file is moved to a
+        `previousN` folder, since it describes the old topics.
+
+        Parameters:
+        - new_import_file_path (str): An import file containing the new documents.
+        - models (list): A list of model numbers. By default this is the number given when the object was initialised.
+        - num_iterations (int): The number of sampling iterations for each document.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
         """
-        # Define model variables
         timer = Timer()
+        reporter = get_reporter(reporter)
+        if models is None:
+            models = self.num_topics
+        models = [str(topic_num) for topic_num in models]
+        names = {}
+        for topic_num in models:
+            subdir = self.model_dir + '/topics' + topic_num
+            model_vars = self.model_vars[topic_num]
+            if not os.path.exists(subdir + '/' + model_vars['inferencer_file']):
+                reporter.message('Error! topics' + topic_num + ' has no inferencer. Train the model with `save_inferencer=True` first.', 'red')
+                return False
+            names[topic_num] = self.composition_names(topic_num)
+        known = {topic_num: set(names[topic_num]) for topic_num in models}
+        # Keep only the rows which are new to at least one model
+        rows_file = self.model_dir + '/_infer_rows.txt'
+        num_rows = 0
+        try:
+            with open(rows_file, 'w', encoding='utf-8') as f:
+                for line in read_import_file(new_import_file_path):
+                    name = line.split(None, 1)[0] if line.strip() != '' else None
+                    if name is not None and any(name not in known[topic_num] for topic_num in models):
+                        f.write(line if line.endswith('\n') else line + '\n')
+                        num_rows += 1
+        except (CalledProcessError, OSError) as e:
+            if os.path.exists(rows_file):
+                os.remove(rows_file)
+            reporter.message('Error! The new import file could not be read: ' + (e.output if isinstance(e, CalledProcessError) else str(e)), 'red')
+            return False
+        if num_rows == 0:
+            os.remove(rows_file)
+            reporter.message('There are no new documents to infer.', size=4)
+            return True
+        instances = {} # (device, inode) of a model's instance file -> instances of the new rows
+        inferred_file = self.model_dir + '/_infer_doc_topics.txt'
+        try:
+            for topic_num in models:
+                subdir = self.model_dir + '/topics' + topic_num
+                model_vars = self.model_vars[topic_num]
+                model_file = subdir + '/' + model_vars['model_file']
+                stat = os.stat(model_file)
+                instance_key = (stat.st_dev, stat.st_ino)
+                if instance_key not in instances:
+                    instances[instance_key] = self.model_dir + '/_infer_instances' + str(len(instances)) + '.mallet'
+                    self.run_import(rows_file, instances[instance_key], '--use-pipe-from ' + shlex.quote(model_file),
+                                    import_source='file')
+                command = [
+                    self.mallet_path,
+                    'infer-topics',
+                    '--inferencer', subdir + '/' + model_vars['inferencer_file'],
+                    '--input', instances[instance_key],
+                    '--output-doc-topics', inferred_file,
+                    '--num-iterations', str(num_iterations)
+                ]
+                if self.use_random_seed == True:
+                    command = command + ['--random-seed', str(self.random_seed)]
+                self.infer_command = ' '.join(command)
+                check_output(command, stderr=STDOUT, universal_newlines=True)
+                added = self.append_inferred(topic_num, inferred_file, names[topic_num])
+                reporter.message('Added ' + str(added) + ' document(s) to topics' + topic_num + '.')
+        except CalledProcessError as e:
+            reporter.message('Error! Inference failed: ' + e.output, 'red')
+            return False
+        finally:
+            for path in [rows_file, inferred_file] + list(instances.values()):
+                if os.path.exists(path):
+                    os.remove(path)
+        reporter.message('Inference complete.', size=4)
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+        return True
+
+    def get_telemetry(self, num_topics):
+        """Return the training time series of a model as a list of dicts, or None if it has not been saved.
+
+        Parameters:
+        - num_topics (str or int): The number of topics in the model.
+        """
+        num_topics = str(num_topics)
+        telemetry_file = self.model_dir + '/topics' + num_topics + '/' + self.model_vars[num_topics]['telemetry_file']
+        if not os.path.exists(telemetry_file):
+            return None
+        return read_telemetry(telemetry_file)
+
+    def get_train_command(self, num_topics, num_threads=None, num_iterations=None, input_state=None):
+        """Return the MALLET command to train a single topic model as a list of arguments.
+
+        Parameters:
+        - num_topics (str): The number of topics in the model.
+        - num_threads (int): The number of threads MALLET should use. If None, MALLET's default of 1 is used.
+        - num_iterations (int): The number of iterations. Defaults to the object's `num_iterations`.
+        - input_state (str): A topic state file from which training continues.
+        """
+        if num_iterations is None:
+            num_iterations = self.num_iterations
         model_vars = self.model_vars[num_topics]
         subdir = self.model_dir + '/topics' + num_topics
-        mallet_file = subdir + '/' + model_vars['model_file']        
-        ll = []
-        num_iters = 0
-        prog = re.compile(u'\<([^\)]+)\>')
-        ll_prog = re.compile(r'(\d+)')
+        mallet_file = subdir + '/' + model_vars['model_file']
         command = [
-            'mallet',
+            self.mallet_path,
             'train-topics',
             '--input', mallet_file,
             '--num-topics', str(num_topics),
-            '--num-iterations', str(self.num_iterations),
+            '--num-iterations', str(num_iterations),
             '--optimize-interval', str(self.optimize_interval),
             '--output-state', subdir + '/' + model_vars['model_state'],
             '--output-topic-keys', subdir + '/' + model_vars['model_keys'],
@@ -174,66 +585,293 @@ class Mallet:
             command = command + ['--random-seed', str(self.random_seed)]
         if self.generate_diagnostics == True:
             command = command + ['--diagnostics-file', subdir + '/' + model_vars['diagnostics_file']]
+        if self.save_inferencer == True:
+            command = command + ['--inferencer-filename', subdir + '/' + model_vars['inferencer_file']]
+        if num_threads is not None:
+            command = command + ['--num-threads', str(num_threads)]
+        if input_state is not None:
+            # The hyperparameters have already been through their burn-in period
+            command = command + ['--input-state', input_state, '--optimize-burn-in', '0']
+        return shlex.split(' '.join(command))
+
+    def monitor(self, num_topics, process, events=None, log_file=None, log_prefix='', num_threads=None, rows=None):
+        """Return a `TrainingMonitor` which reads a training process's output and saves its telemetry."""
+        telemetry_file = self.model_dir + '/topics' + num_topics + '/' + self.model_vars[num_topics]['telemetry_file']
+        return TrainingMonitor(num_topics, process.stdout, events=events, log_file=log_file,
+                               log_prefix=log_prefix, telemetry_file=telemetry_file,
+                               num_threads=num_threads if num_threads is not None else 1, rows=rows)
+
+    def rotate_outputs(self, num_topics, keys=None):
+        """Move a model's output files to a new `previousN` folder in its subdirectory and return the folder.
+
+        The instance file stays in place. The folders are numbered from 1, so the highest number
+        holds the most recent outputs. If `keys` is given, only the files for those model variables are moved.
+        """
+        model_vars = self.model_vars[num_topics]
+        subdir = self.model_dir + '/topics' + num_topics
+        i = 1
+        while os.path.exists(subdir + '/previous' + str(i)):
+            i += 1
+        previous_dir = subdir + '/previous' + str(i)
+        os.makedirs(previous_dir)
+        for key, filename in model_vars.items():
+            if keys is not None and key not in keys:
+                continue
+            if key != 'model_file' and os.path.exists(subdir + '/' + filename):
+                os.replace(subdir + '/' + filename, previous_dir + '/' + filename)
+        return previous_dir
+
+    def restore_outputs(self, num_topics, previous_dir):
+        """Move the output files saved by `rotate_outputs()` back to the model's subdirectory."""
+        subdir = self.model_dir + '/topics' + num_topics
+        for filename in os.listdir(previous_dir):
+            os.replace(previous_dir + '/' + filename, subdir + '/' + filename)
+        os.rmdir(previous_dir)
+
+    def continue_training(self, num_topics, extra_iterations, display_output=False, capture_output=False,
+                          progress_bar=True, log_file=None, reporter=None, num_threads=None):
+        """Continue training a model for more iterations, starting from its saved topic state.
+
+        The model's previous outputs are moved to a `previousN` folder in its subdirectory, and
+        MALLET is started with `--input-state` set to the saved topic state file and the same
+        instance file, so only `extra_iterations` more iterations are sampled. The new outputs
+        replace the old ones, and the telemetry continues from the last saved iteration. If
+        training fails, the previous outputs are restored.
+
+        Parameters:
+        - num_topics (str or int): The number of topics in the model.
+        - extra_iterations (int): The number of additional iterations.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'. Defaults to a progress bar, or to console output if `progress_bar` is False.
+        - num_threads (int): The number of threads MALLET should use. If None, MALLET's default of 1 is used.
+        """
+        timer = Timer()
+        num_topics = str(num_topics)
+        if reporter is None:
+            reporter = 'jupyter' if progress_bar is not False else 'console'
+        reporter = get_reporter(reporter)
+        model_vars = self.model_vars[num_topics]
+        subdir = self.model_dir + '/topics' + num_topics
+        if not os.path.exists(subdir + '/' + model_vars['model_state']):
+            reporter.message('Error! topics' + num_topics + ' has no topic state file. Train the model first.', 'red')
+            return False
+        previous_dir = self.rotate_outputs(num_topics)
+        rows = None
+        if os.path.exists(previous_dir + '/' + model_vars['telemetry_file']):
+            rows = read_telemetry(previous_dir + '/' + model_vars['telemetry_file'])
+        command = self.get_train_command(num_topics, num_threads, num_iterations=extra_iterations,
+                                         input_state=previous_dir + '/' + model_vars['model_state'])
+        try:
+            returncode = self.run_training(num_topics, command, extra_iterations, display_output=display_output,
+                                           capture_output=capture_output, log_file=log_file, reporter=reporter,
+                                           num_threads=num_threads, rows=rows)
+        except RuntimeError as e:
+            reporter.message('Error! ' + str(e), 'red')
+            returncode = None
+        if returncode != 0:
+            for key, filename in model_vars.items():
+                if key != 'model_file' and os.path.exists(subdir + '/' + filename):
+                    os.remove(subdir + '/' + filename)
+            self.restore_outputs(num_topics, previous_dir)
+            reporter.message('Error! Training failed for topics' + num_topics + '. The previous outputs have been restored.', 'red')
+            return False
+        reporter.message('Training of topics' + num_topics + ' continued for ' + str(extra_iterations)
+                         + ' iterations. The previous outputs are in ' + os.path.basename(previous_dir) + '.', size=4)
+        if os.path.exists(previous_dir + '/' + model_vars['inferred_composition']):
+            reporter.message('The inferred documents were moved with the previous outputs. Run `infer_models()` again to add them to the continued model.', 'red')
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+        return True
+
+    def run_training(self, num_topics, command, num_iterations, display_output=False, capture_output=False,
+                     log_file=None, reporter=None, num_threads=None, rows=None):
+        """Run a MALLET training command, display its progress and return its exit code.
+
+        Raises `RuntimeError` if MALLET cannot be started.
+        """
+        reporter = get_reporter(reporter)
         self.train_command = ' '.join(command)
-        command = shlex.split(self.train_command)
-        # Simply capture the output and print it at the end
-        if capture_output == True:
-            output = check_output(command, stderr=STDOUT)
-            print(output.decode())
-            if log_file is not None:
-                with open(log_file, 'w') as f:
-                    f.write(output.decode())
-        # Otherwise, monitor the MALLET output in real time
-        else:
-            if progress_bar is not False and display_output == False:
-                pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-                percent = ipywidgets.HTML(value='0%')
-                display(HBox([Label('topics' + str(num_topics)), pbar, percent]))
+        if capture_output == True and log_file is not None:
+            # The captured output replaces the contents of the log file
+            open(log_file, 'w').close()
+        # MALLET's own output shows the progress if it is displayed
+        show_progress = display_output == False and capture_output == False
+        if show_progress:
+            reporter.start('topics' + str(num_topics))
+        try:
             p = Popen(command, stdout=PIPE, stderr=STDOUT)
-            while p.poll() is None:
-                l = p.stdout.readline().decode()
-                if display_output == True:
-                    print(l, end='')
-                if log_file is not None:
-                    with open(log_file, 'a') as f:
-                        f.write(l)
-                # Keep track of LL/topic.
-                try:
-                    this_ll = float(re.findall('([-+]\d+\.\d+)', l)[0])
-                    ll.append(this_ll)
-                except IndexError:  # Not every line will match.
-                    pass
-                # Keep track of modeling progress
-                try:
-                    this_iter = float(prog.match(l).groups()[0])
-                    progress = int(100. * this_iter/self.num_iterations)
-                    if progress_bar is not False and display_output == False:
-                        pbar.value = progress
-                        percent.value = '{0}%'.format(progress)
-                    else:
-                        if progress % 10 == 0:
-                            print('Modeling progress: {0}%.\r'.format(progress)),
-                except AttributeError:  # Not every line will match.
-                    pass
-            num_iters += self.num_iterations
-        display(HTML('<h4>Training of topics' + num_topics + ' complete.</h4>'))
-        print('Time elapsed: %s' % timer.get_time_elapsed())
-
-    def train_models(self, models=None, display_output=False, capture_output=False, progress_bar=True, log_file=None):
+        except OSError as e:
+            if show_progress:
+                reporter.finish()
+            raise RuntimeError('MALLET could not be started: ' + str(e))
+        monitor = self.monitor(num_topics, p, log_file=log_file, num_threads=num_threads, rows=rows).start()
+        output = []
+        for name, line, this_iter in monitor.lines():
+            if display_output == True:
+                print(line, end='')
+            if capture_output == True:
+                output.append(line)
+            if this_iter is not None and show_progress:
+                reporter.update(this_iter, num_iterations)
+        returncode = p.wait()
+        if show_progress:
+            reporter.finish()
+        # Simply print the captured output at the end
+        if capture_output == True:
+            print(''.join(output))
+        return returncode
+
+    def train(self, num_topics, display_output=False, capture_output=False, progress_bar=True, log_file=None,
+              reporter=None, num_threads=None):
+        """Train a single topic model.
+        
+        Parameters:
+        - num_topics (str): The number of topics in the model.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'. Defaults to a progress bar, or to console output if `progress_bar` is False.
+        - num_threads (int): The number of threads MALLET should use. If None, MALLET's default of 1 is used.
+        
+        MALLET's output is read by a `TrainingMonitor`, which saves the log likelihood at each
+        reported iteration, the elapsed time and the number of tokens sampled per second in
+        `telemetryN.tsv` in the model's subdirectory. Read it with `get_telemetry()`.
+
+        Raises `RuntimeError` if MALLET cannot be started or exits with an error.
+
+        Progress monitor borrowed from TETHNE: https://diging.github.io/tethne/_modules/tethne/model/corpus/mallet.html
+        """
+        # Define model variables
+        timer = Timer()
+        if reporter is None:
+            reporter = 'jupyter' if progress_bar is not False else 'console'
+        reporter = get_reporter(reporter)
+        self.retire_inferred(num_topics, reporter)
+        command = self.get_train_command(num_topics, num_threads)
+        returncode = self.run_training(num_topics, command, self.num_iterations, display_output=display_output,
+                                       capture_output=capture_output, log_file=log_file, reporter=reporter,
+                                       num_threads=num_threads)
+        if returncode != 0:
+            raise RuntimeError('MALLET exited with code ' + str(returncode) + '.')
+        reporter.message('Training of topics' + num_topics + ' complete.', size=4)
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+
+    def train_models(self, models=None, display_output=False, capture_output=False, progress_bar=True, log_file=None,
+                     reporter=None, cores=1):
         """Train imported data for multiple models.
+
+        If `cores` is greater than 1, the models are trained concurrently by `train_parallel()`.
         
         Parameters:
         - models (list): A list of model numbers to be imported. By default this is the number given when the object was initialised.       
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'. Defaults to a progress bar, or to console output if `progress_bar` is False.
+        - cores (int): The total number of cores that MALLET may use.
         """
         if models is None:
             models = self.num_topics
+        if reporter is None:
+            reporter = 'jupyter' if progress_bar is not False else 'console'
+        reporter = get_reporter(reporter)
+        if cores > 1:
+            self.train_parallel(models, cores, display_output=display_output, capture_output=capture_output,
+                                log_file=log_file, reporter=reporter)
+            return
         for topic_num in models:
-            display(HTML('<h4>Training topics' + str(topic_num) + '...</h4>'))
+            reporter.message('Training topics' + str(topic_num) + '...', size=4)
             try:
                 result = self.train(str(topic_num),
                                     display_output,
                                     capture_output=capture_output,
                                     progress_bar=progress_bar,
-                                    log_file=log_file)
-            except RuntimeError:
-                display(HTML('<p style="color: red;">Error! Training failed for topics' + str(topic_num) + '.</p>'))
+                                    log_file=log_file,
+                                    reporter=reporter)
+            except RuntimeError as e:
+                reporter.message('Error! Training failed for topics' + str(topic_num) + '. ' + str(e), 'red')
+
+    def train_parallel(self, models, cores, display_output=False, capture_output=False, log_file=None, reporter=None):
+        """Train several topic models concurrently within a total number of cores.
+
+        The models are started largest first, since models with more topics take longer to
+        train. Up to `cores` models run at once, and the free cores are divided between the
+        models started at the same time and passed to MALLET with `--num-threads`. When a
+        model finishes, its cores are given to the next model. The combined progress of all
+        the models is displayed in a single progress bar, with the progress of each running
+        model in the status text.
+
+        Parameters:
+        - models (list): A list of model numbers to be trained.
+        - cores (int): The total number of cores that MALLET may use.
+        - display_output (bool): Print MALLET's output, with each line prefixed by the model name.
+        - capture_output (bool): Print each model's output when it has finished.
+        - log_file (str): A file to which MALLET's output is appended, with each line prefixed by the model name.
+        - reporter (str or Reporter): 'jupyter', 'console' or 'silent'.
+
+        Returns a list of the models for which training failed.
+        """
+        timer = Timer()
+        reporter = get_reporter(reporter)
+        pending = sorted([str(topic_num) for topic_num in models], key=int, reverse=True)
+        max_jobs = min(len(pending), cores)
+        progress = {topic_num: 0 for topic_num in pending}
+        total_iters = self.num_iterations * len(pending)
+        output = {topic_num: [] for topic_num in pending}
+        events = queue.Queue() # Lines from every model's monitor
+        running = {} # topic_num -> (process, num_threads)
+        free_cores = cores
+        failed = []
+
+        def status():
+            """Return the progress of each running model."""
+            items = ['topics' + topic_num + ' ' + str(int(100. * progress[topic_num] / max(self.num_iterations, 1))) + '%'
+                     for topic_num in running]
+            if len(pending) > 0:
+                items.append(str(len(pending)) + ' waiting')
+            return ', '.join(items)
+
+        reporter.start('Training ' + str(len(pending)) + ' models...')
+        while len(pending) > 0 or len(running) > 0:
+            # Start as many models as there are free cores and job slots, largest first
+            while len(pending) > 0 and free_cores > 0 and len(running) < max_jobs:
+                slots = min(len(pending), max_jobs - len(running))
+                # Round up, so that the larger models started first get any remaining cores
+                num_threads = -(-free_cores // slots)
+                topic_num = pending.pop(0)
+                self.retire_inferred(topic_num, reporter)
+                command = self.get_train_command(topic_num, num_threads)
+                self.train_command = ' '.join(command)
+                try:
+                    process = Popen(command, stdout=PIPE, stderr=STDOUT)
+                except OSError as e:
+                    reporter.message('Error! MALLET could not be started: ' + str(e), 'red')
+                    failed.append(topic_num)
+                    progress[topic_num] = self.num_iterations
+                    reporter.update(sum(progress.values()), total_iters, force=True, status=status())
+                    continue
+                self.monitor(topic_num, process, events=events, log_file=log_file,
+                             log_prefix='[topics' + topic_num + '] ', num_threads=num_threads).start()
+                running[topic_num] = (process, num_threads)
+                free_cores -= num_threads
+            if len(running) == 0:
+                continue
+            topic_num, line, this_iter = events.get()
+            if line is None:
+                # The model's output has ended, so wait for it to exit and free its cores
+                process, num_threads = running.pop(topic_num)
+                if process.wait() != 0:
+                    failed.append(topic_num)
+                # Count the iterations of a failed model as done, so that the combined progress reaches 100%
+                progress[topic_num] = self.num_iterations
+                free_cores += num_threads
+                reporter.update(sum(progress.values()), total_iters, force=True, status=status())
+                if capture_output == True:
+                    reporter.message(''.join(output[topic_num]))
+                continue
+            if display_output == True:
+                print('[topics' + topic_num + '] ' + line, end='')
+            if capture_output == True:
+                output[topic_num].append(line)
+            if this_iter is None:
+                continue
+            progress[topic_num] = min(this_iter, self.num_iterations)
+            reporter.update(sum(progress.values()), total_iters, status=status())
+        reporter.finish()
+        for topic_num in failed:
+            reporter.message('Error! Training failed for topics' + topic_num + '.', 'red')
+        reporter.message('Training of ' + str(len(models) - len(failed)) + ' model(s) complete.', size=4)
+        reporter.message('Time elapsed: %s' % timer.get_time_elapsed())
+        return failed
@@ -12,23 +12,44 @@ prepare_import.prepare_data(json_dir)
 prepare_import.preview(rows=5, clip=200)
 prepare_import.display_log()
 
+To tokenise documents without a `bag_of_words` or `features` table across
+several worker processes, call `prepare_import.prepare_data(json_dir, n_process=4)`.
+
+Rows are written through a single buffered `ImportFileWriter` handle. If the
+`import_file_path` ends in `.gz` or `.zst` (or `compression` is set to `'gzip'`
+or `'zstd'`), the import file is compressed. `Mallet.import_data()` decompresses
+it through a pipe when importing it into MALLET.
+
+If a `cache_file` is given, the features extracted by spaCy are saved in a
+`TokenCache` keyed by the hash of each document's content. Documents which
+have already been parsed with the same language model, by this module or by
+the import or counting tokenizers, are not parsed again, so the import file can
+be prepared again with different POS, tag or entity filters without re-running
+spaCy.
+
 For use with model_topics.ipynb v 2.0.
 
 Last update: 2020-08-12
 """
 
 ## PYTHON IMPORTS
+import gzip
+import io
 import json
+import math
 import os
 import re
 import sys
 import spacy
+from multiprocessing import Pool
 from spacy.tokenizer import Tokenizer
-from collections import Counter
 from IPython.display import display, HTML
 from itertools import islice
 
+from bag_of_words import bag_of_words
+from compact_features import CompactFeatures, is_compact
 from timer import Timer
+from token_cache import TokenCache, features_table
 
 ## CONSTANTS
 LINEBREAK_REGEX = re.compile(r'((\r\n)|[\n\v])+')
@@ -37,6 +58,90 @@ PREFIX_RE = re.compile(r'''^[\[\]\("'\.,;:-]''')
 SUFFIX_RE = re.compile(r'''[\[\]\)"'\.,;:-]$''')
 INFIX_RE = re.compile(r'''[-~]''')
 SIMPLE_URL_RE = re.compile(r'''^https?://''')
+ARTICLE_RE = re.compile('the_|a_|an_')
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+PREPARE_ERROR = 'Could not prepare file for import.'
+
+## ImportFileWriter CLASS
+class ImportFileWriter:
+    """Write rows to a MALLET import file through a single buffered handle."""
+
+    def __init__(self, import_file_path, compression=None, buffer_rows=1000, mode='w'):
+        """Initialize the class.
+
+        Parameters:
+        - import_file_path (str): The path to the import file.
+        - compression (str): None, 'gzip', or 'zstd'. By default, inferred from the file extension.
+        - buffer_rows (int): The number of rows to hold in memory before flushing them to the file.
+        - mode (str): 'w' to create a new file or 'a' to append to an existing file.
+        """
+        self.import_file_path = import_file_path
+        if compression is None:
+            compression = get_compression(import_file_path)
+        self.compression = compression
+        self.buffer_rows = buffer_rows
+        self.mode = mode
+        self.buffer = []
+        self.handle = None
+        self.row_count = 0
+
+    def __enter__(self):
+        """Open the writer in a `with` statement."""
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flush and close the writer at the end of a `with` statement."""
+        self.close()
+
+    def open(self):
+        """Open the file handle."""
+        if self.handle is None:
+            self.handle = open_import_file(self.import_file_path, self.mode, self.compression)
+        return self
+
+    def write(self, bow_row):
+        """Add a row to the buffer, flushing the buffer when it is full."""
+        self.buffer.append(bow_row.strip())
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the file in a single call."""
+        if self.buffer:
+            self.open()
+            self.handle.write('\n'.join(self.buffer) + '\n')
+            self.row_count += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        """Flush any remaining rows and close the file handle."""
+        self.flush()
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+def get_compression(import_file_path):
+    """Return the compression implied by a file extension."""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(import_file_path)[1])
+
+def open_import_file(import_file_path, mode='r', compression=None):
+    """Open a plain or compressed import file as text.
+
+    zstd compression requires the optional `zstandard` package.
+    """
+    if compression is None:
+        compression = get_compression(import_file_path)
+    if compression == 'gzip':
+        return gzip.open(import_file_path, mode + 't', encoding='utf-8')
+    elif compression == 'zstd':
+        import zstandard
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(open(import_file_path, 'rb'), closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(open(import_file_path, mode + 'b'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    else:
+        return open(import_file_path, mode, encoding='utf-8')
 
 ## MalletImport CLASS
 class PrepareMalletImport:
@@ -44,13 +149,16 @@ class PrepareMalletImport:
 
     def __init__(self, import_file_path, model_dir, language_model='en_core_web_sm', stoplist_file=None,
                  strip_digits=True, include_pos=None, include_tags=None, use_lemmas=False,
-                 exclude_entity_types=None, use_existing_bow=True, log_file='mallet_import_log.txt'):
+                 exclude_entity_types=None, use_existing_bow=True, log_file='mallet_import_log.txt',
+                 compression=None, cache_file=None, max_cache_bytes=1024 * 1024 * 1024):
         """Initialize the class.
 
         Note: The default model should be changed to 'en_core_web_lg'
         in the production environment.
         """
         self.import_file_path = import_file_path
+        self.compression = compression
+        self.writer = None
         self.model_dir = model_dir
         self.language_model = language_model
         self.stoplist = self.load_stoplist(stoplist_file)
@@ -62,6 +170,11 @@ class PrepareMalletImport:
         self.use_existing_bow = use_existing_bow
         self.log_file = log_file
         self.log = ''
+        self.failed = []
+        self.nlp = None
+        self.cache = None
+        if cache_file is not None:
+            self.cache = TokenCache(cache_file, language_model, self.cache_options(), max_cache_bytes)
         if self.stoplist is not None:
             self.strip_stopwords = True
         self.use_filters = False
@@ -70,20 +183,24 @@ class PrepareMalletImport:
             if isinstance(filter, list):
                 self.use_filters = True
 
+    def __getstate__(self):
+        """Exclude the import file writer and spaCy pipeline when the object is copied to a worker process."""
+        state = self.__dict__.copy()
+        state['writer'] = None
+        state['nlp'] = None
+        return state
+
     def bagify(self, tokens, trim_punct=True):
         """Convert a list of values to a dict of value frequencies.
 
         Parameters:
         - trim_punct (Bool): If True, strips attached punctuation that may have survived tokenisation.
         """
-        # An attempt to strip predictably meaningless stray punctuation
-        punct = re.compile(r'\.\W|\W\.|^[\!\?\(\),;:\[\]\{\}]|[\!\?\(\),;:\[\]\{\}]$')
-        # Make sure we are working with a list of values
-        if trim_punct == True:
-            tokens = [re.sub(punct, '', token) for token in tokens]
-        else:
-            tokens = [token for token in tokens]
-        return dict(Counter(tokens))
+        return bag_of_words(tokens, trim_punct=trim_punct)
+
+    def cache_options(self):
+        """Return the pipeline settings which identify this object's entries in the token cache."""
+        return {'pipeline': 'we1s', 'spacy': spacy.__version__}
 
     def custom_tokenizer(self):
         """Add custom tokenizer settings."""
@@ -100,7 +217,7 @@ class PrepareMalletImport:
         - clip (int): The number of characters after which the row will be clipped.
         """
         try:
-            with open(self.import_file_path, 'r', encoding='utf-8') as f:
+            with open_import_file(self.import_file_path, 'r', self.compression) as f:
                 if rows is not None:
                     result = list(islice(f, rows))
                     if clip is not None:
@@ -134,7 +251,13 @@ class PrepareMalletImport:
             display(HTML('<p>No errors are listed in the log.</p>'))
 
     def filter_features(self, features):
-        """Filter features by POS, tag, or entity types."""
+        """Filter features by POS, tag, or entity types.
+
+        A compact features table is filtered on its integer columns and returned as a list of lists with a header row.
+        """
+        if is_compact(features):
+            compact = CompactFeatures(features)
+            return compact.table(compact.filter(self.include_pos, self.include_tags, self.exclude_entity_types))
         exclude_entity_types = self.exclude_entity_types
         if exclude_entity_types is None:
             exclude_entity_types = []
@@ -181,6 +304,15 @@ class PrepareMalletImport:
         else:
             return [getattr(token, form) for token in doc]
 
+    def get_cached_tokens(self, columns):
+        """Return a list of tokens from cached feature columns, applying the POS, tag, and entity filters."""
+        features = features_table(columns)[1:]
+        if self.use_filters:
+            features = self.filter_features(features)
+        if self.use_lemmas:
+            return [feature[2] for feature in features]
+        return [feature[0] for feature in features]
+
     def get_bow_row(self, filename, index, bag):
         """Convert a dictionary bag of words to a sequence of terms based on term counts.
 
@@ -191,7 +323,8 @@ class PrepareMalletImport:
         - self.strip_stopwords (Bool): Boolean to remove words from a custom list.
         - self.strip_digits (Bool): Boolean to remove digits from a custom list.
         """
-        row = filename + ' ' + str(index) + ' '
+        # Collect the terms in a list and join them once to avoid repeated string concatenation
+        row = [filename, str(index)]
         try:
             for k, v in bag.items():
                 # Another check on stray punctuation
@@ -203,19 +336,27 @@ class PrepareMalletImport:
                 # Otherwise, handle stop words and add the row
                 else:
                     if not self.strip_stopwords:
-                        term = k.replace(' ', '_') + ' '
-                        terms = (term * v)
-                        row += terms
+                        row.extend([k.replace(' ', '_')] * v)
                     elif self.strip_stopwords and k.lower() not in self.stoplist:
-                        term = k.replace(' ', '_') + ' '
-                        term = re.sub('the_|a_|an_', '', term)
-                        terms = (term * v)
-                        row += terms
+                        term = ARTICLE_RE.sub('', k.replace(' ', '_'))
+                        row.extend([term] * v)
                     else:
                         pass
         except (RuntimeError, TypeError):
             self.log += filename + ',Could not generate row from bag of words.\n'
-        return row.strip()
+        return ' '.join(row).strip()
+
+    def load_pipeline(self):
+        """Load the language model with custom tokenizer and entity merger.
+
+        The pipeline is only loaded the first time it is requested and is
+        then reused for every document.
+        """
+        if self.nlp is None:
+            self.nlp = spacy.load(self.language_model)
+            self.nlp.tokenizer = self.custom_tokenizer()
+            self.nlp.add_pipe(self.skip_ents, after='ner')
+        return self.nlp
 
     def load_stoplist(self, stoplist_file):
         """Load the stoplist.
@@ -242,13 +383,35 @@ class PrepareMalletImport:
         except (IOError, ValueError):
             self.log += filepath + ',Could not read file.\n'
 
-    def save(self, bow_row):
-        """Append the row to the import file."""
+    def open_writer(self):
+        """Open a buffered writer for the import file."""
         if not os.path.exists(self.model_dir):
             os.makedirs(self.model_dir)
+        self.writer = ImportFileWriter(self.import_file_path, compression=self.compression, mode='a').open()
+        return self.writer
+
+    def close_writer(self):
+        """Flush and close the import file writer."""
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except IOError:
+                self.log += self.import_file_path + ',Could not append row to import file.\n'
+            self.writer = None
+
+    def save(self, bow_row):
+        """Append the row to the import file.
+
+        If a writer has been opened with `open_writer()`, the row is buffered.
+        Otherwise, the file is opened and the row is appended immediately.
+        """
         try:
-            with open(self.import_file_path, 'a', encoding='utf-8') as f:
-                f.write(bow_row.strip() + '\n')
+            if self.writer is not None:
+                self.writer.write(bow_row)
+            else:
+                self.open_writer()
+                self.writer.write(bow_row)
+                self.close_writer()
         except IOError:
             self.log += self.import_file_path + ',Could not append row to import file.\n'
 
@@ -276,54 +439,154 @@ class PrepareMalletImport:
                     retokenizer.merge(ent, attrs=attrs)
         return doc
 
-    def prepare_data(self, json_path):
-        """Prepare a file or directory for import."""
+    def prepare_data(self, json_path, n_process=1, chunk_size=None):
+        """Prepare a file or directory for import.
+
+        Parameters:
+        - json_path (str): The path to a json file or a directory of json files.
+        - n_process (int): The number of worker processes to use for a directory. Each
+          worker loads its own spaCy pipeline once.
+        - chunk_size (int): The number of files sent to a worker at a time. By default,
+          the file list is divided into four chunks per worker.
+        """
         timer = Timer()
+        self.failed = []
         if os.path.exists(self.import_file_path):
             os.remove(self.import_file_path)
-        if os.path.isfile(json_path):
-            doc = self.read_manifest(json_path)
-            self.prepare_data_file(doc, json_path, 0)
-        else:
-            files = sorted(file for file in os.listdir(json_path) if file.endswith('.json'))
-            for i, file in enumerate(files):
-                file = json_path + '/' + file
-                doc = self.read_manifest(file)
-                self.prepare_data_file(doc, file, i)
+        try:
+            if os.path.isfile(json_path):
+                doc = self.read_manifest(json_path)
+                self.prepare_data_file(doc, json_path, 0)
+            elif n_process is not None and n_process > 1:
+                self.prepare_data_parallel(json_path, n_process, chunk_size)
+            else:
+                self.open_writer()
+                files = sorted(file for file in os.listdir(json_path) if file.endswith('.json'))
+                for i, file in enumerate(files):
+                    file = json_path + '/' + file
+                    doc = self.read_manifest(file)
+                    self.prepare_data_file(doc, file, i)
+        finally:
+            self.close_writer()
+            if self.cache is not None:
+                self.cache.commit()
         display(HTML('<h4>Done!</h4>'))
+        if len(self.failed) > 0:
+            display(HTML('<p style="color: red;">' + str(len(self.failed)) + ' file(s) could not be prepared for import and were skipped. See the log for details.</p>'))
         print('Time elapsed: %s' % timer.get_time_elapsed())
 
+    def prepare_data_parallel(self, json_dir, n_process, chunk_size=None):
+        """Prepare a directory for import using a pool of worker processes.
+
+        The sorted file list is split into contiguous chunks. The rows returned
+        by the workers are merged into the import file in the original index order.
+        """
+        files = sorted(file for file in os.listdir(json_dir) if file.endswith('.json'))
+        if len(files) == 0:
+            return
+        if chunk_size is None:
+            chunk_size = max(1, math.ceil(len(files) / (n_process * 4)))
+        indexed_files = [(i, json_dir + '/' + file) for i, file in enumerate(files)]
+        chunks = [indexed_files[i:i + chunk_size] for i in range(0, len(indexed_files), chunk_size)]
+        # Close the cache's database connection, since a forked worker must not share it
+        if self.cache is not None:
+            self.cache.close()
+        with Pool(n_process, initializer=init_prepare_worker, initargs=(self,)) as pool:
+            # Open the writer after the workers have started so that they do not inherit it
+            self.open_writer()
+            # imap returns the chunks in the order in which they were submitted
+            for rows, log, failed in pool.imap(prepare_worker_chunk, chunks):
+                for bow_row in rows:
+                    self.save(bow_row)
+                self.log += log
+                self.failed.extend(failed)
+                for filename in failed:
+                    self.log += filename + ',' + PREPARE_ERROR + '\n'
+        if self.log != '':
+            with open(self.log_file, 'a') as f:
+                f.write(self.log)
+
+    def get_bag(self, doc):
+        """Return a bag of words for a doc.
+
+        Looks for a `bag_of_words`, then a `features` table; otherwise, the content is
+        tokenised with spaCy.
+        """
+        if self.use_existing_bow and 'bag_of_words' in doc and self.use_filters is None and self.use_lemmas is None:
+            return doc['bag_of_words']
+        elif 'features' in doc and is_compact(doc['features']):
+            # Filter the integer columns and decode only the selected tokens
+            compact = CompactFeatures(doc['features'])
+            rows = None
+            if self.use_filters:
+                rows = compact.filter(self.include_pos, self.include_tags, self.exclude_entity_types)
+            column = 'lemma' if self.use_lemmas else 'token'
+            return self.bagify(compact.values(column, rows))
+        elif 'features' in doc:
+            if self.use_filters:
+                features = self.filter_features(doc['features'])
+            else:
+                features = doc['features']
+            if self.use_lemmas:
+                tokens = [feature[2] for feature in features[1:]]
+            else:
+                tokens = [feature[0] for feature in features[1:]]
+            return self.bagify(tokens)
+        elif self.cache is not None:
+            # Read the features from the token cache, parsing the content only if it is not cached
+            columns = self.cache.parse(doc['content'], self.load_pipeline())
+            return self.bagify(self.get_cached_tokens(columns))
+        else:
+            # Create a spaCy document with the pipeline loaded once, extract tokens, then bagify
+            self.spacy_doc = self.load_pipeline()(doc['content'])
+            tokens = self.get_tokens(self.spacy_doc)
+            return self.bagify(tokens)
+
     def prepare_data_file(self, doc, filepath, index):
         """Prepare a single file for import."""
         filename = os.path.basename(filepath)
         try:
-            # Look for bag_of_words, then features; otherwise, tokenise with spaCy
-            if self.use_existing_bow and 'bag_of_words' in doc and self.use_filters is None and self.use_lemmas is None:
-                bag = doc['bag_of_words']
-            elif 'features' in doc:
-                if self.use_filters:
-                    features = self.filter_features(doc['features'])
-                else:
-                    features = doc['features']
-                if self.use_lemmas:
-                    tokens = [feature[2] for feature in features[1:]]
-                else:
-                    tokens = [feature[0] for feature in features[1:]]
-                bag = self.bagify(tokens)
-            else:
-                # Load the language model with custom tokenizer and entity merger
-                self.nlp = spacy.load(self.language_model)
-                self.nlp.tokenizer = self.custom_tokenizer()
-                self.nlp.add_pipe(self.skip_ents, after='ner')
-                # Create a spaCy document, extract tokens, then bagify
-                self.spacy_doc = self.nlp(doc['content'])
-                tokens = self.get_tokens(self.spacy_doc)
-                bag = self.bagify(tokens)
+            bag = self.get_bag(doc)
             # Create a row and save it to the import file
             bow_row = self.get_bow_row(filename, index, bag)
             self.save(bow_row)
         except (RuntimeError, TypeError):
-            pass
+            self.failed.append(filename)
+            self.log += filename + ',' + PREPARE_ERROR + '\n'
         if self.log is not '':
             with open(self.log_file, 'a') as f:
                 f.write(self.log)
+
+
+## WORKER FUNCTIONS
+# Each worker process holds its own copy of the PrepareMalletImport object
+# so that the spaCy pipeline is loaded only once per process.
+worker_import = None
+
+def init_prepare_worker(prepare_import):
+    """Initialise a worker process with a PrepareMalletImport object."""
+    global worker_import
+    worker_import = prepare_import
+    worker_import.log = ''
+    # A forked worker inherits the parent's object without pickling it, so drop any
+    # inherited connection and let the worker open its own
+    if worker_import.cache is not None:
+        worker_import.cache.connection = None
+
+def prepare_worker_chunk(chunk):
+    """Return the bag of words rows, log and failed filenames for a chunk of (index, filepath) tuples."""
+    rows = []
+    failed = []
+    for index, filepath in chunk:
+        doc = worker_import.read_manifest(filepath)
+        try:
+            bag = worker_import.get_bag(doc)
+            rows.append(worker_import.get_bow_row(os.path.basename(filepath), index, bag))
+        except (RuntimeError, TypeError):
+            failed.append(os.path.basename(filepath))
+    # Commit the chunk's new cache entries, since worker processes are not closed explicitly
+    if worker_import.cache is not None:
+        worker_import.cache.commit()
+    log = worker_import.log
+    worker_import.log = ''
+    return rows, log, failed
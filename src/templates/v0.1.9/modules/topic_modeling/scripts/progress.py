@@ -0,0 +1,189 @@
+"""progress.py.
+
+Reports the progress of long-running loops and displays messages in a
+Jupyter notebook, on the console, or not at all, so that the same classes
+can be run in a notebook, from the command line, or by a batch scheduler.
+
+Three reporters are available:
+
+- `JupyterReporter`: Displays an `ipywidgets` progress bar and HTML messages.
+- `ConsoleReporter`: Prints a percentage and plain text messages.
+- `SilentReporter`: Displays nothing.
+
+Progress updates are rate-limited: the display is only changed if at least
+`interval` seconds have passed since the last change, unless the update is
+forced. An update may also set a short status text, such as the progress of
+each job in a batch, which is displayed after the percentage. Use
+`get_reporter()` to select a reporter by name.
+
+Sample Usage:
+
+```python
+reporter = get_reporter('console')
+reporter.start('Importing...')
+for i, item in enumerate(items):
+    ...
+    reporter.update(i + 1, len(items))
+reporter.finish()
+reporter.message('Done!', 'green', 4)
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import sys
+import time
+
+try:
+    import ipywidgets
+    from IPython.display import display, HTML
+    from ipywidgets import HBox, IntProgress, Label
+except ImportError:
+    ipywidgets = None
+
+# Constants
+REPORTERS = ['jupyter', 'console', 'silent']
+
+def get_reporter(reporter=None, environment='jupyter', interval=0.5):
+    """Return a reporter object.
+
+    Parameters:
+    - reporter (str or Reporter): 'jupyter', 'console', 'silent', or an existing reporter, which is returned unchanged.
+    - environment (str): Used if `reporter` is None. 'jupyter' selects the Jupyter reporter, if `ipywidgets` is installed, and anything else the console reporter.
+    - interval (float): The minimum number of seconds between progress updates.
+    """
+    if isinstance(reporter, Reporter):
+        return reporter
+    if reporter is None:
+        reporter = 'jupyter' if environment == 'jupyter' else 'console'
+    if reporter not in REPORTERS:
+        raise ValueError('The reporter must be one of ' + ', '.join(REPORTERS) + '.')
+    if reporter == 'jupyter' and ipywidgets is not None:
+        return JupyterReporter(interval)
+    elif reporter == 'silent':
+        return SilentReporter(interval)
+    return ConsoleReporter(interval)
+
+class Reporter():
+    """Track progress and rate-limit updates. Subclasses display the progress."""
+
+    def __init__(self, interval=0.5):
+        """Initialise the reporter."""
+        self.interval = interval
+        self.label = ''
+        self.value = 0
+        self.status = ''
+        self.last_update = 0
+
+    def finish(self):
+        """Display the final progress value."""
+        self.render(self.value)
+
+    def message(self, msg, color='', size=None):
+        """Display a message."""
+        pass
+
+    def render(self, value):
+        """Display a progress value between 0 and 100."""
+        pass
+
+    def start(self, label='Progress:'):
+        """Start reporting the progress of a loop."""
+        self.label = label
+        self.value = 0
+        self.status = ''
+        self.last_update = 0
+
+    def update(self, done, total, force=False, status=None):
+        """Set the progress to `done` out of `total` items and, optionally, the status text.
+
+        The display is only changed if `interval` seconds have passed since the last change.
+        """
+        self.value = int(100. * done/max(total, 1))
+        if status is not None:
+            self.status = status
+        now = time.time()
+        if force or now - self.last_update >= self.interval:
+            self.render(self.value)
+            self.last_update = now
+
+class SilentReporter(Reporter):
+    """Display nothing."""
+
+    pass
+
+class ConsoleReporter(Reporter):
+    """Print progress and plain text messages."""
+
+    def __init__(self, interval=0.5, stream=None):
+        """Initialise the reporter."""
+        super().__init__(interval)
+        self.stream = stream if stream is not None else sys.stdout
+        self.rendered = None
+        self.rendered_length = 0
+
+    def end_line(self):
+        """End the progress line, if one has been printed."""
+        if self.rendered is not None:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.rendered = None
+            self.rendered_length = 0
+
+    def finish(self):
+        """Display the final progress value and end the line."""
+        self.render(self.value)
+        self.end_line()
+
+    def message(self, msg, color='', size=None):
+        """Print a message on a new line."""
+        self.end_line()
+        print(msg, file=self.stream)
+
+    def render(self, value):
+        """Print the progress and status on the current line if they have changed."""
+        if (value, self.status) != self.rendered:
+            line = self.label + ' {0}%'.format(value)
+            if self.status != '':
+                line += ' ' + self.status
+            # Pad the line to overwrite a longer status
+            previous = self.rendered_length
+            self.stream.write('\r' + line + ' ' * max(previous - len(line), 0))
+            self.stream.flush()
+            self.rendered = (value, self.status)
+            self.rendered_length = len(line)
+
+class JupyterReporter(Reporter):
+    """Display an `ipywidgets` progress bar and HTML messages."""
+
+    def __init__(self, interval=0.5):
+        """Initialise the reporter."""
+        super().__init__(interval)
+        self.pbar = None
+        self.percent = None
+
+    def message(self, msg, color='', size=None):
+        """Display a message as HTML."""
+        if size is None:
+            start_tag = '<p style="color: ' + color + ';">'
+            end_tag = '</p>'
+        else:
+            start_tag = '<h' + str(size) + ' style="color: ' + color + ';">'
+            end_tag = '</h' + str(size) + '>'
+        display(HTML(start_tag + msg + end_tag))
+
+    def render(self, value):
+        """Update the progress bar."""
+        if self.pbar is not None:
+            self.pbar.value = value
+            self.percent.value = '{0}%'.format(value)
+            if self.status != '':
+                self.percent.value += ' ' + self.status
+
+    def start(self, label='Progress:'):
+        """Display a new progress bar."""
+        super().start(label)
+        self.pbar = IntProgress(min=0, max=100) # instantiate the progress bar
+        self.percent = ipywidgets.HTML(value='0%')
+        display(HBox([Label(label), self.pbar, self.percent]))
@@ -0,0 +1,183 @@
+"""training_telemetry.py.
+
+Reads the output of MALLET's `train-topics` command on a background thread
+and records the progress of training.
+
+MALLET prints the log likelihood per token every 10 iterations in lines like
+`<250> LL/token: -8.91234`, and the number of tokens in the corpus near the
+start of training in a line like `total tokens: 1234567`. A
+`TrainingMonitor` parses each line with precompiled patterns, passes it to a
+queue so that the progress can be displayed, and appends a row to a time
+series for each log likelihood line:
+
+- `iteration`: The iteration number.
+- `ll_per_token`: The log likelihood per token.
+- `elapsed_seconds`: The number of seconds since training started.
+- `tokens_per_second`: The number of tokens sampled per second since the previous row.
+- `num_threads`: The number of threads used by MALLET.
+- `host`: The name of the computer, so that series from different machines can be compared.
+
+When the output ends, the time series is saved as a tab-separated file with
+a header row. It is not saved with a `.csv` extension because the Dfr-Browser
+and Topic Bubbles modules read any `.csv` file in a model's subdirectory as
+its scaled topics file. Lines written to the MALLET log file are buffered and
+written every `flush_interval` seconds instead of one at a time.
+
+Sample Usage:
+
+```python
+process = Popen(command, stdout=PIPE, stderr=STDOUT)
+monitor = TrainingMonitor('50', process.stdout, telemetry_file='telemetry50.tsv').start()
+for name, line, iteration in monitor.lines():
+    ...
+rows = read_telemetry('telemetry50.tsv')
+```
+
+Last update: 2021-02-15
+"""
+
+# Python imports
+import csv
+import platform
+import queue
+import re
+import threading
+import time
+
+# Constants
+ITERATION_RE = re.compile(r'^<(\d+)>')
+LL_RE = re.compile(r'LL/token: ([-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+TOTAL_TOKENS_RE = re.compile(r'^total tokens: (\d+)')
+TELEMETRY_COLUMNS = ['iteration', 'll_per_token', 'elapsed_seconds', 'tokens_per_second', 'num_threads', 'host']
+
+def read_telemetry(telemetry_file):
+    """Return the rows of a telemetry file as a list of dicts with numeric values."""
+    rows = []
+    with open(telemetry_file, 'r', newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            rows.append({
+                'iteration': int(row['iteration']),
+                'll_per_token': float(row['ll_per_token']),
+                'elapsed_seconds': float(row['elapsed_seconds']),
+                'tokens_per_second': float(row['tokens_per_second']) if row['tokens_per_second'] != '' else None,
+                'num_threads': int(row['num_threads']),
+                'host': row['host']
+            })
+    return rows
+
+class TrainingMonitor():
+    """Parse, log and record the output of a MALLET training process on a background thread."""
+
+    def __init__(self, name, stream, events=None, log_file=None, log_prefix='', telemetry_file=None,
+                 num_threads=1, flush_interval=5, rows=None):
+        """Initialise the monitor.
+
+        Parameters:
+        - name (str): The name of the model, which is included in each event.
+        - stream (file): The MALLET process's standard output, opened in binary mode.
+        - events (Queue): A queue to which (name, line, iteration) tuples are passed. The iteration is None if the line does not report one. A line of None marks the end of the output. If None, a new queue is created.
+        - log_file (str): A file to which the output is appended. If None, the output is not logged.
+        - log_prefix (str): A string added to the start of each logged line.
+        - telemetry_file (str): The tab-separated file in which the time series is saved. If None, it is not saved.
+        - num_threads (int): The number of threads used by MALLET, which is recorded in each row.
+        - flush_interval (float): The number of seconds between writes to the log file.
+        - rows (list): The time series of an earlier run which this run continues. New rows are added after them, with their iterations and elapsed seconds counted from the last earlier row.
+        """
+        self.name = name
+        self.stream = stream
+        self.events = events if events is not None else queue.Queue()
+        self.log_file = log_file
+        self.log_prefix = log_prefix
+        self.telemetry_file = telemetry_file
+        self.num_threads = num_threads
+        self.flush_interval = flush_interval
+        self.host = platform.node()
+        self.rows = list(rows) if rows is not None else []
+        # Continue the iteration and time counts of an earlier run
+        self.iteration_offset = self.rows[-1]['iteration'] if len(self.rows) > 0 else 0
+        self.elapsed_offset = self.rows[-1]['elapsed_seconds'] if len(self.rows) > 0 else 0
+        self.total_tokens = None
+        self.log_buffer = []
+        self.last_flush = time.time()
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def flush_log(self):
+        """Write the buffered lines to the log file."""
+        if self.log_file is not None and len(self.log_buffer) > 0:
+            with open(self.log_file, 'a') as f:
+                f.write(''.join(self.log_buffer))
+        self.log_buffer = []
+        self.last_flush = time.time()
+
+    def lines(self):
+        """Yield (name, line, iteration) tuples until the output ends. Use only if the monitor has its own queue."""
+        while True:
+            event = self.events.get()
+            if event[1] is None:
+                return
+            yield event
+
+    def parse(self, line):
+        """Return the iteration number reported by a line, or None, and record any log likelihood."""
+        match = ITERATION_RE.match(line)
+        if match is None:
+            match = TOTAL_TOKENS_RE.match(line)
+            if match is not None:
+                self.total_tokens = int(match.group(1))
+            return None
+        iteration = int(match.group(1))
+        ll_match = LL_RE.search(line, match.end())
+        if ll_match is not None:
+            self.record(iteration, float(ll_match.group(1)))
+        return iteration
+
+    def read(self):
+        """Read the output until it ends, then flush the log, save the time series and send the end marker."""
+        try:
+            for data in iter(self.stream.readline, b''):
+                line = data.decode('utf-8', errors='replace')
+                iteration = self.parse(line)
+                if self.log_file is not None:
+                    self.log_buffer.append(self.log_prefix + line)
+                    if time.time() - self.last_flush >= self.flush_interval:
+                        self.flush_log()
+                self.events.put((self.name, line, iteration))
+        finally:
+            self.flush_log()
+            self.save()
+            self.events.put((self.name, None, None))
+
+    def record(self, iteration, ll_per_token):
+        """Add a row to the time series."""
+        iteration += self.iteration_offset
+        elapsed = time.time() - self.start_time + self.elapsed_offset
+        tokens_per_second = None
+        if self.total_tokens is not None:
+            previous_iteration, previous_elapsed = self.iteration_offset, self.elapsed_offset
+            if len(self.rows) > 0:
+                previous_iteration = self.rows[-1]['iteration']
+                previous_elapsed = self.rows[-1]['elapsed_seconds']
+            if elapsed > previous_elapsed:
+                tokens_per_second = self.total_tokens * (iteration - previous_iteration) / (elapsed - previous_elapsed)
+        self.rows.append({'iteration': iteration, 'll_per_token': ll_per_token, 'elapsed_seconds': elapsed,
+                          'tokens_per_second': tokens_per_second, 'num_threads': self.num_threads,
+                          'host': self.host})
+
+    def save(self):
+        """Save the time series as a tab-separated file."""
+        if self.telemetry_file is None or len(self.rows) == 0:
+            return
+        with open(self.telemetry_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TELEMETRY_COLUMNS, delimiter='\t')
+            writer.writeheader()
+            for row in self.rows:
+                row = dict(row, elapsed_seconds=round(row['elapsed_seconds'], 3))
+                if row['tokens_per_second'] is not None:
+                    row['tokens_per_second'] = round(row['tokens_per_second'], 1)
+                writer.writerow(row)
+
+    def start(self):
+        """Start reading the output on the background thread and return the monitor."""
+        self.thread.start()
+        return self
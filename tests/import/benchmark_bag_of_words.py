@@ -0,0 +1,34 @@
+"""Compare the speed of the single-pass `bag_of_words()` with cleaning each token separately.
+
+Run `python tests/import/benchmark_bag_of_words.py` from the repository root.
+"""
+
+# Python imports
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'import', 'scripts'))
+from bag_of_words import bag_of_words
+from test_bag_of_words import VOCAB, per_token_bag
+
+def benchmark(num_docs=20, doc_length=100000, repeat=3):
+    """Print the number of tokens per second bagged by the single-pass and per-token methods."""
+    generator = random.Random(0)
+    docs = [[generator.choice(VOCAB) for _ in range(doc_length)] for _ in range(num_docs)]
+    num_tokens = num_docs * doc_length
+    for name, method in [('per-token', per_token_bag), ('single-pass', bag_of_words)]:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for doc in docs:
+                method(doc)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print('{0:<12} {1:>12,.0f} tokens/sec'.format(name, num_tokens / best))
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,41 @@
+"""Tests for the `bag_of_words.py` helper shared by the import, counting and topic modeling modules."""
+
+# Python imports
+import filecmp
+import os
+import random
+import re
+import sys
+from collections import Counter
+import pytest
+
+MODULES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9', 'modules')
+sys.path.insert(0, os.path.join(MODULES_DIR, 'import', 'scripts'))
+from bag_of_words import bag_of_words, strip_punct, word_tokens
+
+PUNCT_RE = re.compile(r'\.\W|\W\.|^[\!\?\(\),;:\[\]\{\}]|[\!\?\(\),;:\[\]\{\}]$')
+VOCAB = ['the', 'humanities', 'crisis', '(public', 'university).', 'e.g.', 'said,', 'why?',
+         'U.S.', 'students;', '[sic]', "don't", 'well-being', '1990s', 'data:', '...', '(', ')']
+
+def per_token_bag(tokens):
+    """The original method: clean each token separately, then count."""
+    return dict(Counter([re.sub(PUNCT_RE, '', token) for token in tokens]))
+
+def test_single_pass_matches_per_token_cleaning():
+    generator = random.Random(0)
+    for _ in range(20):
+        tokens = [generator.choice(VOCAB) for _ in range(500)]
+        assert bag_of_words(tokens) == per_token_bag(tokens)
+
+def test_tokens_containing_the_separator_are_cleaned_separately():
+    tokens = ['a\x00b.', '(c', 'd)']
+    assert strip_punct(tokens) == [PUNCT_RE.sub('', token) for token in tokens]
+
+def test_word_tokens_matches_per_token_cleaning():
+    content = 'The (public) university, e.g. U.S. -- ... students; well-being'
+    assert word_tokens(content) == [re.sub(r'\W+', '', token) for token in content.split()]
+
+@pytest.mark.parametrize('module', ['counting', 'topic_modeling'])
+def test_module_copies_are_identical(module):
+    assert filecmp.cmp(os.path.join(MODULES_DIR, 'import', 'scripts', 'bag_of_words.py'),
+                       os.path.join(MODULES_DIR, module, 'scripts', 'bag_of_words.py'), shallow=False)
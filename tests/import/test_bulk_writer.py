@@ -0,0 +1,74 @@
+"""Tests for the import module's `BulkWriter`, run against a `mongomock` collection."""
+
+# Python imports
+import os
+import sys
+import threading
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+from bson.errors import InvalidDocument
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'import', 'scripts'))
+from bulk_writer import BulkWriter
+
+class FailingCollection():
+    """A mongomock collection whose `insert_many()` raises an error for batches containing a chosen filename."""
+
+    def __init__(self, collection, filename, error):
+        self.collection = collection
+        self.filename = filename
+        self.error = error
+
+    def insert_many(self, docs, ordered=True):
+        if any(doc.get('filename') == self.filename for doc in docs):
+            raise self.error
+        return self.collection.insert_many(docs, ordered=ordered)
+
+def run_with_timeout(target, timeout=10):
+    """Run a function on another thread and fail if it does not finish in time."""
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'BulkWriter blocked'
+
+def test_inserts_all_documents_in_batches():
+    collection = mongomock.MongoClient().db.manifests
+    errors = []
+    with BulkWriter(collection, batch_size=3, errors=errors) as writer:
+        for i in range(10):
+            writer.write({'filename': 'doc%d.json' % i})
+    assert collection.count_documents({}) == 10
+    assert writer.inserted_count == 10
+    assert errors == []
+
+def test_partial_failure_records_only_failed_documents():
+    collection = mongomock.MongoClient().db.manifests
+    collection.insert_one({'_id': 1, 'filename': 'existing.json'})
+    errors = []
+    with BulkWriter(collection, batch_size=3, errors=errors) as writer:
+        writer.write({'_id': 0, 'filename': 'a.json'})
+        writer.write({'_id': 1, 'filename': 'b.json'})
+        writer.write({'_id': 2, 'filename': 'c.json'})
+    assert errors == ['b.json']
+    assert writer.inserted_count == 2
+    assert collection.count_documents({}) == 3
+
+def test_unexpected_error_records_batch_and_does_not_block():
+    collection = mongomock.MongoClient().db.manifests
+    failing = FailingCollection(collection, 'bad.json', InvalidDocument('cannot encode object'))
+    errors = []
+    writer = BulkWriter(failing, batch_size=2, errors=errors, max_queued_batches=1)
+    def write_all():
+        writer.write({'filename': 'bad.json'})
+        writer.write({'filename': 'x.json'})
+        # More batches than the queue can hold would block if the writer thread had died
+        for i in range(20):
+            writer.write({'filename': 'doc%d.json' % i})
+        writer.close()
+    run_with_timeout(write_all)
+    assert errors == ['bad.json', 'x.json']
+    assert len(writer.exceptions) == 1
+    assert isinstance(writer.exceptions[0], InvalidDocument)
+    assert collection.count_documents({}) == 20
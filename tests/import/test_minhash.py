@@ -0,0 +1,59 @@
+"""Tests for the near-duplicate detection in the import module's `minhash.py`."""
+
+# Python imports
+import json
+import os
+import random
+import sys
+import pytest
+
+np = pytest.importorskip('numpy')
+
+MODULES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9', 'modules')
+sys.path.insert(0, os.path.join(MODULES_DIR, 'import', 'scripts'))
+from minhash import get_permutations, minhash, near_duplicate_pairs
+
+WORDS = ['crisis', 'humanities', 'university', 'students', 'funding', 'degree', 'liberal', 'arts',
+         'english', 'history', 'philosophy', 'college', 'jobs', 'value', 'reading', 'writing']
+
+def random_content(generator, length=300):
+    return ' '.join(generator.choice(WORDS) for _ in range(length))
+
+def write_docs(directory, contents):
+    filepaths = []
+    for i, content in enumerate(contents):
+        filepath = os.path.join(str(directory), 'doc%03d.json' % i)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump({'name': 'doc%03d' % i, 'content': content}, f)
+        filepaths.append(filepath)
+    return filepaths
+
+def test_signatures_are_32_bit():
+    signature = minhash('the humanities crisis in the public university', get_permutations(16))
+    assert signature.dtype == np.uint32
+
+def test_pairs_link_duplicates_to_the_earlier_file(tmp_path):
+    generator = random.Random(0)
+    original = random_content(generator)
+    edited = original.replace('crisis', 'emergency', 1)
+    unrelated = random_content(generator)
+    filepaths = write_docs(tmp_path, [original, unrelated, edited, original, ''])
+    pairs = near_duplicate_pairs(filepaths, threshold=0.8)
+    assert pairs == [[filepaths[0], filepaths[2]], [filepaths[0], filepaths[3]]]
+
+def test_large_clusters_produce_one_pair_per_duplicate(tmp_path):
+    generator = random.Random(1)
+    original = random_content(generator).split()
+    contents = []
+    for i in range(60):
+        # Even-numbered copies are identical; odd-numbered copies have one word changed
+        words = list(original)
+        if i % 2:
+            words[generator.randrange(len(words))] = 'edited%d' % i
+        contents.append(' '.join(words))
+    contents.append(random_content(generator))
+    filepaths = write_docs(tmp_path, contents)
+    pairs = near_duplicate_pairs(filepaths, threshold=0.8)
+    assert len(pairs) == 59
+    assert {pair[1] for pair in pairs} == set(filepaths[1:60])
+    assert all(filepaths.index(first) < filepaths.index(second) for first, second in pairs)
@@ -0,0 +1,106 @@
+"""Tests for the import module's `MongoDBImport`, run against a `mongomock` database."""
+
+# Python imports
+import importlib.util
+import json
+import os
+import sys
+import threading
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+for requirement in ['pandas', 'chardet', 'datapackage', 'ftfy', 'dateparser', 'libs.deduper.deduper']:
+    pytest.importorskip(requirement)
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9',
+                           'modules', 'import', 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+@pytest.fixture(scope='module')
+def import_module():
+    """Load `import.py`, which cannot be imported by name."""
+    spec = importlib.util.spec_from_file_location('we1s_import', os.path.join(SCRIPTS_DIR, 'import.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def client(import_module, monkeypatch):
+    """Return a mongomock client seeded with 40 documents, used by every `MongoDBImport`."""
+    client = mongomock.MongoClient()
+    client.corpus.articles.insert_many([
+        {'name': 'doc%02d' % i, 'title': 'Document %d' % i, 'content': 'The humanities text %d.' % i}
+        for i in range(40)
+    ])
+    monkeypatch.setattr(import_module, 'MongoClient', lambda uri: client)
+    return client
+
+def run_import(import_module, project_dir, **kwargs):
+    """Run a silent import to a project directory and return the object and the names of the saved manifests."""
+    json_dir = os.path.join(str(project_dir), 'project_data', 'json')
+    kwargs.setdefault('reporter', 'silent')
+    task = import_module.MongoDBImport({}, client='mongodb://localhost', db='corpus', collection='articles',
+                                       project_dir=str(project_dir), json_dir=json_dir,
+                                       logfile=os.path.join(str(project_dir), 'import_log.txt'), **kwargs)
+    task.start_import()
+    names = sorted(file for file in os.listdir(json_dir) if file.endswith('.json') and not file.startswith('_'))
+    return task, names
+
+def test_seeded_sample_is_reproducible(import_module, client, tmp_path):
+    _, first = run_import(import_module, tmp_path / 'first', random_sample=10, random_seed=7)
+    _, second = run_import(import_module, tmp_path / 'second', random_sample=10, random_seed=7)
+    _, other = run_import(import_module, tmp_path / 'other', random_sample=10, random_seed=8)
+    assert len(first) == 10
+    assert first == second
+    assert first != other
+
+def test_sampled_documents_are_fetched_in_batches(import_module, client, tmp_path, monkeypatch):
+    calls = []
+    find = mongomock.collection.Collection.find
+    def counting_find(self, filter=None, *args, **kwargs):
+        if filter is not None and '_id' in filter:
+            calls.append(len(filter['_id']['$in']))
+        return find(self, filter, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, 'find', counting_find)
+    task, names = run_import(import_module, tmp_path, random_sample=25, random_seed=1, batch_size=10)
+    assert len(names) == 25
+    assert calls == [10, 10, 5]
+
+def test_query_result_is_streamed_from_a_cursor(import_module, client, tmp_path):
+    json_dir = os.path.join(str(tmp_path), 'project_data', 'json')
+    task = import_module.MongoDBImport({}, client='mongodb://localhost', db='corpus', collection='articles',
+                                       project_dir=str(tmp_path), json_dir=json_dir, batch_size=7,
+                                       reporter='silent')
+    result = task.query_database()
+    assert not isinstance(result, list)
+    assert task.result_count == 40
+    ids = [doc['_id'] for doc in result]
+    assert ids == sorted(ids)
+    assert len(ids) == 40
+
+def test_manifests_are_written_by_threads(import_module, client, tmp_path, monkeypatch):
+    threads = set()
+    write = import_module.write_mongodb_manifest
+    def recording_write(doc, project_dir):
+        threads.add(threading.current_thread().name)
+        if doc['name'] == 'doc13':
+            return doc['name'] + '.json'
+        return write(doc, project_dir)
+    monkeypatch.setattr(import_module, 'write_mongodb_manifest', recording_write)
+    task, names = run_import(import_module, tmp_path, n_threads=4)
+    assert threading.main_thread().name not in threads
+    assert len(names) == 39
+    assert task.saved_count == 39
+    assert task.errors['invalid_manifest_file'] == ['doc13.json']
+
+def test_content_field_is_filtered_by_required_phrase(import_module, client, tmp_path):
+    client.corpus.articles.update_many({}, {'$rename': {'content': 'body', 'title': 'headline'}})
+    task, names = run_import(import_module, tmp_path, content_field='body', title_field='headline',
+                             required_phrase='text 1')
+    assert names == ['doc01.json'] + ['doc%02d.json' % i for i in range(10, 20)]
+    assert task.delete_count == 29
+    with open(os.path.join(str(tmp_path), 'project_data', 'json', 'doc12.json')) as f:
+        doc = json.load(f)
+    assert doc['content'] == 'The humanities text 12.'
+    assert doc['title'] == 'Document 12'
+    assert 'body' not in doc and 'headline' not in doc
@@ -0,0 +1,61 @@
+"""Tests for the import module's `TokenizerState`."""
+
+# Python imports
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'import', 'scripts'))
+from tokenizer_state import TokenizerState
+
+SETTINGS = {'bagify_features': True, 'method': 'we1s'}
+
+def save(json_dir, filename, doc):
+    with open(os.path.join(json_dir, filename), 'w') as f:
+        f.write(json.dumps(doc))
+
+def test_existing_fields_are_rebuilt_when_content_changes(tmp_path):
+    json_dir = str(tmp_path)
+    doc = {'name': 'doc1', 'content': 'Old text', 'bag_of_words': {'old': 1, 'text': 1}}
+    save(json_dir, 'doc1.json', doc)
+    # First incremental run: the manifest was tokenized before the state file existed
+    state = TokenizerState(json_dir, SETTINGS)
+    assert state.prepare('doc1.json', doc, ['bag_of_words'])
+    state.record('doc1.json', doc)
+    state.close()
+    # The content changes, so the old bag must be dropped
+    doc = {'name': 'doc1', 'content': 'New text', 'bag_of_words': {'old': 1, 'text': 1}}
+    save(json_dir, 'doc1.json', doc)
+    state = TokenizerState(json_dir, SETTINGS)
+    assert not state.is_current('doc1.json')
+    assert state.prepare('doc1.json', doc, ['bag_of_words'])
+    assert 'bag_of_words' not in doc
+    assert state.changed_count == 1
+
+def test_unchanged_content_keeps_fields(tmp_path):
+    json_dir = str(tmp_path)
+    doc = {'name': 'doc1', 'content': 'Text', 'bag_of_words': {'text': 1}}
+    save(json_dir, 'doc1.json', doc)
+    state = TokenizerState(json_dir, SETTINGS)
+    state.prepare('doc1.json', doc, ['bag_of_words'])
+    state.record('doc1.json', doc)
+    state.close()
+    doc['title'] = 'A title'
+    save(json_dir, 'doc1.json', doc)
+    state = TokenizerState(json_dir, SETTINGS)
+    assert not state.prepare('doc1.json', doc, ['bag_of_words'])
+    assert doc['bag_of_words'] == {'text': 1}
+    assert state.unchanged_count == 1
+
+def test_settings_change_rebuilds_existing_fields(tmp_path):
+    json_dir = str(tmp_path)
+    doc = {'name': 'doc1', 'content': 'Text', 'bag_of_words': {'text': 1}}
+    save(json_dir, 'doc1.json', doc)
+    state = TokenizerState(json_dir, SETTINGS)
+    state.prepare('doc1.json', doc, ['bag_of_words'])
+    state.record('doc1.json', doc)
+    state.close()
+    state = TokenizerState(json_dir, dict(SETTINGS, method='plain'))
+    assert state.prepare('doc1.json', doc, ['bag_of_words'])
+    assert 'bag_of_words' not in doc
@@ -0,0 +1,51 @@
+"""Tests for the json_utilities module's `CorpusStore`."""
+
+# Python imports
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'json_utilities', 'scripts'))
+from corpus_store import CorpusStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = CorpusStore(str(tmp_path / 'store'), shard_size=2)
+    for i in range(5):
+        store.add({'name': 'doc%d' % i, 'content': 'Text %d' % i, 'pub_date': '2020'})
+    store.close()
+    return store
+
+def write_json(path, doc):
+    with open(path, 'w') as f:
+        f.write(json.dumps(doc))
+
+def test_json_dir_writes_back_changes(store):
+    with store.json_dir() as json_dir:
+        doc = json.loads(open(os.path.join(json_dir, 'doc1.json')).read())
+        doc['bag_of_words'] = {'text': 1}
+        write_json(os.path.join(json_dir, 'doc1.json'), doc)
+        write_json(os.path.join(json_dir, 'doc5.json'), {'name': 'doc5', 'content': 'New'})
+        os.remove(os.path.join(json_dir, 'doc2.json'))
+    reopened = CorpusStore(store.store_dir)
+    assert reopened.get('doc1.json')['bag_of_words'] == {'text': 1}
+    assert reopened.get('doc5.json')['content'] == 'New'
+    assert 'doc2.json' not in reopened
+    assert reopened.get('doc0.json') == {'name': 'doc0', 'content': 'Text 0', 'pub_date': '2020'}
+    assert len(reopened) == 5
+
+def test_json_dir_merges_selected_fields(store):
+    with store.json_dir(fields=['name', 'content']) as json_dir:
+        write_json(os.path.join(json_dir, 'doc3.json'), {'name': 'doc3', 'content': 'Changed'})
+    assert store.get('doc3.json') == {'name': 'doc3', 'content': 'Changed', 'pub_date': '2020'}
+
+def test_json_dir_read_only_and_on_error(store):
+    with store.json_dir(write_back=False) as json_dir:
+        write_json(os.path.join(json_dir, 'doc0.json'), {'name': 'doc0'})
+    with pytest.raises(RuntimeError):
+        with store.json_dir() as json_dir:
+            write_json(os.path.join(json_dir, 'doc0.json'), {'name': 'doc0'})
+            raise RuntimeError()
+    assert store.get('doc0.json')['content'] == 'Text 0'
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""A stand-in for the `mallet` executable, used to test the topic modeling scripts without MALLET.
+
+`train-topics` prints MALLET-style `total tokens:` and `<N> LL/token:` lines, writes the
+requested output files, with a composition row for each document in the instance file, and exits. Its behaviour is set with environment variables:
+
+- `STUB_MALLET_LOG`: A file to which a line `<num_topics> <num_threads>` is appended when training starts.
+- `STUB_MALLET_EXIT_CODES`: A comma-separated list of `num_topics:code` pairs giving the exit code for a model. Models with a non-zero code stop halfway through training. Other models exit with 0.
+- `STUB_MALLET_DELAY`: The number of seconds to wait before each log likelihood line. Defaults to 0.001.
+
+`import-file` copies its `--input` (or standard input, if the input is `-`) to its `--output`.
+`infer-topics` writes a row to `--output-doc-topics` for each non-empty line of its `--input`,
+with the first word of the line as the document name. Other commands exit with 0.
+"""
+
+# Python imports
+import os
+import sys
+import time
+
+OUTPUT_OPTIONS = ['--output-state', '--output-topic-keys', '--output-doc-topics', '--diagnostics-file',
+                  '--inferencer-filename']
+
+def main(args):
+    options = dict(zip(args[1::2], args[2::2]))
+    if len(args) > 0 and args[0] == 'import-file':
+        data = sys.stdin.read() if options['--input'] == '-' else open(options['--input']).read()
+        with open(options['--output'], 'w') as f:
+            f.write(data)
+        return 0
+    if len(args) > 0 and args[0] == 'infer-topics':
+        with open(options['--input']) as f:
+            names = [line.split()[0] for line in f if line.strip() != '']
+        with open(options['--output-doc-topics'], 'w') as f:
+            f.write('#doc name topic proportion ...\n')
+            for i, name in enumerate(names):
+                f.write('%d\t%s\t0.5\t0.5\n' % (i, name))
+        return 0
+    if len(args) == 0 or args[0] != 'train-topics':
+        return 0
+    num_topics = options['--num-topics']
+    num_iterations = int(options.get('--num-iterations', 1000))
+    exit_codes = dict(item.split(':') for item in os.environ.get('STUB_MALLET_EXIT_CODES', '').split(',') if item)
+    delay = float(os.environ.get('STUB_MALLET_DELAY', 0.001))
+    if 'STUB_MALLET_LOG' in os.environ:
+        with open(os.environ['STUB_MALLET_LOG'], 'a') as f:
+            f.write(num_topics + ' ' + options.get('--num-threads', '1') + '\n')
+    code = int(exit_codes.get(num_topics, 0))
+    last_iteration = num_iterations if code == 0 else num_iterations // 2
+    print('Mallet LDA: ' + num_topics + ' topics', flush=True)
+    print('total tokens: 1000', flush=True)
+    for i in range(10, last_iteration + 1, 10):
+        time.sleep(delay)
+        print('<%d> LL/token: -%.5f' % (i, 9 - i / num_iterations), flush=True)
+    if code == 0:
+        for option in OUTPUT_OPTIONS:
+            if option in options:
+                open(options[option], 'w').close()
+        # Write a composition row for each document in the instance file
+        if '--output-doc-topics' in options and os.path.exists(options.get('--input', '')):
+            with open(options['--input']) as f:
+                names = [line.split()[0] for line in f if line.strip() != '']
+            with open(options['--output-doc-topics'], 'w') as f:
+                f.write('#doc name topic proportion ...\n')
+                for i, name in enumerate(names):
+                    f.write('%d\t%s\t0.5\t0.5\n' % (i, name))
+        print('Total time: 0 seconds', flush=True)
+    return code
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+"""Tests for `Mallet.import_models()`, run with a stub `mallet` executable."""
+
+# Python imports
+import gzip
+import os
+import sys
+import pytest
+
+pytest.importorskip('IPython')
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'topic_modeling', 'scripts'))
+from mallet import Mallet
+
+STUB_MALLET = os.path.join(TESTS_DIR, 'stub_mallet.py')
+
+@pytest.fixture
+def import_file(tmp_path):
+    path = str(tmp_path / 'import.txt')
+    with open(path, 'w') as f:
+        f.write('a.json 0 first document\nb.json 1 second document\n')
+    return path
+
+def test_console_messages_are_plain_text(import_file, tmp_path, capsys):
+    mallet = Mallet([5, 10], str(tmp_path / 'models'), import_file, mallet_path=STUB_MALLET, reporter='console')
+    mallet.import_models(reporter='console')
+    output = capsys.readouterr().out
+    assert 'Setup complete.' in output
+    assert 'Import for topics5 complete!' in output
+    assert 'Import for topics10 complete!' in output
+    assert '<' not in output
+    assert os.path.exists(mallet.model_dir + '/topics10/topics10.mallet')
+
+def cache_files(mallet):
+    return [file for file in os.listdir(mallet.model_dir) if file.startswith('_import_')]
+
+def test_compressed_import_file_is_streamed_to_mallet(tmp_path):
+    import_file = str(tmp_path / 'import.txt.gz')
+    with gzip.open(import_file, 'wt') as f:
+        f.write('a.json 0 first document\n')
+    mallet = Mallet([5], str(tmp_path / 'models'), import_file, mallet_path=STUB_MALLET, reporter='silent')
+    mallet.import_models(reporter='silent')
+    assert mallet.import_command.startswith('gzip -dc ')
+    with open(mallet.model_dir + '/topics5/topics5.mallet') as f:
+        assert f.read() == 'a.json 0 first document\n'
+
+def test_truncated_import_file_is_not_cached(tmp_path):
+    import_file = str(tmp_path / 'import.txt.gz')
+    with gzip.open(import_file, 'wt') as f:
+        f.write(''.join('doc%d.json %d document number %d\n' % (i, i, i) for i in range(5000)))
+    with open(import_file, 'rb') as f:
+        data = f.read()
+    with open(import_file, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    mallet = Mallet([5], str(tmp_path / 'models'), import_file, mallet_path=STUB_MALLET, reporter='silent')
+    assert mallet.import_cached(reporter='silent') is None
+    assert cache_files(mallet) == []
+
+def test_missing_import_file_is_reported(tmp_path, capsys):
+    mallet = Mallet([5], str(tmp_path / 'models'), str(tmp_path / 'missing.txt'), mallet_path=STUB_MALLET,
+                    reporter='silent')
+    mallet.import_models(reporter='console')
+    assert 'Import failed. Training will be skipped for all models.' in capsys.readouterr().out
+    assert not os.path.exists(mallet.model_dir + '/topics5/topics5.mallet')
@@ -0,0 +1,79 @@
+"""Tests for `Mallet.infer_models()`, run with a stub `mallet` executable."""
+
+# Python imports
+import gzip
+import os
+import sys
+import pytest
+
+pytest.importorskip('IPython')
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'topic_modeling', 'scripts'))
+from mallet import Mallet
+
+STUB_MALLET = os.path.join(TESTS_DIR, 'stub_mallet.py')
+
+def read_rows(path):
+    with open(path) as f:
+        return [line.rstrip('\n').split('\t')[0:2] for line in f if not line.startswith('#')]
+
+@pytest.fixture
+def mallet(tmp_path):
+    """Return a `Mallet` object with trained 5- and 10-topic models of two documents."""
+    import_file = str(tmp_path / 'import.txt')
+    with open(import_file, 'w') as f:
+        f.write('a.json 0 first document\nb.json 1 second document\n')
+    mallet = Mallet([5, 10], str(tmp_path / 'models'), import_file, num_iterations=20, mallet_path=STUB_MALLET)
+    mallet.import_models()
+    mallet.train_models(reporter='silent')
+    return mallet
+
+def subdir(mallet, num_topics):
+    return mallet.model_dir + '/topics' + str(num_topics)
+
+def test_inferred_documents_are_saved_separately(mallet, tmp_path):
+    new_file = str(tmp_path / 'new.txt.gz')
+    with gzip.open(new_file, 'wt') as f:
+        f.write('a.json 0 first document\nc.json 2 third document\nd.json 3 fourth document\n')
+    assert mallet.infer_models(new_file, reporter='silent')
+    for num_topics in [5, 10]:
+        assert read_rows(subdir(mallet, num_topics) + '/composition%d.txt' % num_topics) == [['0', 'a.json'], ['1', 'b.json']]
+        assert read_rows(subdir(mallet, num_topics) + '/inferred%d.txt' % num_topics) == [['2', 'c.json'], ['3', 'd.json']]
+    # Documents which have already been inferred are skipped
+    with open(str(tmp_path / 'newer.txt'), 'w') as f:
+        f.write('c.json 2 third document\ne.json 4 fifth document\n')
+    assert mallet.infer(5, str(tmp_path / 'newer.txt'), reporter='silent')
+    assert read_rows(subdir(mallet, 5) + '/inferred5.txt') == [['2', 'c.json'], ['3', 'd.json'], ['4', 'e.json']]
+    # No temporary files are left in the model directory
+    assert [file for file in os.listdir(mallet.model_dir) if file.startswith('_infer')] == []
+
+def test_inferred_documents_are_moved_aside_when_training_again(mallet, tmp_path):
+    with open(str(tmp_path / 'new.txt'), 'w') as f:
+        f.write('c.json 2 third document\n')
+    mallet.infer(5, str(tmp_path / 'new.txt'), reporter='silent')
+    assert mallet.continue_training(5, 10, reporter='silent')
+    assert not os.path.exists(subdir(mallet, 5) + '/inferred5.txt')
+    assert read_rows(subdir(mallet, 5) + '/previous1/inferred5.txt') == [['2', 'c.json']]
+    mallet.infer(5, str(tmp_path / 'new.txt'), reporter='silent')
+    mallet.train('5', reporter='silent')
+    assert not os.path.exists(subdir(mallet, 5) + '/inferred5.txt')
+    assert read_rows(subdir(mallet, 5) + '/previous2/inferred5.txt') == [['2', 'c.json']]
+
+def test_missing_inferencer_is_reported(mallet, tmp_path):
+    os.remove(subdir(mallet, 10) + '/inferencer10.mallet')
+    with open(str(tmp_path / 'new.txt'), 'w') as f:
+        f.write('c.json 2 third document\n')
+    assert not mallet.infer_models(str(tmp_path / 'new.txt'), reporter='silent')
+    assert not os.path.exists(subdir(mallet, 5) + '/inferred5.txt')
+
+def test_composition_includes_inferred_documents(mallet, tmp_path):
+    with open(str(tmp_path / 'new.txt'), 'w') as f:
+        f.write('c.json 2 third document\n')
+    mallet.infer(5, str(tmp_path / 'new.txt'), reporter='silent')
+    composition = mallet.get_composition(5)
+    assert [(row['doc'], row['name'], row['inferred']) for row in composition] == [
+        (0, 'a.json', False), (1, 'b.json', False), (2, 'c.json', True)]
+    assert composition[2]['topics'] == [0.5, 0.5]
+    assert [row['name'] for row in mallet.get_composition(5, include_inferred=False)] == ['a.json', 'b.json']
+    assert [row['name'] for row in mallet.get_composition(10)] == ['a.json', 'b.json']
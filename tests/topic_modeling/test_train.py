@@ -0,0 +1,52 @@
+"""Tests for `Mallet.train()` and `Mallet.train_models()`, run with a stub `mallet` executable."""
+
+# Python imports
+import os
+import sys
+import pytest
+
+pytest.importorskip('IPython')
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'topic_modeling', 'scripts'))
+from mallet import Mallet
+from progress import SilentReporter
+
+STUB_MALLET = os.path.join(TESTS_DIR, 'stub_mallet.py')
+
+class RecordingReporter(SilentReporter):
+    """Record the messages."""
+
+    def __init__(self):
+        super().__init__(interval=0)
+        self.messages = []
+
+    def message(self, msg, color='', size=None):
+        self.messages.append((msg, color))
+
+def make_mallet(tmp_path, models, mallet_path=STUB_MALLET):
+    return Mallet(models, str(tmp_path / 'models'), str(tmp_path / 'import.txt'), num_iterations=100,
+                  mallet_path=mallet_path, reporter='silent')
+
+def test_failed_training_raises(tmp_path, monkeypatch):
+    monkeypatch.setenv('STUB_MALLET_EXIT_CODES', '5:1')
+    with pytest.raises(RuntimeError, match='exited with code 1'):
+        make_mallet(tmp_path, [5]).train('5', reporter='silent')
+
+def test_failed_models_are_reported(tmp_path, monkeypatch):
+    monkeypatch.setenv('STUB_MALLET_EXIT_CODES', '10:1')
+    reporter = RecordingReporter()
+    make_mallet(tmp_path, [5, 10]).train_models(reporter=reporter)
+    assert ('Training of topics5 complete.', '') in reporter.messages
+    assert ('Training of topics10 complete.', '') not in reporter.messages
+    assert ('Error! Training failed for topics10. MALLET exited with code 1.', 'red') in reporter.messages
+
+@pytest.mark.parametrize('cores', [1, 2])
+def test_missing_mallet_is_reported(tmp_path, cores):
+    reporter = RecordingReporter()
+    mallet = make_mallet(tmp_path, [5, 10], mallet_path=str(tmp_path / 'missing' / 'mallet'))
+    mallet.train_models(reporter=reporter, cores=cores)
+    errors = [msg for msg, color in reporter.messages if color == 'red']
+    assert len(errors) >= 2
+    assert any('could not be started' in msg for msg in errors)
+    assert not any(msg.startswith('Training of topics') for msg, color in reporter.messages)
@@ -0,0 +1,73 @@
+"""Tests for `Mallet.train_parallel()`, run with a stub `mallet` executable."""
+
+# Python imports
+import os
+import sys
+import pytest
+
+pytest.importorskip('IPython')
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', '..', 'src', 'templates', 'v0.1.9',
+                                'modules', 'topic_modeling', 'scripts'))
+from mallet import Mallet
+from progress import SilentReporter
+
+STUB_MALLET = os.path.join(TESTS_DIR, 'stub_mallet.py')
+
+class RecordingReporter(SilentReporter):
+    """Record the messages."""
+
+    def __init__(self):
+        super().__init__(interval=0)
+        self.messages = []
+
+    def message(self, msg, color='', size=None):
+        self.messages.append((msg, color))
+
+@pytest.fixture
+def train(tmp_path, monkeypatch):
+    """Return a function which trains models with the stub and returns the failures, reporter and calls.
+
+    The calls are (num_topics, num_threads) tuples in the order in which the models were started.
+    """
+    log = str(tmp_path / 'calls.txt')
+    monkeypatch.setenv('STUB_MALLET_LOG', log)
+    def train(models, cores, exit_codes=''):
+        monkeypatch.setenv('STUB_MALLET_EXIT_CODES', exit_codes)
+        model_dir = str(tmp_path / 'models')
+        mallet = Mallet(models, model_dir, str(tmp_path / 'import.txt'), num_iterations=100,
+                        mallet_path=STUB_MALLET)
+        calls = []
+        get_train_command = mallet.get_train_command
+        def recording_get_train_command(num_topics, num_threads=None, **kwargs):
+            calls.append((int(num_topics), num_threads))
+            return get_train_command(num_topics, num_threads, **kwargs)
+        mallet.get_train_command = recording_get_train_command
+        reporter = RecordingReporter()
+        failed = mallet.train_parallel(models, cores, reporter=reporter)
+        # Every model was run by the stub with the number of threads it was given
+        with open(log) as f:
+            assert sorted(tuple(int(value) for value in line.split()) for line in f) == sorted(calls)
+        return failed, reporter, calls
+    return train
+
+def test_largest_models_start_first_with_spare_cores(train):
+    failed, reporter, calls = train([5, 20, 10], cores=4)
+    assert failed == []
+    # The first three models share 4 cores, and the largest gets the spare core
+    assert calls == [(20, 2), (10, 1), (5, 1)]
+    assert reporter.value == 100
+
+def test_cores_are_reused_when_a_model_finishes(train):
+    failed, reporter, calls = train([5, 10, 20], cores=2)
+    assert [num_topics for num_topics, _ in calls] == [20, 10, 5]
+    assert all(num_threads == 1 for _, num_threads in calls)
+    assert failed == []
+
+def test_failed_models_are_reported(train):
+    failed, reporter, calls = train([5, 10, 20], cores=3, exit_codes='10:1')
+    assert failed == ['10']
+    assert ('Error! Training failed for topics10.', 'red') in reporter.messages
+    assert ('Training of 2 model(s) complete.', '') in reporter.messages
+    # The combined progress still reaches 100% when a model fails
+    assert reporter.value == 100